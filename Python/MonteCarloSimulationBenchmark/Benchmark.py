@@ -0,0 +1,409 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from scipy.stats import t
+
+# The simulations and the modules shared by all simulations are in the sibling directories.
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("MonteCarloSimulationCommon", "MonteCarloSimulationPi", "MonteCarloSimulationIntegration",
+                  "MonteCarloSimulationFinance"):
+    sys.path.append(os.path.join(PYTHON_DIRECTORY, directory))
+from MonteCarloSimulationFinance import MODELS, MonteCarloSimulationFinance
+from MonteCarloSimulationIntegration import MonteCarloSimulationIntegration
+from MonteCarloSimulationPi import MonteCarloSimulationPi
+from ResultCache import result_cache
+from ScalingAnalysis import ScalingAnalysis, print_analysis
+from WorkerPool import BACKENDS, shutdown_worker_pool
+
+SIMULATIONS = ("Pi", "Integration", "Finance")
+
+# Number of simulations per benchmark: (strong scaling, weak scaling per process), the weak scaling runs
+# number of processes times as many simulations. A finance simulation is one path of prediction_window_size days.
+NUMBER_OF_SIMULATIONS = {"Pi": (500000, 5000000), "Integration": (500000, 5000000), "Finance": (10, 10)}
+
+# Directory of the scaling results read by the Pharo visualizations.
+SCALING_RESULTS_DIRECTORY = os.path.join(os.path.dirname(PYTHON_DIRECTORY), "Scaling Results")
+
+
+# Hash of the Python sources of the benchmark, the shared modules and the simulation, part of the key of the cached
+# measurements, so a change of a kernel or of the scheduler measures again instead of reusing old timings.
+def calculate_source_hash(simulation_name):
+    source_hash = hashlib.sha256()
+    for directory in ("MonteCarloSimulationBenchmark", "MonteCarloSimulationCommon",
+                      "MonteCarloSimulation" + simulation_name):
+        directory = os.path.join(PYTHON_DIRECTORY, directory)
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(".py"):
+                source_hash.update(file_name.encode("utf-8"))
+                with open(os.path.join(directory, file_name), "rb") as in_file:
+                    source_hash.update(in_file.read())
+    return source_hash.hexdigest()
+
+
+# Median, mean, sample standard deviation and the confidence interval of the mean (Student's t distribution)
+# of the execution times of the trials.
+def summarize_execution_times(execution_times, confidence_level=0.95):
+    execution_times = np.asarray(execution_times, dtype=float)
+    mean = float(execution_times.mean())
+    if execution_times.shape[0] < 2:
+        return {"median": float(np.median(execution_times)), "mean": mean, "standard_deviation": 0.0,
+                "confidence_interval_lower": mean, "confidence_interval_upper": mean}
+    standard_deviation = float(execution_times.std(ddof=1))
+    half_width = float(t.ppf(0.5 + confidence_level / 2, execution_times.shape[0] - 1)
+                       * standard_deviation / np.sqrt(execution_times.shape[0]))
+    return {"median": float(np.median(execution_times)), "mean": mean, "standard_deviation": standard_deviation,
+            "confidence_interval_lower": mean - half_width, "confidence_interval_upper": mean + half_width}
+
+
+# "2-13" is 2, 3, ..., 13 and "1,2,4,8" is 1, 2, 4, 8.
+def parse_process_range(text):
+    numbers_of_processes = []
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            numbers_of_processes.extend(range(int(first), int(last) + 1))
+        else:
+            numbers_of_processes.append(int(part))
+    if not numbers_of_processes or min(numbers_of_processes) < 1:
+        raise ValueError("the numbers of processes must be at least 1, got {}".format(text))
+    return numbers_of_processes
+
+
+# Strong and weak scaling benchmark of one simulation.
+# Every measurement runs warmup untimed runs and then trials timed runs of the same configuration.
+# The execution time of a run is measured with time.perf_counter around the mcs_* call. The worker pool is
+# started (and its startup time recorded) before the runs of a parallel configuration, so the execution time
+# is the compute time of a warm pool. The compute time is the sum of the execution times of the chunks
+# in the worker processes, see Instrumentation. The io time is the time of reading the market data of Finance.
+# The theoretical maximum speedup is the speedup of Amdahl's (strong scaling) or Gustafson's (weak scaling) law
+# with the serial fraction fitted to the achieved speedups, see ScalingAnalysis.
+# With cache_flag (--cache, off by default) the measurements are kept in the result cache (see ResultCache),
+# a configuration already measured with the same sources in the same environment, by an earlier sweep or an
+# interrupted one, is read instead of run again. Reused measurements are marked as cached in the trials, the
+# summaries and the printed results.
+# The results are written to output_directory/<simulation>:
+# The parallel runs use the execution backend backend (see WorkerPool), the names of the files of the thread and
+# the serial backend end with the backend, for example PythonPiStrongScalingThread.csv.
+#   Python<simulation><Strong|Weak>Scaling.csv        number_of_processes,achieved_speedup,theoretical_maximum_speedup
+#                                                     as read by the Pharo visualizations,
+#   Python<simulation><Strong|Weak>ScalingTrials.csv  one line per timed run,
+#   Python<simulation><Strong|Weak>Scaling.json       configuration, environment, summary per number of processes
+#                                                     and scaling analysis.
+class Benchmark:
+    def __init__(self, simulation_name, numbers_of_processes=range(2, 14), trials=5, warmup=1,
+                 output_directory=SCALING_RESULTS_DIRECTORY):
+        if simulation_name not in SIMULATIONS:
+            raise ValueError("unknown simulation {}, expected one of {}".format(simulation_name, SIMULATIONS))
+        if trials < 1 or warmup < 0:
+            raise ValueError("at least one trial and no negative number of warmup runs are needed")
+        self.simulation_name = simulation_name
+        self.numbers_of_processes = list(numbers_of_processes)
+        self.trials = trials
+        self.warmup = warmup
+        self.output_directory = output_directory
+        self.confidence_level = 0.95
+        self.strong_scaling_number_of_simulations, self.weak_scaling_number_of_simulations = \
+            NUMBER_OF_SIMULATIONS[simulation_name]
+        # Settings of the simulations
+        self.vectorized_flag = False
+        self.backend = "process"
+        self.seed = None
+        # Finance: prediction window size, ticker, period and the optional local csv file of the market data.
+        self.prediction_window_size = 100
+        self.ticker = 'AAPL'
+        self.start_date = '1980-01-01'
+        self.end_date = '2019-12-31'
+        self.csv_path = None
+        # Finance: path model and block size of the bootstrap model, see MonteCarloSimulationFinance.
+        self.model = "gbm"
+        self.block_size = 1
+        # One dictionary per timed run of the last benchmark.
+        self.trial_results = []
+        # Time of reading the market data of the last created simulation.
+        self.io_time = 0.0
+        # Whether measurements are reused from the result cache, see measure. Off by default, so every run
+        # is a fresh measurement.
+        self.cache_flag = False
+        self.result_cache = result_cache
+
+    def create_simulation(self, number_of_processes):
+        self.io_time = 0.0
+        if self.simulation_name == "Pi":
+            simulation = MonteCarloSimulationPi(number_of_processes)
+        elif self.simulation_name == "Integration":
+            simulation = MonteCarloSimulationIntegration(number_of_processes)
+        else:
+            simulation = MonteCarloSimulationFinance(self.start_date, self.end_date, self.ticker, number_of_processes)
+            simulation.csv_path = self.csv_path
+            simulation.model = self.model
+            simulation.block_size = self.block_size
+            start_time = time.perf_counter()
+            simulation.data_acquisition()
+            self.io_time = time.perf_counter() - start_time
+            simulation.calculate_periodic_daily_return()
+        if self.simulation_name != "Finance":
+            simulation.experiment_flag = True
+        simulation.vectorized_flag = self.vectorized_flag
+        simulation.seed = self.seed
+        simulation.backend = self.backend
+        return simulation
+
+    def run_simulation(self, simulation, number_of_simulations, parallel):
+        if self.simulation_name == "Pi":
+            if parallel:
+                return simulation.mcs_pi_parallel(number_of_simulations)
+            return simulation.mcs_pi_serial(number_of_simulations)
+        if self.simulation_name == "Integration":
+            if parallel:
+                return simulation.mcs_integration_parallel(number_of_simulations)
+            return simulation.mcs_integration_serial(number_of_simulations)
+        if parallel:
+            return simulation.mcs_finance_parallel(number_of_simulations, self.prediction_window_size)
+        return simulation.mcs_finance_serial(number_of_simulations, self.prediction_window_size)
+
+    # Everything the timings of a measurement depend on, the key of the measurement in the result cache.
+    # A serial run does not depend on the number of processes or the backend, so the serial baseline of the strong
+    # scaling and the serial runs of the weak scaling with the same number of simulations are measured once.
+    def get_measurement_configuration(self, number_of_processes, number_of_simulations, parallel):
+        configuration = self.get_configuration()
+        del configuration["numbers_of_processes"], configuration["confidence_level"], configuration["cache_flag"]
+        configuration.update({"number_of_simulations": number_of_simulations, "parallel": parallel,
+                              "number_of_processes": number_of_processes if parallel else None,
+                              "environment": self.get_environment(),
+                              "source_hash": calculate_source_hash(self.simulation_name)})
+        if not parallel:
+            configuration["backend"] = None
+        if self.simulation_name == "Finance":
+            configuration.update({"ticker": self.ticker, "start_date": self.start_date, "end_date": self.end_date,
+                                  "csv_path": self.csv_path})
+        return configuration
+
+    # Returns the results of the timed runs of one configuration, with cache_flag from the result cache when
+    # the same configuration was measured before, see run_measurement.
+    def measure(self, scaling, number_of_processes, number_of_simulations, parallel):
+        if self.cache_flag == False:
+            trial_results = self.run_measurement(number_of_processes, number_of_simulations, parallel)
+            trial_results = [dict(trial_result, scaling=scaling, number_of_processes=number_of_processes)
+                             for trial_result in trial_results]
+            self.trial_results += trial_results
+            return trial_results
+        configuration = self.get_measurement_configuration(number_of_processes, number_of_simulations, parallel)
+        cached_trial_results = self.result_cache.get(configuration)
+        if cached_trial_results is None:
+            trial_results = self.result_cache.put(configuration, self.run_measurement(
+                number_of_processes, number_of_simulations, parallel))
+            cached = False
+        else:
+            trial_results = cached_trial_results
+            cached = True
+        trial_results = [dict(trial_result, scaling=scaling, number_of_processes=number_of_processes, cached=cached)
+                         for trial_result in trial_results]
+        self.trial_results += trial_results
+        return trial_results
+
+    # Runs warmup + trials runs of one configuration, returns the results of the timed runs.
+    def run_measurement(self, number_of_processes, number_of_simulations, parallel):
+        simulation = self.create_simulation(number_of_processes)
+        # Starting the worker pool includes spawning the processes and sending the worker context to them.
+        pool_startup_time = 0.0
+        if parallel:
+            start_time = time.perf_counter()
+            simulation.start_worker_pool()
+            pool_startup_time = time.perf_counter() - start_time
+        for _ in range(self.warmup):
+            self.run_simulation(simulation, number_of_simulations, parallel)
+        trial_results = []
+        for trial in range(self.trials):
+            start_time = time.perf_counter()
+            self.run_simulation(simulation, number_of_simulations, parallel)
+            execution_time = time.perf_counter() - start_time
+            trial_results.append({
+                "scaling": None, "parallel": parallel, "number_of_processes": number_of_processes,
+                "number_of_simulations": number_of_simulations, "trial": trial, "execution_time": execution_time,
+                "pool_startup_time": pool_startup_time if trial == 0 else 0.0, "io_time": self.io_time,
+                "compute_time": simulation.instrumentation.phase_times["compute"],
+                "dispatch_time": simulation.instrumentation.phase_times["dispatch"],
+                "transfer_time": simulation.instrumentation.phase_times["transfer"],
+                "reduction_time": simulation.instrumentation.phase_times["reduction"],
+                "throughput": simulation.instrumentation.calculate_throughput(),
+                "peak_resident_memory": simulation.instrumentation.peak_resident_memory,
+                "number_of_chunks": simulation.instrumentation.number_of_chunks, "cached": False})
+        return trial_results
+
+    def summarize(self, number_of_processes, number_of_simulations, serial_trial_results, parallel_trial_results):
+        serial_summary = summarize_execution_times([trial_result["execution_time"]
+                                                    for trial_result in serial_trial_results], self.confidence_level)
+        parallel_summary = summarize_execution_times([trial_result["execution_time"]
+                                                      for trial_result in parallel_trial_results],
+                                                     self.confidence_level)
+        return {"number_of_processes": number_of_processes, "number_of_simulations": number_of_simulations,
+                "serial": serial_summary, "parallel": parallel_summary,
+                "achieved_speedup": serial_summary["median"] / parallel_summary["median"],
+                "pool_startup_time": parallel_trial_results[0]["pool_startup_time"],
+                "compute_time": float(np.median([trial_result["compute_time"]
+                                                 for trial_result in parallel_trial_results])),
+                "io_time": parallel_trial_results[0]["io_time"],
+                "serial_cached": serial_trial_results[0]["cached"],
+                "parallel_cached": parallel_trial_results[0]["cached"]}
+
+    # Fits the serial fraction to the achieved speedups and sets the theoretical maximum speedups.
+    def analyze(self, scaling, summaries):
+        scaling_analysis = ScalingAnalysis(scaling, summaries)
+        for summary in summaries:
+            summary["theoretical_maximum_speedup"] = scaling_analysis.calculate_theoretical_speedup(
+                summary["number_of_processes"])
+        analysis = scaling_analysis.analyze()
+        print_analysis(analysis)
+        return analysis
+
+    # The serial baseline is measured once with the strong scaling number of simulations.
+    def strong_scaling(self):
+        print("Start strong scaling of the {} simulation:".format(self.simulation_name))
+        self.trial_results = []
+        number_of_simulations = self.strong_scaling_number_of_simulations
+        serial_trial_results = self.measure("strong", 1, number_of_simulations, False)
+        summaries = []
+        for number_of_processes in self.numbers_of_processes:
+            parallel_trial_results = self.measure("strong", number_of_processes, number_of_simulations, True)
+            summary = self.summarize(number_of_processes, number_of_simulations, serial_trial_results,
+                                     parallel_trial_results)
+            self.print_summary(summary)
+            summaries.append(summary)
+        return self.write_results("Strong", summaries, self.analyze("strong", summaries))
+
+    # Every number of processes N runs N times the weak scaling number of simulations, serially and in parallel.
+    def weak_scaling(self):
+        print("Start weak scaling of the {} simulation:".format(self.simulation_name))
+        self.trial_results = []
+        summaries = []
+        for number_of_processes in self.numbers_of_processes:
+            number_of_simulations = self.weak_scaling_number_of_simulations * number_of_processes
+            serial_trial_results = self.measure("weak", number_of_processes, number_of_simulations, False)
+            parallel_trial_results = self.measure("weak", number_of_processes, number_of_simulations, True)
+            summary = self.summarize(number_of_processes, number_of_simulations, serial_trial_results,
+                                     parallel_trial_results)
+            self.print_summary(summary)
+            summaries.append(summary)
+        return self.write_results("Weak", summaries, self.analyze("weak", summaries))
+
+    def print_summary(self, summary):
+        print("{} backend: ".format(self.backend), end="")
+        print("n = {}, p = {}: serial median {:.6f} s, parallel median {:.6f} s "
+              "(95% CI {:.6f} - {:.6f} s), achieved speedup {:.3f}".format(
+                summary["number_of_simulations"], summary["number_of_processes"], summary["serial"]["median"],
+                summary["parallel"]["median"], summary["parallel"]["confidence_interval_lower"],
+                summary["parallel"]["confidence_interval_upper"], summary["achieved_speedup"]), end="")
+        cached_runs = [run for run in ("serial", "parallel") if summary[run + "_cached"]]
+        if cached_runs:
+            print(", {} reused from the result cache".format(" and ".join(cached_runs)), end="")
+        print()
+
+    def get_environment(self):
+        return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                "processor": platform.processor(), "cpu_count": os.cpu_count()}
+
+    def get_configuration(self):
+        return {"simulation": self.simulation_name, "numbers_of_processes": self.numbers_of_processes,
+                "trials": self.trials, "warmup": self.warmup, "confidence_level": self.confidence_level,
+                "cache_flag": self.cache_flag,
+                "vectorized_flag": self.vectorized_flag, "backend": self.backend, "seed": self.seed,
+                "prediction_window_size": self.prediction_window_size if self.simulation_name == "Finance" else None,
+                "model": self.model if self.simulation_name == "Finance" else None,
+                "block_size": self.block_size if self.simulation_name == "Finance" else None}
+
+    # Returns the path of the summary csv file.
+    def write_results(self, scaling, summaries, analysis):
+        directory = os.path.join(self.output_directory, self.simulation_name)
+        os.makedirs(directory, exist_ok=True)
+        name = "Python{}{}Scaling".format(self.simulation_name, scaling)
+        if self.backend != "process":
+            name += self.backend.capitalize()
+        path = os.path.join(directory, name + ".csv")
+        with open(path, "w") as out_file:
+            out_file.write("number_of_processes,achieved_speedup,theoretical_maximum_speedup\n")
+            for summary in summaries:
+                out_file.write("{},{},{}\n".format(summary["number_of_processes"], summary["achieved_speedup"],
+                                                   summary["theoretical_maximum_speedup"]))
+        with open(os.path.join(directory, name + "Trials.csv"), "w", newline="") as out_file:
+            writer = csv.DictWriter(out_file, fieldnames=list(self.trial_results[0]))
+            writer.writeheader()
+            writer.writerows(self.trial_results)
+        with open(os.path.join(directory, name + ".json"), "w") as out_file:
+            json.dump({"scaling": scaling.lower(), "configuration": self.get_configuration(),
+                       "environment": self.get_environment(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": summaries, "analysis": analysis}, out_file, indent=2)
+        return path
+
+
+def parse_backends(text):
+    backends = text.split(",")
+    for backend in backends:
+        if backend not in BACKENDS:
+            raise ValueError("unknown backend {}, expected one of {}".format(backend, BACKENDS))
+    return backends
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Strong and weak scaling benchmark of the Monte Carlo simulations")
+    parser.add_argument("--simulation", choices=SIMULATIONS + ("all",), default="all")
+    parser.add_argument("--scaling", choices=("strong", "weak", "both"), default="both")
+    parser.add_argument("--processes", type=parse_process_range, default=list(range(2, 14)),
+                        help="numbers of processes, for example 2-13 or 1,2,4,8")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output-directory", default=SCALING_RESULTS_DIRECTORY)
+    parser.add_argument("--strong-simulations", type=int, default=None,
+                        help="number of simulations of the strong scaling")
+    parser.add_argument("--weak-simulations", type=int, default=None,
+                        help="number of simulations per process of the weak scaling")
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--backends", type=parse_backends, default=["process"],
+                        help="execution backends of the parallel runs to compare, for example process,thread")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--prediction-window-size", type=int, default=100)
+    parser.add_argument("--model", choices=MODELS, default="gbm", help="path model of the finance simulation")
+    parser.add_argument("--block-size", type=int, default=1,
+                        help="number of consecutive historical days per block of the bootstrap model")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse the measurements of earlier runs with the same sources and configuration")
+    parser.add_argument("--csv-path", default=None, help="local csv file of the finance market data")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(arguments)
+    if arguments.simulation == "all":
+        simulation_names = SIMULATIONS
+    else:
+        simulation_names = (arguments.simulation,)
+    for simulation_name in simulation_names:
+        benchmark = Benchmark(simulation_name, arguments.processes, arguments.trials, arguments.warmup,
+                              arguments.output_directory)
+        if arguments.strong_simulations is not None:
+            benchmark.strong_scaling_number_of_simulations = arguments.strong_simulations
+        if arguments.weak_simulations is not None:
+            benchmark.weak_scaling_number_of_simulations = arguments.weak_simulations
+        benchmark.vectorized_flag = arguments.vectorized
+        benchmark.seed = arguments.seed
+        benchmark.prediction_window_size = arguments.prediction_window_size
+        benchmark.csv_path = arguments.csv_path
+        benchmark.model = arguments.model
+        benchmark.block_size = arguments.block_size
+        benchmark.cache_flag = arguments.cache
+        for benchmark.backend in arguments.backends:
+            if arguments.scaling in ("strong", "both"):
+                print("Results: {}\n".format(benchmark.strong_scaling()))
+            if arguments.scaling in ("weak", "both"):
+                print("Results: {}\n".format(benchmark.weak_scaling()))
+    shutdown_worker_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import json
+import math
+import sys
+
+import numpy as np
+
+# https://www.kth.se/blogs/pdc/2018/11/scalability-strong-and-weak-scaling/
+
+# s + p = 1
+# complementary values
+# s is the serial fraction, the proportion of execution time spent on the part which cannot be parallelized,
+# p = 1 - s is the proportion of execution time spent on the part that can be parallelized.
+# Instead of assuming s = 0 and p = 1, the serial fraction is fitted to the measured speedups.
+
+# Parallel efficiency below which adding processes is considered not to pay off.
+EFFICIENCY_THRESHOLD = 0.5
+
+# Fraction of the parallel execution time above which an overhead is flagged as dominant.
+OVERHEAD_THRESHOLD = 0.25
+
+
+# Amdahl’s law and strong scaling
+# Amdahl’s law can be formulated as follows speedup = 1 / (s + p / N) where
+# s = serial_fraction, p = 1 - s and N = number_of_processes is the number of processors.
+def calculate_amdahl_speedup(number_of_processes, serial_fraction):
+    return 1.0 / (serial_fraction + (1.0 - serial_fraction) / number_of_processes)
+
+
+# Gustafson’s law and weak scaling
+# Gustafson’s law can be formulated as follows speedup = s + p × N where
+# s = serial_fraction, p = 1 - s and N = number_of_processes is the number of processors.
+def calculate_gustafson_speedup(number_of_processes, serial_fraction):
+    return serial_fraction + (1.0 - serial_fraction) * number_of_processes
+
+
+def calculate_efficiency(speedup, number_of_processes):
+    return speedup / number_of_processes
+
+
+# Karp–Flatt metric, the experimentally determined serial fraction e = (1 / S - 1 / N) / (1 - 1 / N)
+# of the speedup S on N processes. An e growing with N points at parallel overhead rather than at
+# a serial part of the program. It is not defined for one process.
+def calculate_karp_flatt_metric(speedup, number_of_processes):
+    if number_of_processes < 2:
+        return math.nan
+    return (1.0 / speedup - 1.0 / number_of_processes) / (1.0 - 1.0 / number_of_processes)
+
+
+# Least-squares fit of the serial fraction of Amdahl's law to the measured speedups. Amdahl's law is linear
+# in s after 1 / S - 1 / N = s (1 - 1 / N), the fit of this line through the origin is clipped to [0, 1].
+def fit_amdahl_serial_fraction(numbers_of_processes, speedups):
+    numbers_of_processes = np.asarray(numbers_of_processes, dtype=float)
+    speedups = np.asarray(speedups, dtype=float)
+    x = 1.0 - 1.0 / numbers_of_processes
+    y = 1.0 / speedups - 1.0 / numbers_of_processes
+    if not np.any(x > 0):
+        return math.nan
+    return float(np.clip(np.dot(x, y) / np.dot(x, x), 0.0, 1.0))
+
+
+# Least-squares fit of the serial fraction of Gustafson's law to the measured scaled speedups,
+# N - S = s (N - 1), clipped to [0, 1].
+def fit_gustafson_serial_fraction(numbers_of_processes, speedups):
+    numbers_of_processes = np.asarray(numbers_of_processes, dtype=float)
+    speedups = np.asarray(speedups, dtype=float)
+    x = numbers_of_processes - 1.0
+    y = numbers_of_processes - speedups
+    if not np.any(x > 0):
+        return math.nan
+    return float(np.clip(np.dot(x, y) / np.dot(x, x), 0.0, 1.0))
+
+
+# Scaling analysis of the summaries of a strong ("strong") or weak ("weak") scaling benchmark, see Benchmark.
+# Every summary holds the number of processes, the achieved speedup and the median times of the parallel runs:
+# "parallel": {"median": execution time}, "pool_startup_time", "compute_time" (sum of the execution times of
+# the chunks in the worker processes) and "io_time" (reading the input data).
+# The serial fraction is fitted with Amdahl's law for strong scaling and with Gustafson's law for weak scaling.
+# The overheads of a number of processes are flagged when they take more than overhead_threshold of the
+# parallel execution time:
+#   pool_creation  starting the worker processes and sending them the worker context,
+#   communication  the part of the execution time not spent computing chunks, that is pickling and
+#                  dispatching the tasks, transferring the results and the reduction,
+#   io             reading the input data.
+class ScalingAnalysis:
+    def __init__(self, scaling, summaries, efficiency_threshold=EFFICIENCY_THRESHOLD,
+                 overhead_threshold=OVERHEAD_THRESHOLD):
+        if scaling not in ("strong", "weak"):
+            raise ValueError("unknown scaling {}, expected strong or weak".format(scaling))
+        if not summaries:
+            raise ValueError("the scaling analysis needs at least one summary")
+        self.scaling = scaling
+        self.summaries = sorted(summaries, key=lambda summary: summary["number_of_processes"])
+        self.efficiency_threshold = efficiency_threshold
+        self.overhead_threshold = overhead_threshold
+        self.numbers_of_processes = [summary["number_of_processes"] for summary in self.summaries]
+        self.speedups = [summary["achieved_speedup"] for summary in self.summaries]
+        if scaling == "strong":
+            self.serial_fraction = fit_amdahl_serial_fraction(self.numbers_of_processes, self.speedups)
+        else:
+            self.serial_fraction = fit_gustafson_serial_fraction(self.numbers_of_processes, self.speedups)
+
+    # Speedup predicted by the fitted serial fraction, the speedup of a program without a serial part
+    # while the serial fraction cannot be fitted (only one process).
+    def calculate_theoretical_speedup(self, number_of_processes):
+        serial_fraction = 0.0 if math.isnan(self.serial_fraction) else self.serial_fraction
+        if self.scaling == "strong":
+            return calculate_amdahl_speedup(number_of_processes, serial_fraction)
+        return calculate_gustafson_speedup(number_of_processes, serial_fraction)
+
+    # Upper bound 1 / s of the strong scaling speedup for any number of processes.
+    def calculate_maximum_speedup(self):
+        if self.scaling == "weak" or math.isnan(self.serial_fraction) or self.serial_fraction == 0:
+            return math.inf
+        return 1.0 / self.serial_fraction
+
+    def find_overheads(self, summary):
+        execution_time = summary["parallel"]["median"]
+        number_of_processes = summary["number_of_processes"]
+        overheads = {"pool_creation": summary.get("pool_startup_time", 0.0),
+                     "communication": max(0.0, execution_time
+                                          - summary.get("compute_time", 0.0) / number_of_processes),
+                     "io": summary.get("io_time", 0.0)}
+        if "compute_time" not in summary:
+            del overheads["communication"]
+        fractions = {}
+        for name, overhead_time in overheads.items():
+            fractions[name] = overhead_time / execution_time if execution_time > 0 else math.inf
+        flags = sorted(name for name, fraction in fractions.items() if fraction > self.overhead_threshold)
+        return fractions, flags
+
+    def analyze(self):
+        rows = []
+        for summary, speedup in zip(self.summaries, self.speedups):
+            number_of_processes = summary["number_of_processes"]
+            overhead_fractions, overhead_flags = self.find_overheads(summary)
+            rows.append({"number_of_processes": number_of_processes, "achieved_speedup": speedup,
+                         "theoretical_speedup": self.calculate_theoretical_speedup(number_of_processes),
+                         "efficiency": calculate_efficiency(speedup, number_of_processes),
+                         "karp_flatt_metric": calculate_karp_flatt_metric(speedup, number_of_processes),
+                         "overhead_fractions": overhead_fractions, "overhead_flags": overhead_flags})
+        # Adding processes pays off up to the number of processes with the highest speedup,
+        # and efficiently while the parallel efficiency stays above the threshold.
+        best_row = max(rows, key=lambda row: row["achieved_speedup"])
+        efficient_rows = [row for row in rows if row["efficiency"] >= self.efficiency_threshold]
+        return {"scaling": self.scaling, "serial_fraction": self.serial_fraction,
+                "parallel_fraction": 1.0 - self.serial_fraction, "maximum_speedup": self.calculate_maximum_speedup(),
+                "best_number_of_processes": best_row["number_of_processes"],
+                "last_efficient_number_of_processes":
+                    efficient_rows[-1]["number_of_processes"] if efficient_rows else None,
+                "efficiency_threshold": self.efficiency_threshold, "overhead_threshold": self.overhead_threshold,
+                "results": rows}
+
+
+def print_analysis(analysis):
+    print("{} scaling: fitted serial fraction s = {:.4f}, parallel fraction p = {:.4f}, maximum speedup {:.3f}".format(
+        analysis["scaling"], analysis["serial_fraction"], analysis["parallel_fraction"], analysis["maximum_speedup"]))
+    for row in analysis["results"]:
+        print("p = {}: speedup {:.3f} (theoretical {:.3f}), efficiency {:.3f}, Karp-Flatt metric {:.4f}{}".format(
+            row["number_of_processes"], row["achieved_speedup"], row["theoretical_speedup"], row["efficiency"],
+            row["karp_flatt_metric"],
+            ", dominant overheads: " + ", ".join(row["overhead_flags"]) if row["overhead_flags"] else ""))
+    print("Highest speedup with {} processes".format(analysis["best_number_of_processes"]))
+    if analysis["last_efficient_number_of_processes"] is None:
+        print("Efficiency below {} for every number of processes".format(analysis["efficiency_threshold"]))
+    else:
+        print("Efficiency at least {} up to {} processes".format(analysis["efficiency_threshold"],
+                                                                 analysis["last_efficient_number_of_processes"]))
+
+
+# Analyzes the json files written by Benchmark, for example
+# python ScalingAnalysis.py "../../Scaling Results/Pi/PythonPiStrongScaling.json"
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        with open(path) as in_file:
+            benchmark_results = json.load(in_file)
+        print(path)
+        print_analysis(ScalingAnalysis(benchmark_results["scaling"], benchmark_results["results"]).analyze())
+        print()
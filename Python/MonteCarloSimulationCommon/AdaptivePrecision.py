@@ -0,0 +1,61 @@
+from scipy.stats import norm
+
+from ChunkScheduler import split_into_chunk_sizes
+from RunningStatistics import RunningStatistics
+
+
+# Adaptive precision mode: instead of a fixed number of simulations, the simulations run in rounds until
+# the half width of the confidence interval of the estimate is at most the tolerance.
+# Every round is split into chunks of chunk_size simulations, chunk i gets the i-th random stream
+# (counting over all rounds) and returns the RunningStatistics of its samples. The statistics are merged
+# in chunk order after every round, so a seeded run stops after the same round and returns the same
+# estimate for any number of processes. The round size must therefore not depend on the number of processes.
+class AdaptivePrecision:
+    def __init__(self, tolerance, confidence_level=0.95, round_size=100000,
+                 maximum_number_of_simulations=100000000):
+        if tolerance <= 0:
+            raise ValueError("tolerance must be positive, got {}".format(tolerance))
+        if not 0 < confidence_level < 1:
+            raise ValueError("confidence level must be between 0 and 1, got {}".format(confidence_level))
+        if round_size < 2:
+            raise ValueError("round size must be at least 2, got {}".format(round_size))
+        self.tolerance = tolerance
+        self.confidence_level = confidence_level
+        self.round_size = round_size
+        self.maximum_number_of_simulations = maximum_number_of_simulations
+        # Two-sided critical value of the standard normal distribution, 1.96 for a confidence level of 0.95.
+        self.critical_value = norm.ppf(0.5 + confidence_level / 2)
+        # Statistics of all samples of the last run.
+        self.statistics = RunningStatistics()
+        # Number of rounds and number of simulations of the last run. A sample of an estimator can take
+        # several simulations, so the number of simulations is counted separately from the samples.
+        self.number_of_rounds = 0
+        self.number_of_simulations = 0
+
+    def calculate_half_width(self, statistics):
+        return self.critical_value * statistics.calculate_standard_error()
+
+    def is_precise(self, statistics):
+        return statistics.count >= 2 and self.calculate_half_width(statistics) <= self.tolerance
+
+    # run_round takes a list of (number of simulations, seed sequence, chunk index) chunks and returns the
+    # list of RunningStatistics of the chunks.
+    def run(self, run_round, random_streams, chunk_size):
+        self.statistics = RunningStatistics()
+        self.number_of_rounds = 0
+        self.number_of_simulations = 0
+        chunk_index = 0
+        while self.number_of_simulations < self.maximum_number_of_simulations:
+            round_size = min(self.round_size, self.maximum_number_of_simulations - self.number_of_simulations)
+            chunks = []
+            for number_of_simulations_per_chunk in split_into_chunk_sizes(round_size, chunk_size):
+                chunks.append((number_of_simulations_per_chunk, random_streams.get_seed_sequence(chunk_index),
+                               chunk_index))
+                chunk_index += 1
+            for statistics_of_chunk in run_round(chunks):
+                self.statistics.merge(statistics_of_chunk)
+            self.number_of_rounds += 1
+            self.number_of_simulations += round_size
+            if self.is_precise(self.statistics):
+                break
+        return self.statistics
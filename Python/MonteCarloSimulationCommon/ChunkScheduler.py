@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+from Instrumentation import get_peak_resident_memory
+
+
+# Runs one chunk in a worker process and measures how long it took.
+# Also returns the start and end time of the chunk, the peak resident memory of the worker process and
+# the name of the thread which ran the chunk (the thread backend runs the chunks in threads), see Instrumentation.
+def run_timed_chunk(arguments):
+    index, function, task = arguments
+    start_time = time.perf_counter()
+    result = function(*task)
+    end_time = time.perf_counter()
+    return index, result, end_time - start_time, os.getpid(), start_time, end_time, get_peak_resident_memory(), \
+        threading.current_thread().name
+
+
+# Dynamic scheduler for chunks of simulations.
+# Every task is one chunk, the first argument of a task is its number of simulations.
+# The chunks are handed out one at a time with imap_unordered, a process that finishes its chunk early
+# takes the next one, so busy or slow processes do not hold back the whole simulation.
+# The results are returned in the order of the tasks, whatever the order in which the chunks finished.
+# Without a worker pool the chunks run one after another in the calling process.
+class ChunkScheduler:
+    def __init__(self, worker_pool=None):
+        self.worker_pool = worker_pool
+        # (chunk index, number of simulations, execution time in seconds, process id) per chunk of the last run
+        self.chunk_times = []
+        # (start time, end time, time the result was received, thread name) per chunk of the last run,
+        # the times come from time.perf_counter
+        self.chunk_timestamps = []
+        # time.perf_counter when the chunks of the last run were submitted
+        self.submit_time = 0.0
+        # Peak resident memory in bytes per process id of the last run
+        self.worker_peak_resident_memory = {}
+        # Number of simulations of all chunks of the last run
+        self.number_of_simulations = 0
+
+    def run(self, function, tasks):
+        tasks = list(tasks)
+        arguments = [(index, function, task) for index, task in enumerate(tasks)]
+        self.submit_time = time.perf_counter()
+        if self.worker_pool is None:
+            finished_chunks = map(run_timed_chunk, arguments)
+        else:
+            finished_chunks = self.worker_pool.imap_unordered(run_timed_chunk, arguments)
+        results = [None] * len(tasks)
+        self.chunk_times = [None] * len(tasks)
+        self.chunk_timestamps = [None] * len(tasks)
+        self.worker_peak_resident_memory = {}
+        for index, result, execution_time, process_id, start_time, end_time, peak_resident_memory, thread_name \
+                in finished_chunks:
+            results[index] = result
+            self.chunk_times[index] = (index, tasks[index][0], execution_time, process_id)
+            self.chunk_timestamps[index] = (start_time, end_time, time.perf_counter(), thread_name)
+            self.worker_peak_resident_memory[process_id] = peak_resident_memory
+        self.number_of_simulations = sum(task[0] for task in tasks)
+        return results
+
+
+# Splits number_of_simulations into chunks of chunk_size simulations, only the last chunk can be smaller.
+# Every simulation belongs to exactly one chunk, nothing is dropped when the number of simulations
+# is not divisible by the number of processes or by the chunk size.
+def split_into_chunk_sizes(number_of_simulations, chunk_size):
+    if chunk_size < 1:
+        raise ValueError("chunk size must be at least 1, got {}".format(chunk_size))
+    full_chunks, remainder = divmod(number_of_simulations, chunk_size)
+    return full_chunks * [chunk_size] + ([remainder] if remainder > 0 else [])
@@ -0,0 +1,191 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows, the peak resident memory is not reported there.
+    resource = None
+
+# Phases of a simulation:
+#   pool_startup  starting the worker processes and sending them the worker context, see WorkerPool,
+#   dispatch      time the workers waited for their next chunk (pickling and sending the task),
+#   compute       running the chunks in the workers,
+#   transfer      time from the end of a chunk in its worker until its result arrived in this process
+#                 (pickling, sending and unpickling the result),
+#   reduction     combining the results of the chunks,
+#   io            reading and writing files (traces).
+# dispatch, compute and transfer are summed over the chunks, they are worker seconds rather than wall-clock time.
+PHASES = ("pool_startup", "dispatch", "compute", "transfer", "reduction", "io")
+
+# Number of functions of the cProfile statistics kept in the exported summary.
+NUMBER_OF_PROFILE_FUNCTIONS = 30
+
+
+# Peak resident memory of this process in bytes, None where the resource module is not available.
+def get_peak_resident_memory():
+    if resource is None:
+        return None
+    peak_resident_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == "darwin":
+        return peak_resident_memory
+    return peak_resident_memory * 1024
+
+
+# The processes of the process backend run the chunks in their main thread, a process is one worker.
+def get_worker_name(process_id, thread_name):
+    if thread_name == "MainThread":
+        return str(process_id)
+    return "{}/{}".format(process_id, thread_name)
+
+
+# Measures the execution time of a mcs_* method with time.perf_counter and returns (result, execution time).
+# The run is recorded in the instrumentation of the simulation, see Instrumentation.
+def calculate_execution_time(function):
+    def calculate_duration(simulation, *args, **kwargs):
+        instrumentation = simulation.instrumentation
+        instrumentation.start(function.__name__)
+        start_time = time.perf_counter()
+        try:
+            executing_function = function(simulation, *args, **kwargs)
+        finally:
+            execution_time = time.perf_counter() - start_time
+            instrumentation.stop(execution_time)
+        return executing_function, round(execution_time, 7)
+    return calculate_duration
+
+
+# Instrumentation of the last run of a simulation: the time of every phase, the chunks, compute time,
+# dispatch and transfer time of every worker process, the throughput in simulations per second and the peak memory.
+# The timestamps of the chunks come from time.perf_counter in the worker processes, which is a system-wide
+# monotonic clock on Linux, macOS and Windows, so they compare with the timestamps of this process.
+# Opt-in hooks:
+#   profile_flag  runs cProfile in this process during the run, see export_profile,
+#   memory_flag   traces the Python allocations of this process with tracemalloc and reports their peak.
+class Instrumentation:
+    def __init__(self):
+        self.profile_flag = False
+        self.memory_flag = False
+        # Whether the last run started tracemalloc, it is left alone when it was already tracing.
+        self.tracing_memory = False
+        self.clear()
+
+    def clear(self):
+        # Name of the method of the last run.
+        self.name = None
+        self.execution_time = 0.0
+        self.number_of_simulations = 0
+        self.number_of_chunks = 0
+        # Seconds per phase, see PHASES.
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        # Per worker, the process id or "process id/thread name" of the threads of the thread backend:
+        # number of chunks, number of simulations, compute, dispatch and transfer time and the peak resident
+        # memory of the worker process.
+        self.worker_times = {}
+        # Peak of the Python allocations traced by tracemalloc (memory_flag) and peak resident memory, in bytes.
+        self.peak_traced_memory = None
+        self.peak_resident_memory = None
+        self.profile = None
+
+    def start(self, name):
+        self.clear()
+        self.name = name
+        self.tracing_memory = self.memory_flag and not tracemalloc.is_tracing()
+        if self.tracing_memory:
+            tracemalloc.start()
+        if self.profile_flag:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self, execution_time):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.tracing_memory:
+            self.peak_traced_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.execution_time = execution_time
+        self.peak_resident_memory = get_peak_resident_memory()
+
+    def add_phase_time(self, name, seconds):
+        self.phase_times[name] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.perf_counter() - start_time)
+
+    # Records the chunks of a ChunkScheduler run. A worker waits for a chunk from the submission of the chunks,
+    # or from the end of its previous chunk, until the chunk starts.
+    def record_chunks(self, chunk_scheduler):
+        previous_end_times = {}
+        chunks = sorted(zip(chunk_scheduler.chunk_times, chunk_scheduler.chunk_timestamps),
+                        key=lambda chunk: chunk[1][0])
+        for (index, number_of_simulations, execution_time, process_id), \
+                (start_time, end_time, receive_time, thread_name) in chunks:
+            worker = get_worker_name(process_id, thread_name)
+            worker_times = self.worker_times.setdefault(worker, {
+                "process_id": process_id, "number_of_chunks": 0, "number_of_simulations": 0, "compute_time": 0.0,
+                "dispatch_time": 0.0, "transfer_time": 0.0, "peak_resident_memory": None})
+            dispatch_time = max(0.0, start_time - previous_end_times.get(worker, chunk_scheduler.submit_time))
+            transfer_time = max(0.0, receive_time - end_time)
+            previous_end_times[worker] = end_time
+            worker_times["number_of_chunks"] += 1
+            worker_times["number_of_simulations"] += number_of_simulations
+            worker_times["compute_time"] += execution_time
+            worker_times["dispatch_time"] += dispatch_time
+            worker_times["transfer_time"] += transfer_time
+            self.add_phase_time("compute", execution_time)
+            self.add_phase_time("dispatch", dispatch_time)
+            self.add_phase_time("transfer", transfer_time)
+        for worker_times in self.worker_times.values():
+            if worker_times["process_id"] in chunk_scheduler.worker_peak_resident_memory:
+                worker_times["peak_resident_memory"] = \
+                    chunk_scheduler.worker_peak_resident_memory[worker_times["process_id"]]
+        self.number_of_simulations += chunk_scheduler.number_of_simulations
+        self.number_of_chunks += len(chunk_scheduler.chunk_times)
+
+    # Simulations per second of the last run.
+    def calculate_throughput(self):
+        if self.execution_time <= 0:
+            return 0.0
+        return self.number_of_simulations / self.execution_time
+
+    # The functions with the highest cumulative time of the cProfile statistics.
+    def get_profile_summary(self, number_of_functions=NUMBER_OF_PROFILE_FUNCTIONS):
+        if self.profile is None:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(number_of_functions)
+        return stream.getvalue()
+
+    def to_dict(self):
+        return {"name": self.name, "execution_time": self.execution_time,
+                "number_of_simulations": self.number_of_simulations, "number_of_chunks": self.number_of_chunks,
+                "throughput": self.calculate_throughput(), "phase_times": dict(self.phase_times),
+                "worker_times": {worker: dict(worker_times) for worker, worker_times in self.worker_times.items()},
+                "peak_traced_memory": self.peak_traced_memory, "peak_resident_memory": self.peak_resident_memory,
+                "profile": self.get_profile_summary()}
+
+    def export_json(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as out_file:
+            json.dump(self.to_dict(), out_file, indent=2)
+        return path
+
+    # Writes the cProfile statistics of the last run, they can be read with pstats or snakeviz.
+    def export_profile(self, path):
+        if self.profile is None:
+            raise ValueError("the last run was not profiled, set profile_flag before running the simulation")
+        self.profile.dump_stats(path)
+        return path
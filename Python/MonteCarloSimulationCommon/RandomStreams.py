@@ -0,0 +1,46 @@
+import random
+
+import numpy as np
+
+from ChunkScheduler import split_into_chunk_sizes
+
+
+# Independent random streams for parallel simulations.
+# The simulations are split into chunks of chunk_size simulations and every chunk gets its own random stream.
+# The streams are children of one master seed (NumPy SeedSequence spawning), so they are statistically
+# independent of each other, and the stream of chunk i depends only on the master seed and i.
+# The same seed therefore gives the same simulations whatever the number of processes.
+class RandomStreams:
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # When seed is None the entropy is taken from the operating system,
+        # passing it as the seed of a new RandomStreams repeats the run.
+        self.seed = self.seed_sequence.entropy
+
+    # Seed sequence of the i-th child stream, the same child SeedSequence.spawn would create.
+    def get_seed_sequence(self, index):
+        return np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(index,),
+                                      pool_size=self.seed_sequence.pool_size)
+
+    # Returns a list of (number of simulations, seed sequence) pairs, one pair per chunk.
+    def split(self, number_of_simulations, chunk_size):
+        return [(number_of_simulations_per_chunk, self.get_seed_sequence(index))
+                for index, number_of_simulations_per_chunk
+                in enumerate(split_into_chunk_sizes(number_of_simulations, chunk_size))]
+
+
+# NumPy generator for the vectorized kernels. Without a seed sequence the generator is seeded by the
+# operating system, the global NumPy state would be shared by forked worker processes.
+def create_generator(seed_sequence=None):
+    return np.random.default_rng(seed_sequence)
+
+
+# Python generator for the kernels which draw one number at a time. Like np.random.default_rng,
+# a generator is returned unaltered, so a kernel can continue the stream of its caller.
+def create_python_random(seed_sequence=None):
+    if isinstance(seed_sequence, random.Random):
+        return seed_sequence
+    if seed_sequence is None:
+        return random.Random()
+    state = seed_sequence.generate_state(4, np.uint64)
+    return random.Random(int.from_bytes(state.tobytes(), "little"))
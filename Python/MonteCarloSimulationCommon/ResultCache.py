@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+# Default maximum size of the result cache in bytes.
+MAXIMUM_SIZE = 256 * 1024 * 1024
+
+RESULT_SUFFIX = ".pickle"
+
+
+# JSON form of the values of a configuration JSON does not know. Arrays and pandas objects are replaced by
+# the hash of their data, functions by their name and the hash of their code, other objects by their attributes.
+# Raises ValueError for values without a stable form, such as lambdas and objects which only have their
+# address as text, two of those could give the same key for different runs.
+def describe_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return {"dtype": str(value.dtype), "shape": value.shape,
+                "data": hashlib.sha256(value.view(np.uint8) if value.dtype != object else
+                                       repr(value.tolist()).encode("utf-8")).hexdigest()}
+    if hasattr(value, "to_numpy") and hasattr(value, "index"):
+        return {"type": type(value).__name__, "values": describe_value(value.to_numpy()),
+                "index": describe_value(np.asarray(value.index))}
+    if hasattr(value, "__qualname__") or isinstance(value, np.ufunc):
+        name = getattr(value, "__qualname__", getattr(value, "__name__", ""))
+        if "<lambda>" in name or "<locals>" in name:
+            raise ValueError("{} has no stable name".format(name))
+        code = getattr(value, "__code__", None)
+        return {"function": "{}.{}".format(getattr(value, "__module__", None), name),
+                "code": None if code is None else hashlib.sha256(
+                    code.co_code + repr(code.co_names).encode("utf-8")).hexdigest()}
+    if hasattr(value, "to_dict"):
+        return {"type": type(value).__name__, "value": value.to_dict()}
+    if hasattr(value, "__dict__"):
+        return {"type": type(value).__name__, "attributes": vars(value)}
+    text = str(value)
+    if " at 0x" in text:
+        raise ValueError("{} has no stable form".format(text))
+    return text
+
+
+# Key of a run configuration: the SHA-256 hash of its JSON text with sorted keys. Values JSON does not know
+# (dates, NumPy values, functions) are written with describe_value, so equal configurations always give the
+# same key. Raises ValueError when the configuration has no stable key.
+def create_key(configuration):
+    text = json.dumps(configuration, sort_keys=True, default=describe_value)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Persistent cache of the results of simulation runs (estimates, summaries and timings), keyed by the hash
+# of the full run configuration, see create_key. A configuration should hold everything the result depends on:
+# the simulation, its parameters, the number of simulations, the seed and, for timings, the environment.
+# Every result is one pickle file, repeated or resumed parameter sweeps and nightly jobs read the results
+# of earlier runs instead of running them again.
+# The cache is bounded by maximum_size bytes: the least recently used results are evicted first, the
+# modification time of a result file is the time of its last use. Results are written to a temporary file
+# and renamed, so concurrent jobs never read a partly written result.
+class ResultCache:
+    def __init__(self, directory, maximum_size=MAXIMUM_SIZE):
+        if maximum_size < 0:
+            raise ValueError("maximum size must not be negative, got {}".format(maximum_size))
+        self.directory = directory
+        self.maximum_size = maximum_size
+        # Skips the lookups: every run is computed again and its result replaces the cached result.
+        self.bypass_flag = False
+        # Number of lookups which found a result and which did not since the cache was created.
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, configuration):
+        return os.path.join(self.directory, create_key(configuration) + RESULT_SUFFIX)
+
+    # Returns the cached result of configuration, default when there is none or bypass_flag is set.
+    def get(self, configuration, default=None):
+        if self.bypass_flag == True:
+            self.misses += 1
+            return default
+        path = self.get_path(configuration)
+        try:
+            with open(path, "rb") as in_file:
+                entry = pickle.load(in_file)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry["result"]
+
+    def put(self, configuration, result):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"configuration": configuration, "result": result, "time": time.time()}
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as out_file:
+                pickle.dump(entry, out_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self.get_path(configuration))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        self.evict()
+        return result
+
+    # Returns the cached result of configuration, or calls function(*arguments) and caches its result.
+    def get_or_compute(self, configuration, function, *arguments):
+        missing = object()
+        result = self.get(configuration, missing)
+        if result is missing:
+            result = self.put(configuration, function(*arguments))
+        return result
+
+    # (modification time, size, path) of every cached result, least recently used first.
+    def list_results(self):
+        if not os.path.isdir(self.directory):
+            return []
+        results = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(RESULT_SUFFIX):
+                path = os.path.join(self.directory, file_name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                results.append((status.st_mtime, status.st_size, path))
+        return sorted(results)
+
+    def calculate_size(self):
+        return sum(size for _, size, _ in self.list_results())
+
+    # Removes the least recently used results until the cache is not larger than maximum_size.
+    def evict(self):
+        results = self.list_results()
+        size = sum(result_size for _, result_size, _ in results)
+        for _, result_size, path in results:
+            if size <= self.maximum_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= result_size
+
+    def invalidate(self, configuration):
+        path = self.get_path(configuration)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def clear(self):
+        for _, _, path in self.list_results():
+            os.remove(path)
+
+
+# The cache shared by all simulations, in the Result Cache directory of the repository.
+result_cache = ResultCache(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Result Cache"))
+
+
+# Serves repeated identical runs of a mcs_* method from the result cache of the simulation. The configuration
+# of a run is the simulation class, the method, its arguments and the attributes of the simulation listed in
+# CACHE_ATTRIBUTES, the seed included. The result is cached with the attributes listed in CACHE_STATE_ATTRIBUTES
+# (the statistics behind the standard error, for example), a cached run restores them and sets cached_flag.
+# Only runs for which simulation.is_result_cacheable() holds are cached: cache_flag must be set and the seed must
+# not be None, a run with a fresh seed is never repeated. Runs whose configuration has no stable key
+# (a lambda integrand, for example) run without the cache.
+# Applied below calculate_execution_time, the execution time of a cached run is the time of the lookup.
+def cached_simulation(function):
+    def run_cached(simulation, *args, **kwargs):
+        simulation.cached_flag = False
+        if simulation.is_result_cacheable() == False:
+            return function(simulation, *args, **kwargs)
+        configuration = {"simulation": type(simulation).__name__, "method": function.__name__,
+                         "arguments": list(args), "keyword_arguments": kwargs,
+                         "attributes": {name: getattr(simulation, name) for name in simulation.CACHE_ATTRIBUTES}}
+        try:
+            create_key(configuration)
+        except (TypeError, ValueError):
+            return function(simulation, *args, **kwargs)
+        missing = object()
+        entry = simulation.result_cache.get(configuration, missing)
+        if entry is not missing:
+            for name, value in entry["state"].items():
+                setattr(simulation, name, value)
+            simulation.cached_flag = True
+            return entry["result"]
+        result = function(simulation, *args, **kwargs)
+        simulation.result_cache.put(configuration, {
+            "result": result, "state": {name: getattr(simulation, name) for name in simulation.CACHE_STATE_ATTRIBUTES}})
+        return result
+    run_cached.__name__ = function.__name__
+    return run_cached
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+
+
+# Running mean and variance of a stream of samples (Welford's algorithm).
+# The statistics of two disjoint sets of samples merge into the statistics of all samples
+# (the pairwise update of Chan, Golub and LeVeque), so every chunk keeps the statistics of its own samples
+# in its worker process and only the count, the mean and the sum of squared deviations are sent back.
+class RunningStatistics:
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        # Sum of squared deviations from the mean.
+        self.m2 = m2
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        return self
+
+    # Adds a batch of samples. The statistics of the batch are calculated with NumPy and merged.
+    def update_batch(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.size > 0:
+            mean = float(values.mean())
+            self.merge(RunningStatistics(int(values.size), mean, float(np.square(values - mean).sum())))
+        return self
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    # Sample variance, infinite while there are fewer than two samples.
+    def calculate_variance(self):
+        if self.count < 2:
+            return math.inf
+        return self.m2 / (self.count - 1)
+
+    def calculate_standard_deviation(self):
+        return math.sqrt(self.calculate_variance())
+
+    # Standard error of the mean.
+    def calculate_standard_error(self):
+        if self.count < 2:
+            return math.inf
+        return math.sqrt(self.calculate_variance() / self.count)
+
+    def __repr__(self):
+        return "RunningStatistics(count={}, mean={}, m2={})".format(self.count, self.mean, self.m2)
+
+
+# Statistics of count samples which all have the same value, their variance is 0.
+def create_constant_statistics(count, value):
+    return RunningStatistics(count, float(value), 0.0)
+
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+# Memory-backed file system of Linux, files in it never touch the disk.
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+
+
+# Handle of a NumPy array shared by the parent process and the worker processes.
+# The array is a memory-mapped file in shared memory (/dev/shm when the system has it), every process
+# that opens the handle maps the same memory, so worker processes write their results straight into
+# the array of the parent process and nothing is pickled or sent through a pipe.
+# The handle itself is small (a path, a shape and a dtype) and can be sent to the workers with the tasks.
+# multiprocessing.shared_memory would need Python 3.8, a memory-mapped file works on Python 3.7 too.
+class SharedArray:
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+
+    def open(self):
+        return np.memmap(self.path, dtype=self.dtype, mode="r+", shape=self.shape)
+
+    # Removes the file once the workers are done, the arrays already mapped stay valid.
+    # Windows does not remove a mapped file, there the file is removed when the array is released.
+    def release(self, array):
+        try:
+            os.remove(self.path)
+        except OSError:
+            weakref.finalize(array, remove_file, self.path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Returns the handle and the array of the parent process.
+def create_shared_array(shape, dtype=np.float64):
+    directory = SHARED_MEMORY_DIRECTORY if os.path.isdir(SHARED_MEMORY_DIRECTORY) else None
+    file_descriptor, path = tempfile.mkstemp(prefix="MonteCarloSimulation", suffix=".dat", dir=directory)
+    os.close(file_descriptor)
+    shape = tuple(shape)
+    if int(np.prod(shape)) == 0:
+        # An empty file can not be memory-mapped.
+        remove_file(path)
+        return None, np.empty(shape, dtype=dtype)
+    try:
+        array = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    except BaseException:
+        remove_file(path)
+        raise
+    return SharedArray(path, shape, dtype), array
@@ -0,0 +1,114 @@
+import glob
+import os
+import threading
+
+import numpy as np
+
+# Number of points copied at once when the shards are merged or exported.
+COPY_BLOCK_SIZE = 1000000
+
+# Suffixes of the files of a shard: the float32 points and the (chunk index, number of points) of its chunks.
+SHARD_SUFFIX = ".shard"
+INDEX_SUFFIX = ".index"
+
+
+# Points of one chunk, appended to the shard of the worker that runs the chunk, see TraceWriter.open_chunk.
+class ChunkTrace:
+    def __init__(self, shard_path, index_path, chunk_index, dimension):
+        self.index_path = index_path
+        self.chunk_index = chunk_index
+        self.dimension = dimension
+        self.number_of_points = 0
+        self.out_file = open(shard_path, "ab")
+
+    # Appends a batch of points, one array (or list) of values per coordinate.
+    def write(self, *coordinates):
+        points = np.empty((len(coordinates[0]), self.dimension), dtype=np.float32)
+        for k, values in enumerate(coordinates):
+            points[:, k] = values
+        points.tofile(self.out_file)
+        self.number_of_points += points.shape[0]
+
+    # The chunk is recorded in the index of the shard once all its points are written.
+    def close(self):
+        self.out_file.close()
+        with open(self.index_path, "ab") as index_file:
+            np.array([self.chunk_index, self.number_of_points], dtype=np.int64).tofile(index_file)
+
+
+# Binary trace of the points sampled by a simulation, used for visualization.
+# The points are float32 rows of coordinates. Every worker (process or thread) appends the points of the chunks
+# it runs to its own shard file "<name>.<worker>.shard", so workers never write to the same file and a
+# simulation writes one shard per worker instead of one file per chunk. The kernels write whole batches of
+# points without any string formatting. The index file "<name>.<worker>.index" of a shard lists its chunks,
+# merge() joins the chunks of all shards in chunk order into "<name>.npy".
+class TraceWriter:
+    def __init__(self, directory, name, dimension=2):
+        self.directory = directory
+        self.name = name
+        self.dimension = dimension
+
+    def get_shard_path(self, worker_name, suffix=SHARD_SUFFIX):
+        return os.path.join(self.directory, "{}.{}{}".format(self.name, worker_name, suffix))
+
+    def get_merged_path(self):
+        return os.path.join(self.directory, "{}.npy".format(self.name))
+
+    def list_shards(self):
+        return sorted(glob.glob(os.path.join(glob.escape(self.directory), glob.escape(self.name) + ".*" + SHARD_SUFFIX)))
+
+    # Returns the ChunkTrace of a chunk, its points go to the shard of the calling process and thread.
+    def open_chunk(self, chunk_index):
+        os.makedirs(self.directory, exist_ok=True)
+        worker_name = "{}-{}".format(os.getpid(), threading.get_ident())
+        return ChunkTrace(self.get_shard_path(worker_name), self.get_shard_path(worker_name, INDEX_SUFFIX),
+                          chunk_index, self.dimension)
+
+    # Shards of an earlier simulation would be merged with the new ones, so they are removed first.
+    def remove_shards(self):
+        for shard_path in self.list_shards():
+            os.remove(shard_path)
+            index_path = shard_path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX
+            if os.path.exists(index_path):
+                os.remove(index_path)
+
+    def merge(self, remove_shards=True):
+        shards = []
+        # (chunk index, shard, first point in the shard, number of points) of every chunk
+        chunks = []
+        for shard_path in self.list_shards():
+            index = np.fromfile(shard_path[:-len(SHARD_SUFFIX)] + INDEX_SUFFIX, dtype=np.int64).reshape(-1, 2)
+            shard = None
+            if os.path.getsize(shard_path) > 0:
+                shard = np.memmap(shard_path, dtype=np.float32, mode="r").reshape(-1, self.dimension)
+            shards.append(shard)
+            offset = 0
+            for chunk_index, number_of_points in index.tolist():
+                chunks.append((chunk_index, len(shards) - 1, offset, number_of_points))
+                offset += number_of_points
+        chunks.sort()
+        number_of_points = sum(chunk[3] for chunk in chunks)
+        os.makedirs(self.directory, exist_ok=True)
+        merged = np.lib.format.open_memmap(self.get_merged_path(), mode="w+", dtype=np.float32,
+                                           shape=(number_of_points, self.dimension))
+        offset = 0
+        for _, shard, first_point, number_of_chunk_points in chunks:
+            for start in range(first_point, first_point + number_of_chunk_points, COPY_BLOCK_SIZE):
+                block = shards[shard][start:min(start + COPY_BLOCK_SIZE, first_point + number_of_chunk_points)]
+                merged[offset:offset + block.shape[0]] = block
+                offset += block.shape[0]
+        merged.flush()
+        del merged
+        del shards
+        if remove_shards:
+            self.remove_shards()
+        return self.get_merged_path()
+
+    # Writes the merged trace as a text file with one point per line, every coordinate multiplied by scale
+    # and formatted with fmt. This is the format the Pharo visualizations read.
+    def export_text(self, path, scale=1, fmt="%.2f"):
+        merged = np.load(self.get_merged_path(), mmap_mode="r")
+        with open(path, "w") as out_file:
+            for start in range(0, merged.shape[0], COPY_BLOCK_SIZE):
+                np.savetxt(out_file, merged[start:start + COPY_BLOCK_SIZE] * scale, fmt=fmt)
+        return path
@@ -0,0 +1,28 @@
+from functools import partial
+
+# Context of the simulation in a worker process, installed once per worker when the pool starts.
+worker_context = None
+
+
+# Pool initializer, see WorkerPool.
+def install_worker_context(context):
+    global worker_context
+    worker_context = context
+
+
+def call_worker_context(method_name, *arguments):
+    return getattr(worker_context, method_name)(*arguments)
+
+
+# Task function which calls method_name of the worker context. Only the name of the method is sent
+# with the tasks, the context itself reaches every worker once through the pool initializer.
+def worker_context_method(method_name):
+    return partial(call_worker_context, method_name)
+
+
+# A copy of simulation with only the attributes the kernels need in the worker processes.
+def create_worker_context(simulation, attribute_names):
+    context = simulation.__class__.__new__(simulation.__class__)
+    for attribute_name in attribute_names:
+        setattr(context, attribute_name, getattr(simulation, attribute_name))
+    return context
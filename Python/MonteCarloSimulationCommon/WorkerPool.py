@@ -0,0 +1,167 @@
+import atexit
+import pickle
+import time
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from WorkerContext import install_worker_context
+
+
+# Execution backends of the worker pool:
+#   process  a multiprocessing pool, the chunks run in number_of_processes worker processes,
+#   thread   a thread pool, the chunks run in number_of_processes threads of this process. Nothing is pickled
+#            and no process is started, which pays off for NumPy kernels that release the GIL and on
+#            free-threaded interpreters; the pure Python kernels are serialized by the GIL,
+#   serial   the chunks run one after another in the calling thread.
+BACKENDS = ("process", "thread", "serial")
+
+
+def ping(value):
+    return value
+
+
+# Pool initializer of the process backend, the context arrives as the bytes it was compared by, see
+# create_context_key, so it is pickled only once.
+def install_pickled_worker_context(pickled_context):
+    install_worker_context(pickle.loads(pickled_context))
+
+
+# Key the warm pool compares contexts by. The process backend ships the context to new processes, so its key
+# is the pickled context, which is also what the workers receive. The thread and the serial backends share
+# the context with this process and pickle nothing, their key is the context itself, see is_same_context.
+def create_context_key(context, backend):
+    if backend == "process":
+        return pickle.dumps(context)
+    return context
+
+
+# The workers of an in-process backend see the attributes of the context they were started with, so a new
+# context with the very same attribute objects (see create_worker_context) is the same context.
+def is_same_context(context_key, other_context_key, backend):
+    if backend == "process":
+        return context_key == other_context_key
+    if context_key is other_context_key:
+        return True
+    if type(context_key) is not type(other_context_key) or not hasattr(context_key, "__dict__"):
+        return False
+    attributes = vars(context_key)
+    other_attributes = vars(other_context_key)
+    return attributes.keys() == other_attributes.keys() and \
+        all(attributes[name] is other_attributes[name] for name in attributes)
+
+
+# A multiprocessing pool that is created once and reused by every parallel simulation.
+# Starting a pool means starting number_of_processes new processes, which can take longer than a short
+# simulation, so the time spent starting the pool is kept separately in startup_time.
+# The pool is shut down with shutdown() or at the end of a with block:
+#   with WorkerPool(4) as worker_pool:
+#       worker_pool.map(function, iterable)
+# The context (see WorkerContext) is sent to every worker once, when the pool starts. The thread and the
+# serial backend install it in this process, their workers share it.
+class WorkerPool:
+    def __init__(self, number_of_processes, context=None, backend="process"):
+        if backend not in BACKENDS:
+            raise ValueError("unknown backend {}, expected one of {}".format(backend, BACKENDS))
+        self.number_of_processes = number_of_processes
+        self.context = context
+        self.context_key = create_context_key(context, backend)
+        self.backend = backend
+        self.pool = None
+        # The serial backend has no pool, it is running once the context is installed.
+        self.running_flag = False
+        # Duration of the last start() call in seconds, 0 when the pool was already running.
+        self.startup_time = 0.0
+
+    def start(self):
+        if self.running_flag == False:
+            start_time = time.perf_counter()
+            if self.backend == "process":
+                self.pool = Pool(processes=self.number_of_processes, initializer=install_pickled_worker_context,
+                                 initargs=(self.context_key,))
+            elif self.backend == "thread":
+                self.pool = ThreadPool(processes=self.number_of_processes, initializer=install_worker_context,
+                                       initargs=(self.context,))
+            else:
+                install_worker_context(self.context)
+            if self.pool is not None:
+                # Wait until the workers accept tasks.
+                self.pool.map(ping, range(self.number_of_processes), chunksize=1)
+            self.running_flag = True
+            self.startup_time = time.perf_counter() - start_time
+        else:
+            self.startup_time = 0.0
+        return self
+
+    # Changing the number of processes restarts the pool, keeping the same number keeps it warm.
+    def resize(self, number_of_processes):
+        return self.configure(number_of_processes, self.context, self.backend)
+
+    # The workers get a new context only when the pool restarts, so a different context restarts the pool.
+    # The same context (see is_same_context) keeps it warm. Changing the backend restarts the pool too.
+    def configure(self, number_of_processes, context, backend="process"):
+        if backend not in BACKENDS:
+            raise ValueError("unknown backend {}, expected one of {}".format(backend, BACKENDS))
+        context_key = create_context_key(context, backend)
+        if number_of_processes != self.number_of_processes or backend != self.backend \
+                or not is_same_context(self.context_key, context_key, backend):
+            self.shutdown()
+            self.number_of_processes = number_of_processes
+            self.context = context
+            self.context_key = context_key
+            self.backend = backend
+        return self.start()
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.running_flag = False
+
+    def is_running(self):
+        return self.running_flag
+
+    def map(self, function, iterable, chunksize=None):
+        if self.start().pool is None:
+            return list(map(function, iterable))
+        return self.pool.map(function, iterable, chunksize)
+
+    def starmap(self, function, iterable, chunksize=None):
+        if self.start().pool is None:
+            return [function(*arguments) for arguments in iterable]
+        return self.pool.starmap(function, iterable, chunksize)
+
+    def imap_unordered(self, function, iterable, chunksize=1):
+        if self.start().pool is None:
+            return map(function, iterable)
+        return self.pool.imap_unordered(function, iterable, chunksize)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+
+# The pool shared by all simulations, see get_worker_pool.
+shared_worker_pool = None
+
+
+# Returns the shared pool with number_of_processes processes (or threads), the worker context context
+# and the execution backend backend, see BACKENDS.
+# The pool stays warm between calls, so repeated parallel simulations with the same number of processes,
+# the same context and the same backend do not start new processes.
+def get_worker_pool(number_of_processes, context=None, backend="process"):
+    global shared_worker_pool
+    if shared_worker_pool is None:
+        shared_worker_pool = WorkerPool(number_of_processes, context, backend)
+    return shared_worker_pool.configure(number_of_processes, context, backend)
+
+
+def shutdown_worker_pool():
+    if shared_worker_pool is not None:
+        shared_worker_pool.shutdown()
+
+
+atexit.register(shutdown_worker_pool)
@@ -0,0 +1,153 @@
+import json
+import math
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Estimators of the mean and the variance of the daily log returns:
+#   welford  all returns (Welford's algorithm), the same values as np.mean and np.var of the whole series,
+#   ewma     exponentially weighted, the weight of a return falls by decay per day (0.94 is RiskMetrics),
+#   rolling  the last window_size returns.
+CALIBRATION_MODES = ("welford", "ewma", "rolling")
+
+
+# Incremental calibration of the drift and the volatility of a stock.
+# The calibration keeps running sufficient statistics of the daily log returns instead of the return series,
+# a new close updates them in O(1) (update), so a re-run with the latest closes does not rescan decades
+# of history. The state is small and is saved as a JSON file next to the market data cache, see save and load.
+# The variances are population variances (like np.var), drift = mean - variance / 2.
+class Calibration:
+    def __init__(self, mode="welford", decay=0.94, window_size=252):
+        if mode not in CALIBRATION_MODES:
+            raise ValueError("unknown calibration mode {}, expected one of {}".format(mode, CALIBRATION_MODES))
+        if not 0 < decay < 1:
+            raise ValueError("decay must be between 0 and 1, got {}".format(decay))
+        if window_size < 1:
+            raise ValueError("window size must be at least 1, got {}".format(window_size))
+        self.mode = mode
+        self.decay = decay
+        self.window_size = window_size
+        self.clear()
+
+    def clear(self):
+        # Last close and its date (ISO format, None when the closes have no dates).
+        self.last_close = None
+        self.last_date = None
+        # Number of returns, mean and sum of squared deviations from the mean (welford and rolling),
+        # mean and variance (ewma).
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.variance = 0.0
+        # Returns of the window of the rolling mode, oldest first.
+        self.window = deque()
+
+    def add_return(self, value):
+        if self.mode == "ewma":
+            if self.count == 0:
+                self.mean = value
+                self.variance = 0.0
+            else:
+                delta = value - self.mean
+                self.mean += (1 - self.decay) * delta
+                self.variance = self.decay * (self.variance + (1 - self.decay) * delta * delta)
+            self.count += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.mode == "rolling":
+            self.window.append(value)
+            if len(self.window) > self.window_size:
+                self.remove_return(self.window.popleft())
+
+    # Inverse of the Welford update, removes the oldest return of the window.
+    def remove_return(self, value):
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    # Adds a new close, closes with a date not after the last date are already included and are skipped.
+    def update(self, close, date=None):
+        if date is not None:
+            date = pd.Timestamp(date)
+            if self.last_date is not None and date <= pd.Timestamp(self.last_date):
+                return self
+            self.last_date = date.date().isoformat()
+        if self.last_close is not None:
+            self.add_return(math.log(close / self.last_close))
+        self.last_close = float(close)
+        return self
+
+    # Calibrates from a Close series (with dates as its index) in one pass.
+    def fit(self, time_series):
+        self.clear()
+        closes = np.asarray(time_series, dtype=float)
+        returns = np.diff(np.log(closes))
+        if self.mode == "rolling":
+            returns = returns[-self.window_size:]
+            self.window.extend(returns.tolist())
+        if self.mode == "ewma":
+            for value in returns:
+                self.add_return(float(value))
+        elif returns.shape[0] > 0:
+            self.count = int(returns.shape[0])
+            self.mean = float(returns.mean())
+            self.m2 = float(np.square(returns - self.mean).sum())
+        self.last_close = float(closes[-1]) if closes.shape[0] > 0 else None
+        if isinstance(time_series, pd.Series) and time_series.shape[0] > 0:
+            self.last_date = pd.Timestamp(time_series.index[-1]).date().isoformat()
+        return self
+
+    # Adds the closes of the series dated after the last date.
+    def update_series(self, time_series):
+        if self.last_date is not None:
+            time_series = time_series[time_series.index > pd.Timestamp(self.last_date)]
+        for date, close in time_series.items():
+            self.update(close, date)
+        return self
+
+    def calculate_average_daily_return(self):
+        return self.mean
+
+    def calculate_variance(self):
+        if self.mode == "ewma":
+            return self.variance
+        if self.count == 0:
+            return 0.0
+        return self.m2 / self.count
+
+    def calculate_standard_deviation(self):
+        return math.sqrt(self.calculate_variance())
+
+    def calculate_drift(self):
+        return self.calculate_average_daily_return() - self.calculate_variance() / 2
+
+    def to_dict(self):
+        return {"mode": self.mode, "decay": self.decay, "window_size": self.window_size,
+                "last_close": self.last_close, "last_date": self.last_date, "count": self.count, "mean": self.mean,
+                "m2": self.m2, "variance": self.variance, "window": list(self.window)}
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as out_file:
+            json.dump(self.to_dict(), out_file)
+        return path
+
+
+def load_calibration(path):
+    with open(path) as in_file:
+        state = json.load(in_file)
+    calibration = Calibration(state["mode"], state["decay"], state["window_size"])
+    for name in ("last_close", "last_date", "count", "mean", "m2", "variance"):
+        setattr(calibration, name, state[name])
+    calibration.window.extend(state["window"])
+    return calibration
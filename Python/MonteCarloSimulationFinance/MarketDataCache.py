@@ -0,0 +1,89 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+CALIBRATION_SUFFIX = ".calibration.json"
+
+
+# Local cache of the Close series of stocks, keyed by (ticker symbol, start date, end date).
+# The series are stored as .npz files with the dates and the prices, loading one takes milliseconds.
+# A series is downloaded from Yahoo only when it is neither in the cache nor given as a local CSV file,
+# so repeated simulations of the same stock do not touch the network and can run fully offline.
+# Cached series never expire, invalidate() or clear() remove them explicitly.
+class MarketDataCache:
+    def __init__(self, directory):
+        self.directory = directory
+        # Series already loaded in this process.
+        self.time_series = {}
+
+    def get_cache_path(self, ticker_symbol, start_date, end_date):
+        name = "{}_{}_{}".format(ticker_symbol, start_date, end_date)
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", name) + ".npz")
+
+    # The state of the incremental calibration of a series (see Calibration) is kept next to the series,
+    # one JSON file per calibration mode.
+    def get_calibration_path(self, ticker_symbol, start_date, end_date, mode):
+        cache_path = self.get_cache_path(ticker_symbol, str(start_date), str(end_date))
+        return cache_path[:-len(".npz")] + "_{}{}".format(mode, CALIBRATION_SUFFIX)
+
+    # csv_path is an optional local CSV file with Date and Close columns, for example a stock history
+    # downloaded from Yahoo Finance, which is used instead of a download.
+    def load(self, ticker_symbol, start_date, end_date, csv_path=None):
+        key = (ticker_symbol, str(start_date), str(end_date))
+        if key in self.time_series:
+            return self.time_series[key]
+        cache_path = self.get_cache_path(*key)
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                time_series = pd.Series(cached["close"], index=pd.to_datetime(cached["dates"]), name="Close")
+        else:
+            if csv_path is not None:
+                time_series = self.read_csv(csv_path, start_date, end_date)
+            else:
+                time_series = self.download(ticker_symbol, start_date, end_date)
+            self.store(cache_path, time_series)
+        self.time_series[key] = time_series
+        return time_series
+
+    def read_csv(self, csv_path, start_date, end_date):
+        stock = pd.read_csv(csv_path, index_col="Date", parse_dates=True).sort_index()
+        return stock["Close"].dropna().loc[start_date:end_date]
+
+    def download(self, ticker_symbol, start_date, end_date):
+        # pandas_datareader is only needed when the data is not available locally.
+        from pandas_datareader import data
+        stock = data.DataReader(ticker_symbol, 'yahoo', start_date, end_date)
+        stock = stock.dropna()
+        return stock['Close']
+
+    def store(self, cache_path, time_series):
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(cache_path, dates=time_series.index.values.astype("datetime64[ns]"),
+                 close=time_series.values.astype(np.float64))
+
+    def invalidate(self, ticker_symbol, start_date, end_date):
+        key = (ticker_symbol, str(start_date), str(end_date))
+        self.time_series.pop(key, None)
+        cache_path = self.get_cache_path(*key)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        # The calibrations of the series are removed with it.
+        if os.path.isdir(self.directory):
+            prefix = os.path.basename(cache_path)[:-len(".npz")] + "_"
+            for file_name in os.listdir(self.directory):
+                if file_name.startswith(prefix) and file_name.endswith(CALIBRATION_SUFFIX):
+                    os.remove(os.path.join(self.directory, file_name))
+
+    def clear(self):
+        self.time_series.clear()
+        if os.path.isdir(self.directory):
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(".npz") or file_name.endswith(CALIBRATION_SUFFIX):
+                    os.remove(os.path.join(self.directory, file_name))
+
+
+# The cache shared by all simulations, in the Market Data directory of the repository.
+market_data_cache = MarketDataCache(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Market Data"))
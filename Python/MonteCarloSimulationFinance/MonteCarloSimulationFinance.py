@@ -1,39 +1,116 @@
-import copy
 import math
+import os
 import random
-import time
-from multiprocessing import Pool
+import sys
 
 import numpy as np
-from pandas_datareader import data
 from scipy.stats import norm
 
-
-def calculate_execution_time(function):
-    def calculate_duration(*args, **kwargs):
-        start_time = time.time()
-        executing_function = function(*args, **kwargs)
-        end_time = time.time()
-        execution_time = round(end_time - start_time, 7)
-        return executing_function, execution_time
-
-    return calculate_duration
+# The modules shared by all simulations are in the MonteCarloSimulationCommon directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MonteCarloSimulationCommon"))
+from Calibration import Calibration, load_calibration
+from ChunkScheduler import ChunkScheduler, split_into_chunk_sizes
+from Instrumentation import Instrumentation, calculate_execution_time
+from MarketDataCache import market_data_cache
+from OptionPricing import TRADING_DAYS_PER_YEAR, OptionPrices, create_options
+from PathExport import export_paths_csv, export_paths_npy
+from RandomStreams import RandomStreams, create_generator, create_python_random
+from ResultCache import cached_simulation, result_cache
+from RiskSummary import NUMBER_OF_BINS, NUMBER_OF_STANDARD_DEVIATIONS, RiskSummary
+from SharedArray import create_shared_array
+from WorkerContext import create_worker_context, worker_context_method
+from WorkerPool import get_worker_pool
+
+# Path models:
+#   gbm        geometric Brownian motion, the daily log returns are drift + sigma * z with a standard normal z,
+#   bootstrap  the daily log returns are resampled from the historical log returns, in blocks of block_size
+#              consecutive days (block bootstrap), which keeps the fat tails and the volatility clustering.
+MODELS = ("gbm", "bootstrap")
 
 
 class MonteCarloSimulationFinance:
+    # Attributes the kernels need in the worker processes, see create_worker_context.
+    WORKER_CONTEXT_ATTRIBUTES = ("vectorized_flag", "last_price", "drift", "sigma", "batch_size", "number_of_bins",
+                                 "model", "block_size", "historical_returns")
+    # Attributes the result of a simulation depends on and attributes a cached result restores, see cached_simulation.
+    # The streaming risk and the option pricing runs are cached, their results are small summaries.
+    CACHE_ATTRIBUTES = ("time_series", "data", "calibration", "vectorized_flag", "model", "block_size", "interest_rate",
+                        "risk_neutral_flag", "chunk_size", "risk_chunk_size", "batch_size", "number_of_bins", "seed")
+    CACHE_STATE_ATTRIBUTES = ("last_seed", "last_price", "drift", "sigma", "historical_returns", "risk_summary",
+                              "option_prices")
+
     def __init__(self, start_date, end_date, ticker_symbol, number_of_processes):
         self.start_date = start_date
         self.end_date = end_date
         self.ticker_symbol = ticker_symbol
         self.data = None
         self.time_series = None
+        # Optional local CSV file with Date and Close columns used instead of downloading the data.
+        self.csv_path = None
         self.number_of_processes = number_of_processes
         self.parallel_flag = False
-
+        # Time spent starting the worker pool in the last parallel simulation, 0 when the pool was warm.
+        self.pool_startup_time = 0.0
+        self.vectorized_flag = False
+        # Calibrated model parameters, see calibrate().
+        self.last_price = None
+        self.drift = None
+        self.sigma = None
+        # Incremental calibration of the drift and the volatility, see load_calibration and add_close.
+        # None calibrates from the whole return series.
+        self.calibration = None
+        # Path model ("gbm" or "bootstrap", see MODELS) and number of consecutive historical days per block
+        # of the bootstrap model, 1 resamples single days.
+        self.model = "gbm"
+        self.block_size = 1
+        # Contiguous array of the historical log returns resampled by the bootstrap model, see calibrate().
+        self.historical_returns = None
+        # Option pricing, see mcs_options_serial: annual continuously compounded interest rate, and whether
+        # calibrate() replaces the historical drift with the risk-neutral drift of the interest rate, which
+        # arbitrage-free prices need.
+        self.interest_rate = 0.0
+        self.risk_neutral_flag = False
+        # OptionPrices of the last option pricing.
+        self.option_prices = None
+        # Master seed of the random streams, None takes a fresh seed from the operating system.
+        self.seed = None
+        # Seed of the last simulation, setting seed to it repeats the simulation.
+        self.last_seed = None
+        # Number of simulations per chunk. Every chunk is one task with its own random stream, see ChunkScheduler
+        # and RandomStreams. A chunk is a few million prices, large enough that the vectorized kernel and not the
+        # scheduling of the tasks dominates, and 100000 paths are still 20 chunks to balance over the workers.
+        # The chunk size is fixed and not derived from the number of processes, so a seeded simulation gives the
+        # same paths with any number of processes. Changing it changes which paths a seed gives.
+        self.chunk_size = 5000
+        # (chunk index, number of simulations, execution time in seconds, process id) per chunk of the last simulation
+        self.chunk_times = []
+        # Streaming risk mode, see mcs_finance_risk_serial: number of paths per chunk, number of paths a worker
+        # keeps in memory at once and number of bins of the histograms of the RiskSummary.
+        self.risk_chunk_size = 100000
+        self.batch_size = 10000
+        self.number_of_bins = NUMBER_OF_BINS
+        # RiskSummary of the last streaming risk simulation.
+        self.risk_summary = None
+        # Phase timings, throughput and peak memory of the last simulation, see Instrumentation.
+        self.instrumentation = Instrumentation()
+        # Execution backend of mcs_finance_parallel ("process", "thread" or "serial"), see WorkerPool.
+        self.backend = "process"
+        # Whether repeated runs with the same configuration and seed are read from the result cache, see
+        # cached_simulation, whether the last run was, and the cache.
+        self.cache_flag = False
+        self.cached_flag = False
+        self.result_cache = result_cache
+        # Directory of the exported predictions, see export_finance_file.
+        self.export_directory = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Execution Results", "Finance")
+
+    def is_result_cacheable(self):
+        return self.cache_flag == True and self.seed is not None
+
+    # The Close series comes from the local market data cache, it is downloaded only the first time
+    # or read from csv_path when it is set, see MarketDataCache.
     def data_acquisition(self):
-        stock = data.DataReader(self.ticker_symbol, 'yahoo', self.start_date, self.end_date)
-        stock = stock.dropna()
-        self.time_series = stock['Close']
+        self.time_series = market_data_cache.load(self.ticker_symbol, self.start_date, self.end_date, self.csv_path)
 
     # Differencing time series = Shifting and lagging time series
     def calculate_periodic_daily_return(self):
@@ -42,14 +119,17 @@ class MonteCarloSimulationFinance:
         self.data = np.log(self.time_series).diff().dropna()
         # Shifting and lagging time series
         # self.data=np.log(self.time_series / self.time_series.shift(1)).dropna()
+        # New returns invalidate the calibrated model parameters.
+        self.drift = None
+        self.sigma = None
 
     # A z-table, also called the standard normal table, is a mathematical table that allows us to know
     # the percentage of values below (to the left) a z-score in a standard normal distribution (SND).
     # A z-score, also known as a standard score, indicates the number of standard deviations
     # a raw score lays above or below the mean. When the mean of the z-score is calculated it is always 0,
     # and the standard deviation (variance) is always in increments of 1.
-    def calculate_z_score(self):
-        return norm.ppf(random.random())
+    def calculate_z_score(self, random_generator=random):
+        return norm.ppf(random_generator.random())
 
     def calculate_average_daily_return(self):
         return np.mean(self.data)
@@ -63,88 +143,375 @@ class MonteCarloSimulationFinance:
     def calculate_drift(self):
         return self.calculate_average_daily_return() - self.calculate_variance() / 2
 
-    def calculate_random_value(self):
-        return self.calculate_standard_deviation() * self.calculate_z_score()
+    def calculate_random_value(self, random_generator=random):
+        return self.calculate_standard_deviation() * self.calculate_z_score(random_generator)
+
+    # The drift and the standard deviation do not change during a simulation, so both engines calculate
+    # them once over the whole return series instead of once per simulated day.
+    # With an incremental calibration they come from its running statistics, the return series is not scanned.
+    def calibrate(self):
+        if self.model not in MODELS:
+            raise ValueError("unknown model {}, expected one of {}".format(self.model, MODELS))
+        if self.model == "bootstrap":
+            self.calibrate_bootstrap()
+        if self.calibration is not None:
+            self.last_price = self.calibration.last_close
+            self.drift = self.calibration.calculate_drift()
+            self.sigma = self.calibration.calculate_standard_deviation()
+        else:
+            self.last_price = self.time_series.iloc[-1]
+            self.drift = self.calculate_drift()
+            self.sigma = self.calculate_standard_deviation()
+        if self.risk_neutral_flag == True:
+            self.calibrate_risk_neutral()
+
+    # Under the risk-neutral measure the price grows at the interest rate, e^(drift + sigma^2 / 2) = e^(daily rate).
+    # The bootstrap model shifts the historical log returns to the risk-neutral mean and keeps their shape.
+    def calibrate_risk_neutral(self):
+        self.drift = self.interest_rate / TRADING_DAYS_PER_YEAR - self.sigma ** 2 / 2
+        if self.model == "bootstrap":
+            self.historical_returns = self.historical_returns - self.historical_returns.mean() + self.drift
+
+    # The bootstrap model gathers the returns from a contiguous float64 array instead of the return series.
+    def calibrate_bootstrap(self):
+        if self.data is None:
+            self.calculate_periodic_daily_return()
+        self.historical_returns = np.ascontiguousarray(self.data, dtype=np.float64)
+        if not 1 <= self.block_size <= self.historical_returns.shape[0]:
+            raise ValueError("block size must be between 1 and the number of historical returns {}, got {}".format(
+                self.historical_returns.shape[0], self.block_size))
+
+    def get_calibration_path(self, mode):
+        return market_data_cache.get_calibration_path(self.ticker_symbol, self.start_date, self.end_date, mode)
+
+    # Switches to an incremental calibration ("welford", "ewma" or "rolling", see Calibration).
+    # The calibration saved next to the cached series is loaded and only the closes after its last date are added,
+    # the series is fitted in full only the first time. The loaded calibration keeps its decay and window size.
+    def load_calibration(self, mode="welford", decay=0.94, window_size=252):
+        if self.time_series is None:
+            self.data_acquisition()
+        calibration_path = self.get_calibration_path(mode)
+        if os.path.exists(calibration_path):
+            self.calibration = load_calibration(calibration_path).update_series(self.time_series)
+        else:
+            self.calibration = Calibration(mode, decay, window_size).fit(self.time_series)
+        self.save_calibration()
+        self.drift = None
+        self.sigma = None
+        return self.calibration
+
+    def save_calibration(self):
+        if self.calibration is None:
+            raise ValueError("there is no incremental calibration, call load_calibration first")
+        return self.calibration.save(self.get_calibration_path(self.calibration.mode))
+
+    # Adds a new daily close to the incremental calibration in O(1), the next simulation starts from it.
+    # The cached series is not changed, save_calibration keeps the close for the next run.
+    def add_close(self, close, date=None):
+        if self.calibration is None:
+            self.load_calibration()
+        self.calibration.update(close, date)
+        self.drift = None
+        self.sigma = None
 
     # prediction window size: number of prediction days per simulation
-    def simulation_finance(self, number_of_simulations, prediction_window_size):
+    def simulation_finance(self, number_of_simulations, prediction_window_size, seed_sequence=None):
+        if self.drift is None:
+            self.calibrate()
+        random_generator = create_python_random(seed_sequence)
         predictions = []
-        prediction = []
         for i in range(number_of_simulations):
             # today’s price
-            prediction.append(self.time_series.iloc[-1])
+            prediction = [self.last_price]
             for j in range(prediction_window_size):
                 # Next Day’s Price=Today’s Price × e^(Drift+Random Value)
                 prediction.append(
-                    prediction[-1] * pow(math.e, (self.calculate_drift() + self.calculate_random_value())))
+                    prediction[-1] * pow(math.e, (self.drift + self.sigma * self.calculate_z_score(random_generator))))
 
-            predictions.append(copy.deepcopy(prediction))
-            prediction.clear()
+            predictions.append(prediction)
+        return predictions
+
+    # Vectorized version of simulation_finance. All random values of all simulations are drawn in one call
+    # and the paths are built with a cumulative sum of the log returns, row i of the result is simulation i
+    # and column 0 is today's price. The paths are written into out when it is given.
+    def simulation_finance_vectorized(self, number_of_simulations, prediction_window_size, seed_sequence=None,
+                                      out=None):
+        if self.drift is None:
+            self.calibrate()
+        random_generator = create_generator(seed_sequence)
+        # The paths are built in place in one preallocated array.
+        if out is None:
+            predictions = np.empty((number_of_simulations, prediction_window_size + 1))
+        else:
+            predictions = out
+        # Drift + Random Value for every day of every simulation.
+        random_generator.standard_normal(out=predictions)
+        predictions *= self.sigma
+        predictions += self.drift
+        # Next Day’s Price = Today’s Price × e^(Drift+Random Value), so the price after k days is
+        # today's price × e^(sum of the first k log returns). Column 0 is today's price, e^0 = 1.
+        predictions[:, 0] = 0
+        np.cumsum(predictions, axis=1, out=predictions)
+        np.exp(predictions, out=predictions)
+        predictions *= self.last_price
+        return predictions
+
+    # Bootstrap version of simulation_finance_vectorized. The indices of the resampled days of all simulations
+    # are drawn in one call as the first days of number of blocks blocks per simulation, the block of a first day
+    # is block_size consecutive days, and the log returns are gathered with one take from historical_returns.
+    # The paths are built with a cumulative sum like the GBM paths.
+    def simulation_finance_bootstrap(self, number_of_simulations, prediction_window_size, seed_sequence=None,
+                                     out=None):
+        if self.drift is None:
+            self.calibrate()
+        random_generator = create_generator(seed_sequence)
+        if out is None:
+            predictions = np.empty((number_of_simulations, prediction_window_size + 1))
+        else:
+            predictions = out
+        number_of_blocks = -(-prediction_window_size // self.block_size)
+        first_days = random_generator.integers(0, self.historical_returns.shape[0] - self.block_size + 1,
+                                               size=(number_of_simulations, number_of_blocks))
+        days = (first_days[:, :, np.newaxis] + np.arange(self.block_size)).reshape(number_of_simulations, -1)
+        np.take(self.historical_returns, days[:, :prediction_window_size], out=predictions[:, 1:])
+        predictions[:, 0] = 0
+        np.cumsum(predictions, axis=1, out=predictions)
+        np.exp(predictions, out=predictions)
+        predictions *= self.last_price
         return predictions
 
+    # Runs one chunk of a parallel simulation in a worker process and writes its paths into rows
+    # [offset, offset + number_of_simulations) of the array shared with the parent process.
+    def simulation_finance_shared(self, number_of_simulations, prediction_window_size, seed_sequence,
+                                  shared_predictions, offset):
+        predictions = shared_predictions.open()[offset:offset + number_of_simulations]
+        if self.is_vectorized():
+            self.select_simulation_finance()(number_of_simulations, prediction_window_size, seed_sequence,
+                                             out=predictions)
+        else:
+            predictions[:] = self.simulation_finance(number_of_simulations, prediction_window_size, seed_sequence)
+        return number_of_simulations
+
+    # Streaming risk kernel: simulates number_of_simulations paths in batches of batch_size paths and adds them
+    # to a RiskSummary, only the summary is returned. The random stream of the chunk continues from batch
+    # to batch, memory does not depend on the number of paths.
+    def simulation_finance_risk(self, number_of_simulations, prediction_window_size, seed_sequence=None):
+        if self.drift is None:
+            self.calibrate()
+        risk_summary = self.create_risk_summary(prediction_window_size)
+        for paths in self.generate_path_batches(number_of_simulations, prediction_window_size, seed_sequence):
+            risk_summary.update(paths)
+        return risk_summary
+
+    # Option pricing kernel: the payoffs of all options are evaluated on every batch of paths in the worker,
+    # only the OptionPrices (the sums and the sums of squares of the discounted payoffs) are returned.
+    def simulation_finance_options(self, number_of_simulations, prediction_window_size, seed_sequence, options,
+                                   interest_rate):
+        if self.drift is None:
+            self.calibrate()
+        option_prices = OptionPrices(options, interest_rate)
+        for paths in self.generate_path_batches(number_of_simulations, prediction_window_size, seed_sequence):
+            option_prices.update(paths)
+        return option_prices
+
+    # Yields the paths of a chunk in batches of batch_size paths, the random stream of the chunk continues
+    # from batch to batch. The vectorized kernels build every batch in the same buffer, a batch is only
+    # valid until the next one.
+    def generate_path_batches(self, number_of_simulations, prediction_window_size, seed_sequence=None):
+        if self.is_vectorized():
+            simulation = self.select_simulation_finance()
+            random_generator = create_generator(seed_sequence)
+            buffer = np.empty((min(self.batch_size, number_of_simulations), prediction_window_size + 1))
+            for batch_size in split_into_chunk_sizes(number_of_simulations, self.batch_size):
+                yield simulation(batch_size, prediction_window_size, random_generator, out=buffer[:batch_size])
+        else:
+            random_generator = create_python_random(seed_sequence)
+            for batch_size in split_into_chunk_sizes(number_of_simulations, self.batch_size):
+                yield self.simulation_finance(batch_size, prediction_window_size, random_generator)
+
+    # The histograms of the bootstrap model are widened so that the largest historical daily return
+    # still falls inside the histogram of day 1.
+    def create_risk_summary(self, prediction_window_size):
+        sigma = self.sigma
+        if self.model == "bootstrap":
+            sigma = max(sigma, np.max(np.abs(self.historical_returns - self.drift)) / NUMBER_OF_STANDARD_DEVIATIONS)
+        return RiskSummary(self.last_price, self.drift, sigma, prediction_window_size, self.number_of_bins)
+
+    # The bootstrap model has only a vectorized kernel.
+    def is_vectorized(self):
+        return self.vectorized_flag == True or self.model == "bootstrap"
+
+    def select_simulation_finance(self):
+        if self.model == "bootstrap":
+            return self.simulation_finance_bootstrap
+        if self.vectorized_flag == True:
+            return self.simulation_finance_vectorized
+        return self.simulation_finance
+
+    # Returns one (number of simulations, prediction window size, seed sequence) task per chunk of simulations.
+    def split_into_chunks(self, number_of_simulations, prediction_window_size, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        random_streams = RandomStreams(self.seed)
+        self.last_seed = random_streams.seed
+        return [(number_of_simulations_per_chunk, prediction_window_size, seed_sequence)
+                for number_of_simulations_per_chunk, seed_sequence
+                in random_streams.split(number_of_simulations, chunk_size)]
+
+    # The worker processes get only the attributes the kernels need, once per worker when the pool starts,
+    # the tasks carry only the number of simulations and the random streams, see WorkerContext.
+    def create_worker_context(self):
+        return create_worker_context(self, self.WORKER_CONTEXT_ATTRIBUTES)
+
+    # Starts the worker pool of a parallel simulation. Calling it before mcs_finance_parallel keeps
+    # the pool startup out of the measured execution time.
+    def start_worker_pool(self):
+        self.parallel_flag = True
+        # Calibrate once in the parent process, the workers receive the calibrated parameters.
+        self.calibrate()
+        with self.instrumentation.phase("pool_startup"):
+            worker_pool = get_worker_pool(self.number_of_processes, self.create_worker_context(),
+                                          self.backend)
+        return worker_pool
+
+    # Runs the chunks in the worker pool, or one after another in this process without a worker pool.
+    def run_chunks(self, simulation, chunks, worker_pool=None):
+        chunk_scheduler = ChunkScheduler(worker_pool)
+        results = chunk_scheduler.run(simulation, chunks)
+        self.chunk_times = chunk_scheduler.chunk_times
+        self.instrumentation.record_chunks(chunk_scheduler)
+        return results
+
     @calculate_execution_time
     def mcs_finance_serial(self, number_of_simulations, prediction_window_size):
         self.parallel_flag = False
-        return self.simulation_finance(number_of_simulations, prediction_window_size)
+        self.calibrate()
+        predictions_per_chunk = self.run_chunks(self.select_simulation_finance(),
+                                                self.split_into_chunks(number_of_simulations, prediction_window_size))
+        with self.instrumentation.phase("reduction"):
+            if self.is_vectorized():
+                return np.concatenate(predictions_per_chunk)
+            predictions = []
+            for predictions_of_chunk in predictions_per_chunk:
+                predictions += predictions_of_chunk
+        return predictions
 
     @calculate_execution_time
     def mcs_finance_parallel(self, number_of_simulations, prediction_window_size):
-        self.parallel_flag = True
-        pool = Pool(processes=self.number_of_processes)
-        number_of_simulations_per_process = int(number_of_simulations / self.number_of_processes)
-        simulations_per_process = []
-        # Append the same value multiple times to a list
-        # To add v, n times, to l:
-        # l += n * [v]
-        # Mapping a function with multiple arguments to a multiprocessing pool will distribute
-        # the input data across processes to be run with the referenced function.
-        simulations_per_process += self.number_of_processes * [
-            (number_of_simulations_per_process, prediction_window_size)]
-        predictions = pool.starmap(self.simulation_finance, simulations_per_process)
-        return predictions
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        # The workers write the paths straight into one (number of simulations, prediction window size + 1)
+        # array in shared memory, the paths are not pickled and sent back to the parent process.
+        shared_predictions, predictions = create_shared_array((number_of_simulations, prediction_window_size + 1))
+        # Every chunk of simulations is a task with its own random stream, the chunks do not depend on the
+        # number of processes, so the result of a seeded simulation does not depend on it either.
+        # Chunk i writes the rows after the rows of chunks 0, 1, ..., i - 1.
+        # The file of the shared array is released even when a worker fails or the simulation is interrupted.
+        try:
+            tasks = []
+            offset = 0
+            for number_of_simulations_per_chunk, window_size, seed_sequence in self.split_into_chunks(
+                    number_of_simulations, prediction_window_size):
+                tasks.append((number_of_simulations_per_chunk, window_size, seed_sequence, shared_predictions,
+                              offset))
+                offset += number_of_simulations_per_chunk
+            self.run_chunks(worker_context_method("simulation_finance_shared"), tasks, worker_pool)
+        finally:
+            with self.instrumentation.phase("reduction"):
+                if shared_predictions is not None:
+                    shared_predictions.release(predictions)
+        # A plain array view of the shared memory, it keeps the memory mapped as long as it is used.
+        return np.asarray(predictions)
+
+    # The RiskSummary of every chunk is merged in the order of the chunks.
+    def aggregate_risk_summaries(self, risk_summaries, prediction_window_size):
+        self.risk_summary = self.create_risk_summary(prediction_window_size)
+        for risk_summary in risk_summaries:
+            self.risk_summary.merge(risk_summary)
+        return self.risk_summary
+
+    # Streaming risk versions of mcs_finance_serial and mcs_finance_parallel. The paths are not kept: every chunk
+    # of risk_chunk_size paths returns only its RiskSummary (terminal price statistics, percentile bands of
+    # every day, value at risk, conditional value at risk and maximum drawdowns), so millions of paths run
+    # in a fixed amount of memory. Return the RiskSummary of all paths.
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_finance_risk_serial(self, number_of_simulations, prediction_window_size):
+        self.parallel_flag = False
+        self.calibrate()
+        risk_summaries = self.run_chunks(self.simulation_finance_risk, self.split_into_chunks(
+            number_of_simulations, prediction_window_size, self.risk_chunk_size))
+        with self.instrumentation.phase("reduction"):
+            return self.aggregate_risk_summaries(risk_summaries, prediction_window_size)
 
-    def export_finance_file(self, predictions):
-        serial_number = 1
-        if self.parallel_flag == False:
-            # r before string converts normal string to raw string
-            path = r"C:\Users\Dule\Desktop\NAPREDNE TEHNIKE PROGRAMIRANJA\PROJEKAT\NTP" \
-                   r"\Execution Results\Finance\PythonFinanceSerial.txt"
-            out_file = open(path, "w")
-            for i in range(len(predictions)):
-                for j in range(len(predictions[i])):
-                    if j == 0:
-                        # Write a serial number of simulations at the beginning of a file.
-                        out_file.write(str(serial_number) + "," + " ")
-                    # A component in one row of the output file.
-                    out_file.write(str(predictions[i][j]))
-                    if j == (len(predictions[i]) - 1):
-                        out_file.write("\r\n")
-                        serial_number += 1
-                    else:
-                        out_file.write("," + " ")
-
-            out_file.close()
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_finance_risk_parallel(self, number_of_simulations, prediction_window_size):
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        risk_summaries = self.run_chunks(worker_context_method("simulation_finance_risk"), self.split_into_chunks(
+            number_of_simulations, prediction_window_size, self.risk_chunk_size), worker_pool)
+        with self.instrumentation.phase("reduction"):
+            return self.aggregate_risk_summaries(risk_summaries, prediction_window_size)
+
+    # The OptionPrices of every chunk are merged in the order of the chunks.
+    def aggregate_option_prices(self, option_prices_per_chunk, options):
+        self.option_prices = OptionPrices(options, self.interest_rate)
+        for option_prices in option_prices_per_chunk:
+            self.option_prices.merge(option_prices)
+        return self.option_prices
+
+    # Returns one task of simulation_finance_options per chunk of risk_chunk_size paths, the paths cover
+    # the longest maturity of the options.
+    def split_into_option_chunks(self, number_of_simulations, options):
+        prediction_window_size = max(option.maturity for option in options)
+        return [chunk + (options, self.interest_rate) for chunk in self.split_into_chunks(
+            number_of_simulations, prediction_window_size, self.risk_chunk_size)]
+
+    # Prices a batch of options (for example many strikes and maturities, see create_options) on the same
+    # number_of_simulations paths. The payoffs are reduced in the workers, neither the paths nor the payoffs
+    # are sent back, only two sums per option and chunk. Set risk_neutral_flag for arbitrage-free prices.
+    # Return the OptionPrices of all paths.
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_options_serial(self, number_of_simulations, options):
+        self.parallel_flag = False
+        self.calibrate()
+        option_prices_per_chunk = self.run_chunks(self.simulation_finance_options,
+                                                  self.split_into_option_chunks(number_of_simulations, options))
+        with self.instrumentation.phase("reduction"):
+            return self.aggregate_option_prices(option_prices_per_chunk, options)
 
-        else:
-            # r before string converts normal string to raw string
-            path = r"C:\Users\Dule\Desktop\NAPREDNE TEHNIKE PROGRAMIRANJA\PROJEKAT\NTP" \
-                   r"\Execution Results\Finance\PythonFinanceParallel.txt"
-            out_file = open(path, "w")
-            for i in range(len(predictions)):
-                for j in range(len(predictions[i])):
-                    for k in range(len(predictions[i][j])):
-                        if k == 0:
-                            # Write a serial number of simulations at the beginning of a file.
-                            out_file.write(str(serial_number) + "," + " ")
-                        # A component in one row of the output file.
-                        out_file.write(str(predictions[i][j][k]))
-                        if k == (len(predictions[i][j]) - 1):
-                            out_file.write("\r\n")
-                            serial_number += 1
-                        else:
-                            out_file.write("," + " ")
-
-            out_file.close()
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_options_parallel(self, number_of_simulations, options):
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        option_prices_per_chunk = self.run_chunks(worker_context_method("simulation_finance_options"),
+                                                  self.split_into_option_chunks(number_of_simulations, options),
+                                                  worker_pool)
+        with self.instrumentation.phase("reduction"):
+            return self.aggregate_option_prices(option_prices_per_chunk, options)
+
+    # Writes the predictions of a serial simulation (one path per row) or of a parallel simulation
+    # (predictions per chunk) in blocks of paths, see PathExport.
+    # file_format "csv" is the text format of the Execution Results, "npy" is a binary array
+    # which can be opened memory-mapped.
+    def export_finance_file(self, predictions, path=None, file_format="csv"):
+        if file_format not in ("csv", "npy"):
+            raise ValueError("unknown file format {}, expected csv or npy".format(file_format))
+        if path is None:
+            if self.parallel_flag == False:
+                name = "PythonFinanceSerial"
+            else:
+                name = "PythonFinanceParallel"
+            if file_format == "csv":
+                path = os.path.join(self.export_directory, name + ".txt")
+            else:
+                path = os.path.join(self.export_directory, name + ".npy")
+        if file_format == "csv":
+            return export_paths_csv(predictions, path)
+        return export_paths_npy(predictions, path)
 
 
 if __name__ == "__main__":
@@ -179,21 +546,39 @@ if __name__ == "__main__":
                                                                        prediction_window_size_parallel, parallel_execution_time))
     monte_carlo_simulation_finance_parallel.export_finance_file(parallel_predictions)
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    # Streaming risk summary of many paths, the paths themselves are not kept.
+    number_of_simulations_risk = 1000000
+    monte_carlo_simulation_finance_parallel.vectorized_flag = True
+    risk_summary, risk_execution_time = monte_carlo_simulation_finance_parallel.mcs_finance_risk_parallel(
+        number_of_simulations_risk, prediction_window_size_parallel)
+    print("Stock market risk summary using the Monte Carlo simulation streaming parallel version")
+    print("Execution time(n = {}, p = {}, w = {}) = {} seconds".format(number_of_simulations_risk,
+                                                                       number_of_processes_parallel,
+                                                                       prediction_window_size_parallel, risk_execution_time))
+    print("Terminal price mean = {}, 95% VaR = {}, 95% CVaR = {}, median maximum drawdown = {}".format(
+        risk_summary.terminal_statistics.mean, risk_summary.calculate_value_at_risk(0.95),
+        risk_summary.calculate_conditional_value_at_risk(0.95), risk_summary.calculate_drawdown_quantile(0.5)))
+
+    # Risk-neutral prices of european, asian, barrier and lookback calls, several strikes and maturities
+    # on the same paths.
+    number_of_simulations_options = 1000000
+    monte_carlo_simulation_finance_parallel.interest_rate = 0.02
+    monte_carlo_simulation_finance_parallel.risk_neutral_flag = True
+    last_price = monte_carlo_simulation_finance_parallel.time_series.iloc[-1]
+    strikes = [round(last_price * moneyness, 2) for moneyness in (0.9, 1.0, 1.1)]
+    maturities = [21, 63]
+    options = create_options("european", "call", strikes, maturities) + \
+        create_options("asian", "call", strikes, maturities) + \
+        create_options("barrier", "call", strikes, maturities, barrier=round(last_price * 1.2, 2),
+                       barrier_type="up-and-out") + \
+        create_options("lookback", "call", strikes, maturities)
+    option_prices, options_execution_time = monte_carlo_simulation_finance_parallel.mcs_options_parallel(
+        number_of_simulations_options, options)
+    print("Option prices using the Monte Carlo simulation parallel version")
+    print("Execution time(n = {}, p = {}, options = {}) = {} seconds".format(number_of_simulations_options,
+                                                                             number_of_processes_parallel,
+                                                                             len(options), options_execution_time))
+    for option, price, standard_error in zip(options, option_prices.calculate_prices(),
+                                             option_prices.calculate_standard_errors()):
+        print("{} {} K = {} T = {} days: {} +- {}".format(option.option_type, option.payoff, option.strike,
+                                                           option.maturity, price, standard_error))
@@ -0,0 +1,256 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# The modules shared by all simulations are in the MonteCarloSimulationCommon directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MonteCarloSimulationCommon"))
+from ChunkScheduler import ChunkScheduler, split_into_chunk_sizes
+from Instrumentation import Instrumentation, calculate_execution_time
+from MarketDataCache import market_data_cache
+from RandomStreams import RandomStreams, create_generator
+from RiskSummary import NUMBER_OF_BINS, RiskSummary
+from WorkerContext import create_worker_context, worker_context_method
+from WorkerPool import get_worker_pool
+
+# Number of times the ridge on the diagonal of the covariance matrix is doubled before the calibration gives up,
+# from 1e-12 of the mean variance the last ridge is far larger than the covariance itself.
+MAXIMUM_RIDGE_ATTEMPTS = 64
+
+
+# Correlated simulation of a portfolio of stocks.
+# The Close series of all tickers are loaded once and aligned on their common dates, the drift of every stock and
+# the covariance of the daily log returns are estimated once, and the Cholesky factor L of the covariance
+# (covariance = L L^T) is cached until the returns change. Correlated daily log returns are
+# drift + L z with independent standard normal z, the prices of all stocks of a batch of paths are simulated
+# in one vectorized pass over an (assets, paths, days) array.
+# The portfolio holds the fraction weights[i] of its initial value in stock i (buy and hold), every chunk of paths
+# returns the RiskSummary of the portfolio values, so the distribution of the portfolio value
+# (percentile bands, value at risk, conditional value at risk, maximum drawdowns) comes back, not the paths.
+class MonteCarloSimulationPortfolio:
+    # Attributes the kernels need in the worker processes, see create_worker_context.
+    WORKER_CONTEXT_ATTRIBUTES = ("last_prices", "drifts", "cholesky_factor", "weights", "initial_value",
+                                 "portfolio_drift", "portfolio_sigma", "maximum_batch_elements", "number_of_bins")
+
+    def __init__(self, start_date, end_date, ticker_symbols, number_of_processes, weights=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.ticker_symbols = list(ticker_symbols)
+        # Fraction of the initial value invested in every stock, an equally weighted portfolio by default.
+        if weights is None:
+            weights = np.full(len(self.ticker_symbols), 1.0 / len(self.ticker_symbols))
+        self.weights = np.asarray(weights, dtype=float)
+        self.check_weights()
+        self.initial_value = 1.0
+        # Optional local CSV files with Date and Close columns per ticker symbol, see MarketDataCache.
+        self.csv_paths = {}
+        self.number_of_processes = number_of_processes
+        self.parallel_flag = False
+        # Time spent starting the worker pool in the last parallel simulation, 0 when the pool was warm.
+        self.pool_startup_time = 0.0
+        # (days, assets) DataFrames of the Close prices on the common dates and of the daily log returns.
+        self.time_series = None
+        self.data = None
+        # Calibrated model parameters, see calibrate().
+        self.last_prices = None
+        self.drifts = None
+        self.covariance = None
+        self.cholesky_factor = None
+        # Drift and volatility of the daily log return of the portfolio, they set the bins of the RiskSummary.
+        self.portfolio_drift = None
+        self.portfolio_sigma = None
+        # Master seed of the random streams, None takes a fresh seed from the operating system.
+        self.seed = None
+        # Seed of the last simulation, setting seed to it repeats the simulation.
+        self.last_seed = None
+        # Number of paths per chunk. Every chunk is one task with its own random stream, see ChunkScheduler
+        # and RandomStreams.
+        self.chunk_size = 10000
+        # Maximum number of elements of the (assets, paths, days) array of a batch, the number of paths per batch
+        # is chosen to stay below it, so memory does not depend on the number of paths.
+        self.maximum_batch_elements = 4000000
+        # Number of bins of the histograms of the RiskSummary.
+        self.number_of_bins = NUMBER_OF_BINS
+        # RiskSummary of the portfolio values of the last simulation.
+        self.risk_summary = None
+        # (chunk index, number of paths, execution time in seconds, process id) per chunk of the last simulation
+        self.chunk_times = []
+        # Phase timings, throughput and peak memory of the last simulation, see Instrumentation.
+        self.instrumentation = Instrumentation()
+        # Execution backend of mcs_portfolio_parallel ("process", "thread" or "serial"), see WorkerPool.
+        self.backend = "process"
+
+    # The Close series of every ticker comes from the local market data cache, the series are aligned on
+    # the dates all of them have.
+    def data_acquisition(self):
+        time_series = [market_data_cache.load(ticker_symbol, self.start_date, self.end_date,
+                                              self.csv_paths.get(ticker_symbol)).rename(ticker_symbol)
+                       for ticker_symbol in self.ticker_symbols]
+        self.time_series = pd.concat(time_series, axis=1, join="inner").dropna()
+
+    def calculate_periodic_daily_return(self):
+        self.data = np.log(self.time_series).diff().dropna()
+        # New returns invalidate the calibrated model parameters and the cached Cholesky factor.
+        self.cholesky_factor = None
+
+    def check_weights(self):
+        self.weights = np.asarray(self.weights, dtype=float)
+        if self.weights.shape != (len(self.ticker_symbols),):
+            raise ValueError("expected one weight per ticker, got {} weights for {} tickers".format(
+                self.weights.size, len(self.ticker_symbols)))
+
+    # Drift mean - variance / 2 of every stock, covariance of the daily log returns and its Cholesky factor.
+    # A covariance matrix which is only positive semi-definite (more stocks than days, linearly dependent
+    # stocks or constant prices) gets a small ridge on its diagonal, doubled until the factorization succeeds.
+    # The ridge starts at a positive floor, so a zero covariance matrix gets one too.
+    def calibrate(self):
+        returns = self.data.to_numpy()
+        if returns.shape[0] < 2:
+            raise ValueError("calibration needs at least 2 daily returns on common dates, got {}".format(
+                returns.shape[0]))
+        if not np.all(np.isfinite(returns)):
+            raise ValueError("the daily returns contain NaN or infinite values, check for non-positive prices")
+        self.last_prices = self.time_series.iloc[-1].to_numpy()
+        self.covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+        self.drifts = returns.mean(axis=0) - np.diag(self.covariance) / 2
+        minimum_ridge = 1e-12 * max(np.trace(self.covariance) / len(self.drifts), 1.0)
+        ridge = 0.0
+        for _ in range(MAXIMUM_RIDGE_ATTEMPTS):
+            try:
+                self.cholesky_factor = np.linalg.cholesky(self.covariance + ridge * np.eye(len(self.drifts)))
+                break
+            except np.linalg.LinAlgError:
+                ridge = max(2 * ridge, minimum_ridge)
+        else:
+            raise ValueError("the covariance matrix of the daily returns is not positive semi-definite")
+        self.calculate_portfolio_parameters()
+
+    # Drift and volatility of the portfolio with the current weights, recalculated before every simulation,
+    # so weights changed after the calibration are used.
+    def calculate_portfolio_parameters(self):
+        self.check_weights()
+        self.portfolio_drift = float(self.weights @ self.drifts)
+        self.portfolio_sigma = float(np.sqrt(self.weights @ self.covariance @ self.weights))
+
+    def is_calibrated(self):
+        return self.cholesky_factor is not None
+
+    # Vectorized pass over number_of_simulations paths: returns the (assets, paths, prediction window size + 1)
+    # array of the prices of every stock, day 0 is today's price.
+    def simulation_portfolio_prices(self, number_of_simulations, prediction_window_size, seed_sequence=None):
+        random_generator = create_generator(seed_sequence)
+        number_of_assets = len(self.drifts)
+        # Independent standard normals of every asset, path and day, correlated by the Cholesky factor.
+        normals = random_generator.standard_normal((number_of_assets, number_of_simulations * prediction_window_size))
+        log_returns = (self.cholesky_factor @ normals).reshape(number_of_assets, number_of_simulations,
+                                                              prediction_window_size)
+        del normals
+        log_returns += self.drifts[:, None, None]
+        prices = np.empty((number_of_assets, number_of_simulations, prediction_window_size + 1))
+        prices[:, :, 0] = 0
+        np.cumsum(log_returns, axis=2, out=prices[:, :, 1:])
+        np.exp(prices, out=prices)
+        prices *= self.last_prices[:, None, None]
+        return prices
+
+    # Value of the portfolio on every day of every path, a (paths, prediction window size + 1) array.
+    def calculate_portfolio_values(self, prices):
+        return self.initial_value * np.einsum("i,ijk->jk", self.weights / self.last_prices, prices)
+
+    def create_risk_summary(self, prediction_window_size):
+        return RiskSummary(self.initial_value, self.portfolio_drift, self.portfolio_sigma, prediction_window_size,
+                           self.number_of_bins)
+
+    # Simulates one chunk of paths in batches of at most maximum_batch_elements prices and returns the
+    # RiskSummary of the portfolio values. The random stream of the chunk continues from batch to batch.
+    def simulation_portfolio(self, number_of_simulations, prediction_window_size, seed_sequence=None):
+        random_generator = create_generator(seed_sequence)
+        risk_summary = self.create_risk_summary(prediction_window_size)
+        batch_size = max(1, self.maximum_batch_elements // (len(self.drifts) * (prediction_window_size + 1)))
+        for number_of_simulations_per_batch in split_into_chunk_sizes(number_of_simulations, batch_size):
+            prices = self.simulation_portfolio_prices(number_of_simulations_per_batch, prediction_window_size,
+                                                      random_generator)
+            risk_summary.update(self.calculate_portfolio_values(prices))
+        return risk_summary
+
+    # Returns one (number of paths, prediction window size, seed sequence) task per chunk of paths.
+    def split_into_chunks(self, number_of_simulations, prediction_window_size):
+        random_streams = RandomStreams(self.seed)
+        self.last_seed = random_streams.seed
+        return [(number_of_simulations_per_chunk, prediction_window_size, seed_sequence)
+                for number_of_simulations_per_chunk, seed_sequence
+                in random_streams.split(number_of_simulations, self.chunk_size)]
+
+    # The worker processes get only the attributes the kernels need, once per worker when the pool starts,
+    # the tasks carry only the number of paths and the random streams, see WorkerContext.
+    def create_worker_context(self):
+        return create_worker_context(self, self.WORKER_CONTEXT_ATTRIBUTES)
+
+    # Starts the worker pool of a parallel simulation. Calling it before mcs_portfolio_parallel keeps
+    # the pool startup out of the measured execution time.
+    def start_worker_pool(self):
+        self.parallel_flag = True
+        # Calibrate once in the parent process, the workers receive the Cholesky factor with the context.
+        if not self.is_calibrated():
+            self.calibrate()
+        self.calculate_portfolio_parameters()
+        with self.instrumentation.phase("pool_startup"):
+            worker_pool = get_worker_pool(self.number_of_processes, self.create_worker_context(), self.backend)
+        return worker_pool
+
+    # Runs the chunks in the worker pool, or one after another in this process without a worker pool.
+    def run_chunks(self, simulation, chunks, worker_pool=None):
+        chunk_scheduler = ChunkScheduler(worker_pool)
+        results = chunk_scheduler.run(simulation, chunks)
+        self.chunk_times = chunk_scheduler.chunk_times
+        self.instrumentation.record_chunks(chunk_scheduler)
+        return results
+
+    # The RiskSummary of every chunk is merged in the order of the chunks.
+    def aggregate_risk_summaries(self, risk_summaries, prediction_window_size):
+        self.risk_summary = self.create_risk_summary(prediction_window_size)
+        for risk_summary in risk_summaries:
+            self.risk_summary.merge(risk_summary)
+        return self.risk_summary
+
+    # Return the RiskSummary of the portfolio values of number_of_simulations paths of prediction_window_size days.
+    @calculate_execution_time
+    def mcs_portfolio_serial(self, number_of_simulations, prediction_window_size):
+        self.parallel_flag = False
+        if not self.is_calibrated():
+            self.calibrate()
+        self.calculate_portfolio_parameters()
+        risk_summaries = self.run_chunks(self.simulation_portfolio,
+                                         self.split_into_chunks(number_of_simulations, prediction_window_size))
+        with self.instrumentation.phase("reduction"):
+            return self.aggregate_risk_summaries(risk_summaries, prediction_window_size)
+
+    @calculate_execution_time
+    def mcs_portfolio_parallel(self, number_of_simulations, prediction_window_size):
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        risk_summaries = self.run_chunks(worker_context_method("simulation_portfolio"),
+                                         self.split_into_chunks(number_of_simulations, prediction_window_size),
+                                         worker_pool)
+        with self.instrumentation.phase("reduction"):
+            return self.aggregate_risk_summaries(risk_summaries, prediction_window_size)
+
+
+if __name__ == "__main__":
+    number_of_simulations = 100000
+    prediction_window_size = 100
+    number_of_processes = 4
+    monte_carlo_simulation_portfolio = MonteCarloSimulationPortfolio(
+        '2010-01-01', '2019-12-31', ['AAPL', 'MSFT', 'AMZN', 'GOOGL', 'JPM'], number_of_processes)
+    monte_carlo_simulation_portfolio.data_acquisition()
+    monte_carlo_simulation_portfolio.calculate_periodic_daily_return()
+    risk_summary, execution_time = monte_carlo_simulation_portfolio.mcs_portfolio_parallel(number_of_simulations,
+                                                                                          prediction_window_size)
+    print("Portfolio value predictions using the Monte Carlo simulation parallel version")
+    print("Execution time(n = {}, p = {}, w = {}, assets = {}) = {} seconds".format(
+        number_of_simulations, number_of_processes, prediction_window_size,
+        len(monte_carlo_simulation_portfolio.ticker_symbols), execution_time))
+    print("Portfolio value mean = {}, 95% VaR = {}, 95% CVaR = {}, median maximum drawdown = {}".format(
+        risk_summary.terminal_statistics.mean, risk_summary.calculate_value_at_risk(0.95),
+        risk_summary.calculate_conditional_value_at_risk(0.95), risk_summary.calculate_drawdown_quantile(0.5)))
@@ -0,0 +1,188 @@
+import math
+
+import numpy as np
+from scipy.stats import norm
+
+# Options priced on the paths of the finance simulation:
+#   european  payoff of the price at maturity,
+#   asian     payoff of the arithmetic average of the prices of days 1 ... maturity,
+#   barrier   european payoff which is knocked in or out when the price crosses the barrier by maturity,
+#   lookback  payoff of the maximum (call) or minimum (put) price against the strike, without a strike against
+#             the price at maturity (floating strike).
+OPTION_TYPES = ("european", "asian", "barrier", "lookback")
+PAYOFFS = ("call", "put")
+BARRIER_TYPES = ("up-and-out", "up-and-in", "down-and-out", "down-and-in")
+
+# Maturities are in trading days, the interest rate is an annual continuously compounded rate.
+TRADING_DAYS_PER_YEAR = 252
+
+
+# One option, maturity is a number of days of the simulated paths.
+class Option:
+    def __init__(self, option_type, payoff, strike, maturity, barrier=None, barrier_type=None):
+        if option_type not in OPTION_TYPES:
+            raise ValueError("unknown option type {}, expected one of {}".format(option_type, OPTION_TYPES))
+        if payoff not in PAYOFFS:
+            raise ValueError("unknown payoff {}, expected one of {}".format(payoff, PAYOFFS))
+        if maturity < 1:
+            raise ValueError("maturity must be at least 1 day, got {}".format(maturity))
+        if strike is None and option_type != "lookback":
+            raise ValueError("only lookback options have a floating strike")
+        if option_type == "barrier" and (barrier is None or barrier_type not in BARRIER_TYPES):
+            raise ValueError("barrier options need a barrier and a barrier type, one of {}".format(BARRIER_TYPES))
+        self.option_type = option_type
+        self.payoff = payoff
+        self.strike = strike
+        self.maturity = maturity
+        self.barrier = barrier
+        self.barrier_type = barrier_type
+
+    def to_dict(self):
+        return {"option_type": self.option_type, "payoff": self.payoff, "strike": self.strike,
+                "maturity": self.maturity, "barrier": self.barrier, "barrier_type": self.barrier_type}
+
+
+# Batch of options of one type and payoff, one option per strike and maturity.
+def create_options(option_type, payoff, strikes, maturities, barrier=None, barrier_type=None):
+    return [Option(option_type, payoff, strike, maturity, barrier, barrier_type)
+            for maturity in maturities for strike in strikes]
+
+
+def calculate_call_or_put(payoff, prices, strikes):
+    if payoff == "call":
+        return np.maximum(prices - strikes, 0)
+    return np.maximum(strikes - prices, 0)
+
+
+# Payoffs of every path of a (number of paths, prediction window size + 1) array of paths, column 0 is today's
+# price. The running averages, maxima and minima are calculated once per batch of paths for all options,
+# an option only picks the column of its maturity.
+class PathStatistics:
+    def __init__(self, paths):
+        self.paths = paths
+        self.cumulative_sums = None
+        self.running_maxima = None
+        self.running_minima = None
+
+    def get_average(self, maturity):
+        if self.cumulative_sums is None:
+            self.cumulative_sums = np.cumsum(self.paths[:, 1:], axis=1)
+        return self.cumulative_sums[:, maturity - 1] / maturity
+
+    def get_maximum(self, maturity):
+        if self.running_maxima is None:
+            self.running_maxima = np.maximum.accumulate(self.paths, axis=1)
+        return self.running_maxima[:, maturity]
+
+    def get_minimum(self, maturity):
+        if self.running_minima is None:
+            self.running_minima = np.minimum.accumulate(self.paths, axis=1)
+        return self.running_minima[:, maturity]
+
+    def calculate_payoffs(self, option):
+        prices = self.paths[:, option.maturity]
+        if option.option_type == "european":
+            return calculate_call_or_put(option.payoff, prices, option.strike)
+        if option.option_type == "asian":
+            return calculate_call_or_put(option.payoff, self.get_average(option.maturity), option.strike)
+        if option.option_type == "barrier":
+            payoffs = calculate_call_or_put(option.payoff, prices, option.strike)
+            if option.barrier_type.startswith("up"):
+                crossed = self.get_maximum(option.maturity) >= option.barrier
+            else:
+                crossed = self.get_minimum(option.maturity) <= option.barrier
+            if option.barrier_type.endswith("out"):
+                return np.where(crossed, 0.0, payoffs)
+            return np.where(crossed, payoffs, 0.0)
+        if option.strike is None:
+            if option.payoff == "call":
+                return prices - self.get_minimum(option.maturity)
+            return self.get_maximum(option.maturity) - prices
+        if option.payoff == "call":
+            return np.maximum(self.get_maximum(option.maturity) - option.strike, 0)
+        return np.maximum(option.strike - self.get_minimum(option.maturity), 0)
+
+
+# Monte Carlo prices of a batch of options on the same paths. Only the sums and the sums of squares of the
+# discounted payoffs of every option are kept, the paths are added in batches with update and thrown away,
+# so a worker sends back two floats per option instead of its paths. The sums of disjoint sets of paths merge
+# into the sums of all paths, see merge.
+class OptionPrices:
+    def __init__(self, options, interest_rate=0.0):
+        self.options = list(options)
+        self.interest_rate = interest_rate
+        self.number_of_simulations = 0
+        maturities = np.array([option.maturity for option in self.options], dtype=float)
+        self.discount_factors = np.exp(-interest_rate * maturities / TRADING_DAYS_PER_YEAR)
+        self.payoff_sums = np.zeros(len(self.options))
+        self.payoff_squared_sums = np.zeros(len(self.options))
+
+    # Adds a (number of paths, prediction window size + 1) array of paths, column 0 is today's price.
+    def update(self, paths):
+        paths = np.asarray(paths, dtype=float)
+        if paths.shape[0] == 0:
+            return self
+        path_statistics = PathStatistics(paths)
+        for index, option in enumerate(self.options):
+            payoffs = path_statistics.calculate_payoffs(option) * self.discount_factors[index]
+            self.payoff_sums[index] += payoffs.sum()
+            self.payoff_squared_sums[index] += np.dot(payoffs, payoffs)
+        self.number_of_simulations += paths.shape[0]
+        return self
+
+    def is_compatible(self, other):
+        return self.interest_rate == other.interest_rate and \
+               [option.to_dict() for option in self.options] == [option.to_dict() for option in other.options]
+
+    def merge(self, other):
+        if not self.is_compatible(other):
+            raise ValueError("prices of different options or interest rates can not be merged")
+        self.number_of_simulations += other.number_of_simulations
+        self.payoff_sums += other.payoff_sums
+        self.payoff_squared_sums += other.payoff_squared_sums
+        return self
+
+    def calculate_prices(self):
+        if self.number_of_simulations == 0:
+            return np.full(len(self.options), np.nan)
+        return self.payoff_sums / self.number_of_simulations
+
+    # Standard errors of the prices, from the sample variances of the discounted payoffs.
+    def calculate_standard_errors(self):
+        if self.number_of_simulations < 2:
+            return np.full(len(self.options), np.nan)
+        prices = self.calculate_prices()
+        variances = (self.payoff_squared_sums - self.number_of_simulations * prices * prices) / \
+            (self.number_of_simulations - 1)
+        return np.sqrt(np.maximum(variances, 0) / self.number_of_simulations)
+
+    # Lower and upper bounds of the normal confidence intervals of the prices.
+    def calculate_confidence_intervals(self, confidence_level=0.95):
+        prices = self.calculate_prices()
+        half_widths = norm.ppf((1 + confidence_level) / 2) * self.calculate_standard_errors()
+        return prices - half_widths, prices + half_widths
+
+    def to_dict(self, confidence_level=0.95):
+        lower_bounds, upper_bounds = self.calculate_confidence_intervals(confidence_level)
+        return {"number_of_simulations": self.number_of_simulations, "interest_rate": self.interest_rate,
+                "options": [dict(option.to_dict(), price=price, standard_error=standard_error,
+                                 confidence_interval_lower=lower_bound, confidence_interval_upper=upper_bound)
+                            for option, price, standard_error, lower_bound, upper_bound
+                            in zip(self.options, self.calculate_prices(), self.calculate_standard_errors(),
+                                   lower_bounds, upper_bounds)]}
+
+
+# Black-Scholes price of a european option, sigma is the daily volatility of the log returns.
+# A closed form to check the Monte Carlo prices of the GBM model against.
+def calculate_black_scholes_price(option, last_price, sigma, interest_rate=0.0):
+    if option.option_type != "european":
+        raise ValueError("the Black-Scholes formula prices european options only")
+    years = option.maturity / TRADING_DAYS_PER_YEAR
+    annual_sigma = sigma * math.sqrt(TRADING_DAYS_PER_YEAR)
+    d1 = (math.log(last_price / option.strike) + (interest_rate + annual_sigma ** 2 / 2) * years) / \
+        (annual_sigma * math.sqrt(years))
+    d2 = d1 - annual_sigma * math.sqrt(years)
+    discount_factor = math.exp(-interest_rate * years)
+    if option.payoff == "call":
+        return last_price * norm.cdf(d1) - option.strike * discount_factor * norm.cdf(d2)
+    return option.strike * discount_factor * norm.cdf(-d2) - last_price * norm.cdf(-d1)
@@ -0,0 +1,59 @@
+import numpy as np
+
+# Number of paths written at once.
+EXPORT_BLOCK_SIZE = 10000
+
+
+# Yields the predictions in blocks of at most number_of_paths paths, one row per path.
+# The predictions can be a 2-D array or list of paths (serial simulation) or a list of such
+# predictions per chunk (parallel simulation), the chunks are never joined into one array.
+def iterate_path_blocks(predictions, number_of_paths=EXPORT_BLOCK_SIZE):
+    if isinstance(predictions, np.ndarray) or len(predictions) == 0 or np.ndim(predictions[0]) < 2:
+        parts = [predictions]
+    else:
+        parts = predictions
+    for part in parts:
+        part = np.asarray(part, dtype=float)
+        for start in range(0, part.shape[0], number_of_paths):
+            yield part[start:start + number_of_paths]
+
+
+def count_paths(predictions):
+    number_of_paths = 0
+    prediction_size = 0
+    for block in iterate_path_blocks(predictions):
+        number_of_paths += block.shape[0]
+        prediction_size = block.shape[1]
+    return number_of_paths, prediction_size
+
+
+# Text format of the Execution Results: the serial number of a simulation followed by its prices,
+# "1, 73.41, 72.01, ...". A whole block of paths is formatted with one string formatting operation.
+# 12 significant digits are far below a cent for any price, fmt="%.17g" keeps every bit of a float64
+# at about twice the cost, the npy format keeps them at no formatting cost at all.
+def export_paths_csv(predictions, path, fmt="%.12g", line_terminator="\r\n"):
+    serial_number = 1
+    with open(path, "w", newline="") as out_file:
+        for block in iterate_path_blocks(predictions):
+            number_of_paths, prediction_size = block.shape
+            row_format = "%d, " + ", ".join([fmt] * prediction_size) + line_terminator
+            rows = np.empty((number_of_paths, prediction_size + 1))
+            rows[:, 0] = np.arange(serial_number, serial_number + number_of_paths)
+            rows[:, 1:] = block
+            out_file.write((row_format * number_of_paths) % tuple(rows.ravel().tolist()))
+            serial_number += number_of_paths
+    return path
+
+
+# Binary format for downstream tools: one (number of simulations, prediction window size + 1) float64 .npy
+# file, which can be opened memory-mapped with np.load(path, mmap_mode="r").
+def export_paths_npy(predictions, path):
+    number_of_paths, prediction_size = count_paths(predictions)
+    paths = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(number_of_paths, prediction_size))
+    offset = 0
+    for block in iterate_path_blocks(predictions):
+        paths[offset:offset + block.shape[0]] = block
+        offset += block.shape[0]
+    paths.flush()
+    del paths
+    return path
@@ -0,0 +1,167 @@
+import math
+import os
+import sys
+
+import numpy as np
+
+# The modules shared by all simulations are in the MonteCarloSimulationCommon directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MonteCarloSimulationCommon"))
+from RunningStatistics import RunningStatistics
+
+# Number of bins of the histograms of the log returns of every day and of the maximum drawdowns.
+NUMBER_OF_BINS = 256
+
+# The histogram of day t covers the log returns drift * t +- NUMBER_OF_STANDARD_DEVIATIONS * sigma * sqrt(t),
+# log returns outside the range are counted in an underflow and an overflow bin.
+NUMBER_OF_STANDARD_DEVIATIONS = 6
+
+PERCENTILES = (5, 25, 50, 75, 95)
+CONFIDENCE_LEVELS = (0.95, 0.99)
+
+
+# Quantile q of the values of a histogram with an underflow bin (counts[0]), number_of_bins bins
+# [lower + k * width, lower + (k + 1) * width) and an overflow bin (counts[-1]). The values are assumed uniform
+# within a bin, quantiles in the underflow or the overflow bin are clamped to the range of the histogram.
+def calculate_histogram_quantile(counts, lower, width, q):
+    cumulative_counts = np.cumsum(counts)
+    target = q * cumulative_counts[-1]
+    bin_index = int(np.searchsorted(cumulative_counts, target, side="left"))
+    if bin_index == 0:
+        return lower
+    number_of_bins = len(counts) - 2
+    if bin_index > number_of_bins:
+        return lower + number_of_bins * width
+    fraction = (target - cumulative_counts[bin_index - 1]) / counts[bin_index]
+    return lower + (bin_index - 1 + fraction) * width
+
+
+# Streaming summary of the paths of the finance simulation: the statistics of the terminal prices,
+# a histogram of the log returns of every day (percentile bands, value at risk and conditional value at risk)
+# and a histogram and the statistics of the maximum drawdowns of the paths.
+# Memory does not depend on the number of paths, the paths are added in batches with update and thrown away.
+# The histograms have the same bins in every process (they only depend on the model parameters), so the
+# summaries of the chunks merge into the summary of all paths, see merge. Only the summaries of the chunks
+# are sent back to the parent process, not the paths.
+class RiskSummary:
+    def __init__(self, last_price, drift, sigma, prediction_window_size, number_of_bins=NUMBER_OF_BINS):
+        self.last_price = float(last_price)
+        self.drift = float(drift)
+        self.sigma = float(sigma)
+        self.prediction_window_size = prediction_window_size
+        self.number_of_bins = number_of_bins
+        self.number_of_simulations = 0
+        # Statistics of the prices at the end of the prediction window.
+        self.terminal_statistics = RunningStatistics()
+        # Statistics of the maximum drawdowns, the largest fall from a peak as a fraction of the peak.
+        self.drawdown_statistics = RunningStatistics()
+        # Row t - 1 is the histogram of the log returns log(price of day t / today's price) of day t,
+        # day 0 is today's price for every path.
+        days = np.arange(1, prediction_window_size + 1)
+        half_widths = np.maximum(NUMBER_OF_STANDARD_DEVIATIONS * self.sigma * np.sqrt(days), 1e-12)
+        self.lower_bounds = self.drift * days - half_widths
+        self.bin_widths = 2 * half_widths / number_of_bins
+        self.return_counts = np.zeros((prediction_window_size, number_of_bins + 2), dtype=np.int64)
+        # Histogram of the maximum drawdowns on [0, 1], the underflow and the overflow bin stay empty.
+        self.drawdown_counts = np.zeros(number_of_bins + 2, dtype=np.int64)
+
+    # Adds a (number of paths, prediction window size + 1) array of paths, column 0 is today's price.
+    def update(self, paths):
+        paths = np.asarray(paths, dtype=float)
+        if paths.shape[0] == 0:
+            return self
+        self.number_of_simulations += paths.shape[0]
+        self.terminal_statistics.update_batch(paths[:, -1])
+        log_returns = np.log(paths[:, 1:] / paths[:, :1])
+        bin_indices = np.floor((log_returns - self.lower_bounds) / self.bin_widths)
+        np.clip(bin_indices + 1, 0, self.number_of_bins + 1, out=bin_indices)
+        # One bincount for all days: the bins of day t are at t * (number of bins + 2).
+        bin_indices += np.arange(self.prediction_window_size) * (self.number_of_bins + 2)
+        self.return_counts += np.bincount(bin_indices.astype(np.int64).ravel(),
+                                          minlength=self.return_counts.size).reshape(self.return_counts.shape)
+        maximum_drawdowns = np.max(1 - paths / np.maximum.accumulate(paths, axis=1), axis=1)
+        self.drawdown_statistics.update_batch(maximum_drawdowns)
+        drawdown_bin_indices = np.minimum((maximum_drawdowns * self.number_of_bins).astype(np.int64),
+                                          self.number_of_bins - 1) + 1
+        self.drawdown_counts += np.bincount(drawdown_bin_indices, minlength=self.drawdown_counts.size)
+        return self
+
+    def is_compatible(self, other):
+        return (self.last_price, self.drift, self.sigma, self.prediction_window_size, self.number_of_bins) == \
+               (other.last_price, other.drift, other.sigma, other.prediction_window_size, other.number_of_bins)
+
+    def merge(self, other):
+        if not self.is_compatible(other):
+            raise ValueError("risk summaries of different model parameters or bins can not be merged")
+        self.number_of_simulations += other.number_of_simulations
+        self.terminal_statistics.merge(other.terminal_statistics)
+        self.drawdown_statistics.merge(other.drawdown_statistics)
+        self.return_counts += other.return_counts
+        self.drawdown_counts += other.drawdown_counts
+        return self
+
+    # Price of day (1 ... prediction window size) below which a fraction q of the paths lie.
+    def calculate_price_quantile(self, day, q):
+        if day == 0:
+            return self.last_price
+        log_return = calculate_histogram_quantile(self.return_counts[day - 1], self.lower_bounds[day - 1],
+                                                  self.bin_widths[day - 1], q)
+        return self.last_price * math.exp(log_return)
+
+    # Returns a (number of percentiles, prediction window size + 1) array, row i is the band of percentiles[i].
+    def calculate_percentile_bands(self, percentiles=PERCENTILES):
+        return np.array([[self.calculate_price_quantile(day, percentile / 100)
+                          for day in range(self.prediction_window_size + 1)] for percentile in percentiles])
+
+    # Value at risk at confidence_level of one share at the end of the prediction window: the loss
+    # today's price - terminal price that is exceeded with probability 1 - confidence_level.
+    def calculate_value_at_risk(self, confidence_level=0.95):
+        return self.last_price - self.calculate_price_quantile(self.prediction_window_size, 1 - confidence_level)
+
+    # Conditional value at risk (expected shortfall): the mean loss of the paths whose loss is at least
+    # the value at risk. The terminal prices are taken at the middle of their part of a bin.
+    def calculate_conditional_value_at_risk(self, confidence_level=0.95):
+        counts = self.return_counts[-1]
+        lower = self.lower_bounds[-1]
+        width = self.bin_widths[-1]
+        quantile = calculate_histogram_quantile(counts, lower, width, 1 - confidence_level)
+        tail_count = (1 - confidence_level) * counts.sum()
+        if tail_count <= 0:
+            return self.calculate_value_at_risk(confidence_level)
+        # The underflow bin is taken at the lower bound of the histogram, bin k >= 1 is
+        # [lower + (k - 1) * width, lower + k * width).
+        remaining_count = tail_count
+        tail_sum = 0.0
+        for bin_index, count in enumerate(counts):
+            if remaining_count <= 0:
+                break
+            if bin_index == 0:
+                log_return = lower
+            else:
+                bin_lower_bound = lower + (bin_index - 1) * width
+                log_return = (bin_lower_bound + min(bin_lower_bound + width, quantile)) / 2
+            count_in_tail = min(count, remaining_count)
+            tail_sum += count_in_tail * self.last_price * math.exp(log_return)
+            remaining_count -= count_in_tail
+        return self.last_price - tail_sum / (tail_count - remaining_count)
+
+    # Maximum drawdown below which a fraction q of the paths lie.
+    def calculate_drawdown_quantile(self, q):
+        return calculate_histogram_quantile(self.drawdown_counts, 0.0, 1.0 / self.number_of_bins, q)
+
+    def to_dict(self, percentiles=PERCENTILES, confidence_levels=CONFIDENCE_LEVELS):
+        return {"number_of_simulations": self.number_of_simulations,
+                "prediction_window_size": self.prediction_window_size,
+                "last_price": self.last_price,
+                "terminal_price_mean": self.terminal_statistics.mean,
+                "terminal_price_variance": self.terminal_statistics.calculate_variance(),
+                "terminal_price_standard_error": self.terminal_statistics.calculate_standard_error(),
+                "percentile_bands": {str(percentile): list(band) for percentile, band
+                                     in zip(percentiles, self.calculate_percentile_bands(percentiles))},
+                "value_at_risk": {str(confidence_level): self.calculate_value_at_risk(confidence_level)
+                                  for confidence_level in confidence_levels},
+                "conditional_value_at_risk": {str(confidence_level):
+                                                  self.calculate_conditional_value_at_risk(confidence_level)
+                                              for confidence_level in confidence_levels},
+                "maximum_drawdown_mean": self.drawdown_statistics.mean,
+                "maximum_drawdown_percentiles": {str(percentile): self.calculate_drawdown_quantile(percentile / 100)
+                                                 for percentile in percentiles}}
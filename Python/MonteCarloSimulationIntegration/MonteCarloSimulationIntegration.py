@@ -1,31 +1,171 @@
-import random
-import time
+import os
+import sys
 import numpy as np
 import math
-from multiprocessing import Pool
 
+# The modules shared by all simulations are in the MonteCarloSimulationCommon directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MonteCarloSimulationCommon"))
+from AdaptivePrecision import AdaptivePrecision
+from ChunkScheduler import ChunkScheduler
+from Instrumentation import Instrumentation, calculate_execution_time
+from QuasiRandom import HaltonSequence, PseudoRandomPoints, QuasiRandomPoints, calculate_replicate_standard_error, \
+    split_into_replicates
+from RandomStreams import RandomStreams, create_python_random
+from ResultCache import cached_simulation, result_cache
+from RunningStatistics import RunningStatistics, create_constant_statistics
+from TraceWriter import TraceWriter
+from WorkerContext import create_worker_context, worker_context_method
+from WorkerPool import get_worker_pool
 
-def calculate_execution_time(function):
-    def calculate_duration(*args, **kwargs):
-        start_time = time.time()
-        executing_function = function(*args, **kwargs)
-        end_time = time.time()
-        execution_time = round(end_time - start_time, 7)
-        return executing_function, execution_time
 
-    return calculate_duration
+# The default integrand f(x) = 2x. Integrands take and return NumPy arrays, so the vectorized kernel can
+# evaluate a whole batch of points in one call. An integrand must be a module level function
+# (not a lambda), so that it can be sent to the worker processes.
+def linear_function(x):
+    return 2 * x
+
+
+# A d-dimensional integrand takes a (number of points, d) array and returns one value per point.
+# f(x) = x_1^2 + ... + x_d^2, its integral over the unit hypercube [0, 1]^d is d / 3.
+def sum_of_squares_function(x):
+    return np.sum(x * x, axis=1)
+
+
+# Number of points of the probe of a d-dimensional integrand, see create_probe_points.
+NUMBER_OF_PROBE_POINTS = 100000
+# Safety margin of the probed envelope of a d-dimensional integrand, a fraction of its height, see get_envelope.
+ENVELOPE_MARGIN = 0.1
+
+
+# Points where an integrand is probed for its envelope and the control variate coefficient.
+# An interval is split into slices of slice_size. A grid of a d-dimensional hyper-rectangle would have
+# slices^d points, so it is probed with the first NUMBER_OF_PROBE_POINTS points of the Halton sequence
+# instead. The probed envelope of a d-dimensional integrand is an estimate, it is widened by a safety margin,
+# see MonteCarloSimulationIntegration.get_envelope.
+def create_probe_points(lower_bound, upper_bound, slice_size):
+    lower_bound = np.atleast_1d(np.asarray(lower_bound, dtype=float))
+    upper_bound = np.atleast_1d(np.asarray(upper_bound, dtype=float))
+    if lower_bound.shape[0] == 1:
+        # The area under the graph of a function can be found by adding slices that approach zero in width.
+        number_of_slices = max(1, int(round((upper_bound[0] - lower_bound[0]) / slice_size)))
+        return np.linspace(lower_bound[0], upper_bound[0], number_of_slices + 1)
+    halton_sequence = HaltonSequence(lower_bound.shape[0], scramble=False)
+    return lower_bound + (upper_bound - lower_bound) * halton_sequence.random(0, NUMBER_OF_PROBE_POINTS)
+
+
+# The envelope of an integrand (its minimum and maximum on the domain) is probed once per
+# (integrand, lower bound, upper bound, slice size) and reused by every later simulation.
+# The bounds of a d-dimensional domain are tuples.
+class BoundsCache:
+    def __init__(self):
+        self.bounds = {}
+
+    def get_bounds(self, integrand, lower_bound, upper_bound, slice_size):
+        key = (integrand, lower_bound, upper_bound, slice_size)
+        if key not in self.bounds:
+            x = create_probe_points(lower_bound, upper_bound, slice_size)
+            y = np.asarray(integrand(x), dtype=float)
+            self.bounds[key] = (float(y.min()), float(y.max()))
+        return self.bounds[key]
+
+    def clear(self):
+        self.bounds.clear()
+
+
+bounds_cache = BoundsCache()
 
 
 class MonteCarloSimulationIntegration:
+    # Attributes the kernels need in the worker processes, see create_worker_context.
+    WORKER_CONTEXT_ATTRIBUTES = ("experiment_flag", "vectorized_flag", "batch_size", "parallel_flag", "trace_directory",
+                                 "integrand", "LOWER_BOUND", "UPPER_BOUND", "SLICE_SIZE", "bounds", "estimator",
+                                 "number_of_strata", "control_function", "control_integral", "control_coefficient",
+                                 "importance_density", "sampler", "chunk_size")
+    # Estimators of the integral, see select_estimator.
+    ESTIMATORS = ("hit_or_miss", "mean_value", "antithetic", "stratified", "control_variate", "importance")
+    # Samplers of the points, see QuasiRandom, and the estimators which can use the quasi-random samplers.
+    SAMPLERS = ("pseudo_random", "sobol", "halton")
+    QUASI_RANDOM_ESTIMATORS = ("hit_or_miss", "mean_value", "antithetic", "control_variate")
+    # Attributes the result of a simulation depends on and attributes a cached result restores, see cached_simulation.
+    CACHE_ATTRIBUTES = ("vectorized_flag", "batch_size", "integrand", "LOWER_BOUND", "UPPER_BOUND", "SLICE_SIZE",
+                        "estimator", "number_of_strata", "control_function", "control_integral", "importance_density",
+                        "sampler", "chunk_size", "number_of_replicates", "round_size", "seed")
+    CACHE_STATE_ATTRIBUTES = ("last_seed", "statistics", "number_of_simulations", "replicate_of_chunk",
+                              "replicate_estimates", "adaptive_precision")
+
     def __init__(self, number_of_processes):
         self.number_of_processes = number_of_processes
         self.parallel_flag = False
+        # Time spent starting the worker pool in the last parallel simulation, 0 when the pool was warm.
+        self.pool_startup_time = 0.0
         self.experiment_flag = False
-        # Upper and Lower Bounds of Integral.
+        # Upper and Lower Bounds of Integral. Sequences of d bounds integrate over the d-dimensional
+        # hyper-rectangle [LOWER_BOUND[0], UPPER_BOUND[0]] x ... x [LOWER_BOUND[d - 1], UPPER_BOUND[d - 1]],
+        # the integrand then takes (number of points, d) arrays, see sum_of_squares_function.
         self.LOWER_BOUND = 1
         self.UPPER_BOUND = 2
         # The area under the graph of a function can be found by adding slices that approach zero in width.
         self.SLICE_SIZE = 0.01
+        # The function f(x) to be integrated, see linear_function.
+        self.integrand = linear_function
+        # (key, (f_min, f_max)) of the last envelope taken from the bounds cache. It is sent to the worker
+        # processes together with the object, so the workers do not probe the integrand again.
+        self.bounds = None
+        self.vectorized_flag = False
+        # Number of points the vectorized kernel draws at once.
+        self.batch_size = 1000000
+        # Master seed of the random streams, None takes a fresh seed from the operating system.
+        self.seed = None
+        # Seed of the last simulation, setting seed to it repeats the simulation.
+        self.last_seed = None
+        # Number of points per chunk. Every chunk is one task with its own random stream, see ChunkScheduler
+        # and RandomStreams.
+        self.chunk_size = 10000
+        # (chunk index, number of points, execution time in seconds, process id) per chunk of the last simulation
+        self.chunk_times = []
+        # Phase timings, throughput and peak memory of the last simulation, see Instrumentation.
+        self.instrumentation = Instrumentation()
+        # Execution backend of mcs_integration_parallel ("process", "thread" or "serial"), see WorkerPool.
+        self.backend = "process"
+        # Directory of the binary traces of the sampled points, see TraceWriter.
+        self.trace_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                            "Execution Results", "Integration")
+        # Merged trace of the last simulation.
+        self.trace_path = None
+        # Estimator of the integral, one of ESTIMATORS.
+        self.estimator = "hit_or_miss"
+        # Number of equal slices of [LOWER_BOUND, UPPER_BOUND] of the stratified estimator.
+        self.number_of_strata = 100
+        # Control function g(x) of the control variate estimator and its integral on [LOWER_BOUND, UPPER_BOUND].
+        # None uses g(x) = x, whose integral is known.
+        self.control_function = None
+        self.control_integral = None
+        # (key, coefficient) of the control variate estimator, see get_control_coefficient.
+        self.control_coefficient = None
+        # Density of the points of the importance sampling estimator, an object with pdf(x) and
+        # rvs(size, random_state) methods like a frozen scipy.stats distribution, for example
+        # scipy.stats.uniform(loc=1, scale=1). It should be large where |f(x)| is large.
+        self.importance_density = None
+        # Sampler of the points, one of SAMPLERS. The quasi-random samplers (scrambled Sobol and Halton sequences)
+        # split the points into number_of_replicates independently scrambled replicates, see QuasiRandom.
+        self.sampler = "pseudo_random"
+        self.number_of_replicates = 16
+        # Replicate of every chunk and integral of every replicate of the last quasi-random simulation.
+        self.replicate_of_chunk = []
+        self.replicate_estimates = []
+        # RunningStatistics of the samples and number of points of the last simulation,
+        # see calculate_variance_per_point.
+        self.statistics = None
+        self.number_of_simulations = 0
+        # Number of points per round of the adaptive precision mode, see AdaptivePrecision.
+        self.round_size = 100000
+        # AdaptivePrecision of the last adaptive simulation, it keeps the statistics and the number of rounds.
+        self.adaptive_precision = None
+        # Whether repeated runs with the same configuration and seed are read from the result cache, see
+        # cached_simulation, whether the last run was, and the cache.
+        self.cache_flag = False
+        self.cached_flag = False
+        self.result_cache = result_cache
 
     # The function f(x) to be integrated is called the integrand.
     # The function we are integrating must be non-negative continuous function between lower bound and upper bound
@@ -35,117 +175,545 @@ class MonteCarloSimulationIntegration:
     # Continuous function: is a function with no holes, jumps or vertical asymptotes
     # (where the function heads up/down towards infinity). A vertical asymptote between lower bound and
     # upper bound affects the definite integral.
+    # The kernels also accept functions with negative values (signed functions).
     def function(self, x):
-        return 2*x
+        return self.integrand(x)
 
-    def simulation_integration(self, number_of_simulations):
-        if self.experiment_flag == True:
-            # Points under the graph of a function.
-            below = 0
-            lower_bound_interval = self.LOWER_BOUND
-            upper_bound_interval = self.UPPER_BOUND
-            # Define the interval between the lower and upper bound.
-            x = []
-            # Function Values
-            y = []
-            # Maximum of the function f(x) on the interval[lower_bound, upper_bound]
-            f_max = self.function(self.LOWER_BOUND)
-
-            while lower_bound_interval < upper_bound_interval:
-                x.append(lower_bound_interval)
-                t = self.function(lower_bound_interval)
-                y.append(t)
-                if t > f_max:
-                    f_max = t
-                lower_bound_interval += self.SLICE_SIZE
+    # Lower and upper corners of the domain of integration as float arrays of d elements.
+    def get_domain(self):
+        lower_bound = np.atleast_1d(np.asarray(self.LOWER_BOUND, dtype=float))
+        upper_bound = np.atleast_1d(np.asarray(self.UPPER_BOUND, dtype=float))
+        if lower_bound.ndim != 1 or lower_bound.shape != upper_bound.shape:
+            raise ValueError("the lower and the upper bounds must be numbers or sequences of the same length")
+        return lower_bound, upper_bound
 
-            for _ in range(number_of_simulations):
-                x_rand = self.LOWER_BOUND + (self.UPPER_BOUND - self.LOWER_BOUND) * random.random()
-                y_rand = 0 + f_max * random.random()
-                if y_rand < self.function(x_rand):
-                    below = below + 1
-            # Rectangle area that surrounds the area under the graph of a function.
-            a = self.UPPER_BOUND - self.LOWER_BOUND
-            b = f_max - 0
-            rectangle_area = a * b
-            # bellow = Points under the graph of a function.
-            # number_of_simulations = Total number of points = Points inside rectangle
-            proportion = below / number_of_simulations
-            integral = proportion * rectangle_area
-            return integral
+    def get_dimension(self):
+        return self.get_domain()[0].shape[0]
+
+    # Length of the interval, area of the rectangle, volume of the hyper-rectangle.
+    def calculate_volume(self):
+        lower_bound, upper_bound = self.get_domain()
+        return float(np.prod(upper_bound - lower_bound))
+
+    # The bounds as a hashable key, sequences become tuples.
+    def get_domain_key(self):
+        if np.ndim(self.LOWER_BOUND) == 0 and np.ndim(self.UPPER_BOUND) == 0:
+            return self.LOWER_BOUND, self.UPPER_BOUND
+        lower_bound, upper_bound = self.get_domain()
+        return tuple(lower_bound.tolist()), tuple(upper_bound.tolist())
+
+    # Maps uniform points u on [0, 1)^d, a (d, number of points) array, to the domain. In one dimension the
+    # result is an array of x values, otherwise a (number of points, d) array, the argument of the integrand.
+    # The mirror image of u maps to lower bound + upper bound - x.
+    def scale_points(self, u, mirror=False):
+        lower_bound, upper_bound = self.get_domain()
+        if lower_bound.shape[0] == 1:
+            lower_bound, upper_bound, u = lower_bound[0], upper_bound[0], u[0]
         else:
-            if self.parallel_flag == False:
-                # r before string converts normal string to raw string
-                path = r"C:\Users\Dule\Desktop\NAPREDNE TEHNIKE PROGRAMIRANJA\PROJEKAT\NTP" \
-                       r"\Execution Results\Integration\PythonIntegrationSerial.txt"
-            else:
-                # r before string converts normal string to raw string
-                path = r"C:\Users\Dule\Desktop\NAPREDNE TEHNIKE PROGRAMIRANJA\PROJEKAT\NTP" \
-                       r"\Execution Results\Integration\PythonIntegrationParallel.txt"
-            out_file = open(path, "w")
-
-            # Points under the graph of a function.
-            below = 0
-            lower_bound_interval = self.LOWER_BOUND
-            upper_bound_interval = self.UPPER_BOUND
-            # Define the interval between the lower and upper bound.
-            x = []
-            # Function Values
-            y = []
-            # Maximum of the function f(x) on the interval[lower_bound, upper_bound]
-            f_max = self.function(self.LOWER_BOUND)
-
-            while lower_bound_interval < upper_bound_interval:
-                x.append(lower_bound_interval)
-                t = self.function(lower_bound_interval)
-                y.append(t)
-                if t > f_max:
-                    f_max = t
-                lower_bound_interval += self.SLICE_SIZE
+            u = u.T
+        if mirror:
+            return upper_bound - (upper_bound - lower_bound) * u
+        return lower_bound + (upper_bound - lower_bound) * u
+
+    # Minimum and maximum of the function f(x) on the interval[lower_bound, upper_bound]
+    def get_bounds(self):
+        key = (self.integrand,) + self.get_domain_key() + (self.SLICE_SIZE,)
+        if self.bounds is None or self.bounds[0] != key:
+            self.bounds = (key, bounds_cache.get_bounds(*key))
+        return self.bounds[1]
+
+    # Rectangle that surrounds the area between the graph of a function and the x-axis, (lower y, upper y).
+    # The envelope of a d-dimensional integrand is probed on scattered points (see create_probe_points) and can
+    # miss its extremes, so the sides the function sets are moved out by ENVELOPE_MARGIN of the height.
+    # count_points_vectorized raises when a sample still falls outside, the estimate would be biased.
+    def get_envelope(self):
+        f_min, f_max = self.get_bounds()
+        y_lower = min(f_min, 0)
+        y_upper = max(f_max, 0)
+        if self.get_dimension() > 1:
+            margin = ENVELOPE_MARGIN * (y_upper - y_lower)
+            if f_min < 0:
+                y_lower -= margin
+            if f_max > 0:
+                y_upper += margin
+        return y_lower, y_upper
+
+    # The control variate estimator subtracts coefficient * (g(x) - mean of g) from every sample. The best
+    # coefficient is cov(f, g) / var(g), it is probed once on the slices of the interval (like the bounds) and
+    # not estimated from the samples, so the samples stay independent and the estimator stays unbiased.
+    def get_control_coefficient(self):
+        key = (self.integrand, self.control_function) + self.get_domain_key() + (self.SLICE_SIZE,)
+        if self.control_coefficient is None or self.control_coefficient[0] != key:
+            lower_bound, upper_bound = self.get_domain()
+            x = create_probe_points(lower_bound, upper_bound, self.SLICE_SIZE)
+            f = np.asarray(self.integrand(x), dtype=float)
+            g = np.asarray(self.calculate_control_function(x), dtype=float)
+            variance = g.var()
+            coefficient = float(np.mean((f - f.mean()) * (g - g.mean())) / variance) if variance > 0 else 0.0
+            self.control_coefficient = (key, coefficient)
+        return self.control_coefficient[1]
+
+    # The default control function is g(x) = x in one dimension and g(x) = x_1 + ... + x_d otherwise.
+    def calculate_control_function(self, x):
+        if self.control_function is None:
+            if np.ndim(x) == 2:
+                return np.sum(x, axis=1)
+            return x
+        return self.control_function(x)
+
+    def get_control_integral(self):
+        if self.control_function is None:
+            lower_bound, upper_bound = self.get_domain()
+            if lower_bound.shape[0] == 1:
+                return float(upper_bound[0] ** 2 - lower_bound[0] ** 2) / 2
+            return self.calculate_volume() * float(np.sum((lower_bound + upper_bound) / 2))
+        if self.control_integral is None:
+            raise ValueError("the control variate estimator needs the integral of the control function")
+        return self.control_integral
+
+    # Values computed once in the parent process and sent to the worker processes with the context.
+    def prepare_estimator(self):
+        if self.estimator not in self.ESTIMATORS:
+            raise ValueError("unknown estimator {}, expected one of {}".format(self.estimator, self.ESTIMATORS))
+        if self.sampler not in self.SAMPLERS:
+            raise ValueError("unknown sampler {}, expected one of {}".format(self.sampler, self.SAMPLERS))
+        if self.sampler != "pseudo_random" and self.estimator not in self.QUASI_RANDOM_ESTIMATORS:
+            raise ValueError("the {} estimator needs the pseudo_random sampler".format(self.estimator))
+        if self.estimator == "hit_or_miss":
+            self.get_bounds()
+        elif self.estimator == "control_variate":
+            self.get_control_integral()
+            self.get_control_coefficient()
+        elif self.estimator == "importance" and self.importance_density is None:
+            raise ValueError("the importance sampling estimator needs an importance density")
+
+    # A run which writes a trace is not cached, the trace would not be written again.
+    def is_result_cacheable(self):
+        return self.cache_flag == True and self.seed is not None and self.is_trace_enabled() == False
+
+    def get_trace_writer(self):
+        if self.parallel_flag == False:
+            return TraceWriter(self.trace_directory, "PythonIntegrationSerial")
+        return TraceWriter(self.trace_directory, "PythonIntegrationParallel")
 
+    # Every worker writes its own shard of the trace, shards of an earlier simulation are removed.
+    # Only the hit-or-miss estimator of a 1-D integral samples points of the plane, so only it writes a trace.
+    def is_trace_enabled(self):
+        return self.experiment_flag == False and self.estimator == "hit_or_miss" and self.get_dimension() == 1
+
+    def start_trace(self):
+        if self.is_trace_enabled():
+            with self.instrumentation.phase("io"):
+                self.get_trace_writer().remove_shards()
+
+    def finish_trace(self):
+        if self.is_trace_enabled():
+            with self.instrumentation.phase("io"):
+                self.trace_path = self.get_trace_writer().merge()
+
+    # Exports the merged trace as the text file the Pharo visualization reads.
+    def export_trace_file(self):
+        trace_writer = self.get_trace_writer()
+        return trace_writer.export_text(os.path.join(self.trace_directory, trace_writer.name + ".txt"),
+                                        scale=1, fmt="%.2f")
+
+    # Counts the points under the graph of the function, returns (points between the x-axis and the graph
+    # above the axis, points between the x-axis and the graph below the axis, rectangle area).
+    # Functions with negative values are supported too, like in count_points_vectorized. The points are drawn
+    # one by one, so the integral must be 1-dimensional, see count_points_vectorized.
+    def count_points(self, number_of_simulations, seed_sequence=None, chunk_index=0):
+        lower_bound, upper_bound = self.get_domain()
+        if lower_bound.shape[0] != 1:
+            raise ValueError("count_points integrates 1-dimensional integrals only, got {} dimensions, "
+                             "use count_points_vectorized".format(lower_bound.shape[0]))
+        lower_bound, upper_bound = float(lower_bound[0]), float(upper_bound[0])
+        random_generator = create_python_random(seed_sequence)
+        # Rectangle that surrounds the area between the graph of a function and the x-axis.
+        y_lower, y_upper = self.get_envelope()
+        # Points between the x-axis and the graph of a function, above and below the axis.
+        above_axis = 0
+        below_axis = 0
+        if self.experiment_flag == True:
             for _ in range(number_of_simulations):
-                x_rand = self.LOWER_BOUND + (self.UPPER_BOUND - self.LOWER_BOUND) * random.random()
-                y_rand = 0 + f_max * random.random()
-                out_file.write(str(round(x_rand, 2)) + ' ' + str(round(y_rand, 2)) + '\n')
-                if y_rand < self.function(x_rand):
-                    below = below + 1
-            # Rectangle area that surrounds the area under the graph of a function.
-            a = self.UPPER_BOUND - self.LOWER_BOUND
-            b = f_max - 0
-            rectangle_area = a * b
-            # bellow = Points under the graph of a function.
-            # number_of_simulations = Total number of points = Points inside rectangle
-            proportion = below / number_of_simulations
-            integral = proportion * rectangle_area
-            out_file.close()
-            return integral
+                x_rand = lower_bound + (upper_bound - lower_bound) * random_generator.random()
+                y_rand = y_lower + (y_upper - y_lower) * random_generator.random()
+                f = self.function(x_rand)
+                if 0 <= y_rand < f:
+                    above_axis = above_axis + 1
+                elif f < y_rand < 0:
+                    below_axis = below_axis + 1
+        else:
+            trace = self.get_trace_writer().open_chunk(chunk_index)
+            remaining = number_of_simulations
+            while remaining > 0:
+                # The points of a batch are collected in lists and written to the trace at once.
+                current_batch_size = min(max(1, self.batch_size), remaining)
+                x_values = []
+                y_values = []
+                for _ in range(current_batch_size):
+                    x_rand = lower_bound + (upper_bound - lower_bound) * random_generator.random()
+                    y_rand = y_lower + (y_upper - y_lower) * random_generator.random()
+                    x_values.append(x_rand)
+                    y_values.append(y_rand)
+                    f = self.function(x_rand)
+                    if 0 <= y_rand < f:
+                        above_axis = above_axis + 1
+                    elif f < y_rand < 0:
+                        below_axis = below_axis + 1
+                trace.write(x_values, y_values)
+                remaining -= current_batch_size
+            trace.close()
+        rectangle_area = (upper_bound - lower_bound) * (y_upper - y_lower)
+        return above_axis, below_axis, rectangle_area
 
+    # Vectorized version of count_points. The points are drawn in batches of batch_size points and the
+    # integrand is evaluated once per batch. Functions with negative values are supported too, the rectangle
+    # surrounds the area between the graph of the function and the x-axis. The points of a d-dimensional
+    # integral have d + 1 coordinates, the last one is y and the rectangle is a hyper-rectangle.
+    def count_points_vectorized(self, number_of_simulations, seed_sequence=None, chunk_index=0, start_index=0):
+        dimension = self.get_dimension()
+        points = self.create_points(dimension + 1, seed_sequence, start_index)
+        trace = None
+        if self.is_trace_enabled():
+            trace = self.get_trace_writer().open_chunk(chunk_index)
+        # Rectangle that surrounds the area between the graph of a function and the x-axis.
+        y_lower, y_upper = self.get_envelope()
+        batch_size = max(1, min(self.batch_size, number_of_simulations))
+        above_axis = 0
+        below_axis = 0
+        remaining = number_of_simulations
+        while remaining > 0:
+            current_batch_size = min(batch_size, remaining)
+            u = points.random(dimension + 1, current_batch_size)
+            x_rand = self.scale_points(u[:dimension])
+            y_rand = y_lower + (y_upper - y_lower) * u[dimension]
+            if trace is not None:
+                trace.write(x_rand, y_rand)
+            f = np.asarray(self.integrand(x_rand))
+            if dimension > 1 and (f.max() > y_upper or f.min() < y_lower):
+                raise ValueError("the integrand leaves its probed envelope [{}, {}] with values from {} to {}, "
+                                 "the hit-or-miss estimate would be biased, use the mean_value "
+                                 "estimator".format(y_lower, y_upper, f.min(), f.max()))
+            above_axis += int(np.count_nonzero((0 <= y_rand) & (y_rand < f)))
+            below_axis += int(np.count_nonzero((f < y_rand) & (y_rand < 0)))
+            remaining -= current_batch_size
+        if trace is not None:
+            trace.close()
+        rectangle_area = self.calculate_volume() * (y_upper - y_lower)
+        return above_axis, below_axis, rectangle_area
+
+    # Every point of the hit-or-miss estimator is a sample which is the rectangle area for a point between
+    # the x-axis and the graph above the axis, minus the rectangle area below the axis and 0 otherwise.
+    # The running statistics of the samples follow from the counts.
+    def simulation_hit_or_miss_statistics(self, number_of_simulations, seed_sequence=None, chunk_index=0,
+                                          start_index=0):
+        if self.vectorized_flag == True or self.sampler != "pseudo_random" or self.get_dimension() > 1:
+            above_axis, below_axis, rectangle_area = self.count_points_vectorized(number_of_simulations,
+                                                                                  seed_sequence, chunk_index,
+                                                                                  start_index)
+        else:
+            above_axis, below_axis, rectangle_area = self.count_points(number_of_simulations, seed_sequence,
+                                                                       chunk_index)
+        statistics = create_constant_statistics(above_axis, rectangle_area)
+        statistics.merge(create_constant_statistics(below_axis, -rectangle_area))
+        statistics.merge(create_constant_statistics(number_of_simulations - above_axis - below_axis, 0))
+        return statistics
+
+    # Source of the uniform points of a chunk, see PseudoRandomPoints and QuasiRandomPoints. The quasi-random
+    # points of a chunk are the block of the scrambled sequence of its replicate starting at point start_index,
+    # the seed sequence of the chunk is the seed sequence of its replicate and selects the scramble.
+    def create_points(self, dimension, seed_sequence=None, start_index=0):
+        if self.sampler == "pseudo_random":
+            return PseudoRandomPoints(seed_sequence)
+        return QuasiRandomPoints(self.sampler, dimension, seed_sequence, start_index)
+
+    # The estimators below return the samples of batch_size points taken from points.
+    # Every sample is an unbiased estimate of the integral, so the integral is the mean of the samples.
+    # The stratified and the importance sampling estimators draw their own pseudo-random points.
+
+    # Mean value (crude Monte Carlo) estimator: V * f(x) for x uniform on the domain of volume V.
+    def sample_mean_value(self, points, batch_size):
+        x = self.scale_points(points.random(self.get_dimension(), batch_size))
+        return self.calculate_volume() * np.asarray(self.integrand(x), dtype=float)
+
+    # Antithetic variates: every sample is the mean of the mean value estimates at x and at its mirror
+    # image a + b - x, so a sample takes two points. For a monotone f the two estimates are negatively
+    # correlated and their errors partly cancel.
+    def sample_antithetic(self, points, batch_size):
+        u = points.random(self.get_dimension(), (batch_size + 1) // 2)
+        f = np.asarray(self.integrand(self.scale_points(u)), dtype=float)
+        f += np.asarray(self.integrand(self.scale_points(u, mirror=True)), dtype=float)
+        return self.calculate_volume() / 2 * f
+
+    # Stratified sampling: [a, b] is split into number_of_strata slices of equal width and every sample
+    # takes one uniform point in each slice, so a sample takes number_of_strata points.
+    # The points of a batch left over after its whole samples are not drawn, see check_number_of_simulations.
+    # A d-dimensional domain is sliced along the first coordinate, the other coordinates are uniform.
+    def sample_stratified(self, points, batch_size):
+        dimension = self.get_dimension()
+        number_of_samples = batch_size // self.number_of_strata
+        if number_of_samples == 0:
+            return np.empty(0)
+        u = points.random_generator.random((number_of_samples, self.number_of_strata))
+        u += np.arange(self.number_of_strata)
+        if dimension == 1:
+            lower_bound, upper_bound = self.get_domain()
+            width = upper_bound[0] - lower_bound[0]
+            x = lower_bound[0] + width / self.number_of_strata * u
+        else:
+            other_coordinates = points.random_generator.random(
+                (dimension - 1, number_of_samples * self.number_of_strata))
+            x = self.scale_points(np.vstack([u.reshape(1, -1) / self.number_of_strata, other_coordinates]))
+        f = np.asarray(self.integrand(x), dtype=float).reshape(number_of_samples, self.number_of_strata)
+        return self.calculate_volume() * f.mean(axis=1)
+
+    # Control variates: V * (f(x) - c * (g(x) - mean of g)), where the integral of g is known,
+    # see get_control_coefficient.
+    def sample_control_variate(self, points, batch_size):
+        volume = self.calculate_volume()
+        x = self.scale_points(points.random(self.get_dimension(), batch_size))
+        g = np.asarray(self.calculate_control_function(x), dtype=float) - self.get_control_integral() / volume
+        return volume * (np.asarray(self.integrand(x), dtype=float) - self.get_control_coefficient() * g)
+
+    # Importance sampling: f(x) / p(x) for x drawn from the importance density p, points outside the domain
+    # count 0. The density must be positive wherever f is not 0 on the domain. The density of a d-dimensional
+    # integral draws (number of points, d) arrays, like a frozen scipy.stats.multivariate_normal.
+    def sample_importance(self, points, batch_size):
+        x = np.asarray(self.importance_density.rvs(size=batch_size, random_state=points.random_generator),
+                       dtype=float)
+        lower_bound, upper_bound = self.get_domain()
+        if lower_bound.shape[0] == 1:
+            inside = (lower_bound[0] <= x) & (x <= upper_bound[0])
+        else:
+            x = x.reshape(batch_size, lower_bound.shape[0])
+            inside = np.all((lower_bound <= x) & (x <= upper_bound), axis=1)
+        samples = np.zeros(batch_size)
+        samples[inside] = (np.asarray(self.integrand(x[inside]), dtype=float)
+                           / np.asarray(self.importance_density.pdf(x[inside]), dtype=float))
+        return samples
+
+    def select_estimator(self):
+        if self.estimator == "mean_value":
+            return self.sample_mean_value
+        if self.estimator == "antithetic":
+            return self.sample_antithetic
+        if self.estimator == "stratified":
+            return self.sample_stratified
+        if self.estimator == "control_variate":
+            return self.sample_control_variate
+        if self.estimator == "importance":
+            return self.sample_importance
+        raise ValueError("unknown estimator {}, expected one of {}".format(self.estimator, self.ESTIMATORS))
+
+    # Kernel of the estimators. Returns the RunningStatistics of the samples of one chunk of points.
+    # The estimators other than hit-or-miss evaluate the integrand on NumPy arrays of batch_size points.
+    def simulation_integration_statistics(self, number_of_simulations, seed_sequence=None, chunk_index=0,
+                                          start_index=0):
+        if self.estimator == "hit_or_miss":
+            return self.simulation_hit_or_miss_statistics(number_of_simulations, seed_sequence, chunk_index,
+                                                          start_index)
+        sample = self.select_estimator()
+        points = self.create_points(self.get_dimension(), seed_sequence, start_index)
+        batch_size = max(1, min(self.batch_size, number_of_simulations))
+        statistics = RunningStatistics()
+        remaining = number_of_simulations
+        while remaining > 0:
+            current_batch_size = min(batch_size, remaining)
+            statistics.update_batch(sample(points, current_batch_size))
+            remaining -= current_batch_size
+        return statistics
+
+    # A sample of the stratified estimator takes number_of_strata points and a simulation never draws more
+    # points than requested, so the simulation, its chunks and its batches need at least number_of_strata points.
+    def check_number_of_simulations(self, number_of_simulations):
+        if self.estimator != "stratified":
+            return
+        smallest_size = min(number_of_simulations, self.chunk_size, self.batch_size)
+        if smallest_size < self.number_of_strata:
+            raise ValueError("the stratified estimator takes samples of {} points, got {} points".format(
+                self.number_of_strata, smallest_size))
+
+    def split_into_chunks(self, number_of_simulations):
+        self.check_number_of_simulations(number_of_simulations)
+        random_streams = RandomStreams(self.seed)
+        self.last_seed = random_streams.seed
+        if self.sampler != "pseudo_random":
+            chunks, self.replicate_of_chunk = split_into_replicates(random_streams, number_of_simulations,
+                                                                    self.number_of_replicates, self.chunk_size,
+                                                                    self.sampler)
+            return chunks
+        return [(number_of_simulations_per_chunk, seed_sequence, chunk_index)
+                for chunk_index, (number_of_simulations_per_chunk, seed_sequence)
+                in enumerate(random_streams.split(number_of_simulations, self.chunk_size))]
+
+    # The worker processes get only the attributes the kernels need, once per worker when the pool starts,
+    # the tasks carry only the number of simulations and the random streams, see WorkerContext.
+    def create_worker_context(self):
+        return create_worker_context(self, self.WORKER_CONTEXT_ATTRIBUTES)
+
+    # Starts the worker pool of a parallel simulation. Calling it before mcs_integration_parallel keeps
+    # the pool startup out of the measured execution time.
+    def start_worker_pool(self):
+        self.parallel_flag = True
+        # Probe the envelope or the control coefficient once in the parent process, the workers receive it
+        # with the context.
+        self.prepare_estimator()
+        with self.instrumentation.phase("pool_startup"):
+            worker_pool = get_worker_pool(self.number_of_processes, self.create_worker_context(),
+                                          self.backend)
+        return worker_pool
+
+    # Runs the chunks in the worker pool, or one after another in this process without a worker pool.
+    def run_chunks(self, simulation, chunks, worker_pool=None):
+        chunk_scheduler = ChunkScheduler(worker_pool)
+        results = chunk_scheduler.run(simulation, chunks)
+        self.chunk_times = chunk_scheduler.chunk_times
+        self.instrumentation.record_chunks(chunk_scheduler)
+        return results
+
+    # Runs rounds of points until the half width of the confidence interval of the integral is at most
+    # tolerance, see AdaptivePrecision. Returns (integral, standard error, number of points).
+    def run_adaptive(self, tolerance, confidence_level, maximum_number_of_simulations, worker_pool=None):
+        if self.sampler != "pseudo_random":
+            raise ValueError("the adaptive precision mode needs independent points, use the pseudo_random sampler")
+        self.check_number_of_simulations(min(self.round_size, maximum_number_of_simulations))
+        if worker_pool is None:
+            simulation = self.simulation_integration_statistics
+        else:
+            simulation = worker_context_method("simulation_integration_statistics")
+        random_streams = RandomStreams(self.seed)
+        self.last_seed = random_streams.seed
+        self.adaptive_precision = AdaptivePrecision(tolerance, confidence_level, self.round_size,
+                                                    maximum_number_of_simulations)
+        chunk_times = []
+
+        def run_round(chunks):
+            results = self.run_chunks(simulation, chunks, worker_pool)
+            # The chunks of a round are numbered after the chunks of the earlier rounds.
+            offset = len(chunk_times)
+            chunk_times.extend((offset + index, number_of_simulations, execution_time, process_id)
+                               for index, number_of_simulations, execution_time, process_id in self.chunk_times)
+            return results
+
+        self.start_trace()
+        statistics = self.adaptive_precision.run(run_round, random_streams, self.chunk_size)
+        self.finish_trace()
+        self.chunk_times = chunk_times
+        self.statistics = statistics
+        self.number_of_simulations = self.adaptive_precision.number_of_simulations
+        return statistics.mean, self.calculate_standard_error(), self.number_of_simulations
+
+    # The chunks can have different sizes, so the statistics of the chunks are merged (see RunningStatistics)
+    # in the order of the chunks, the integral is the mean of all samples.
+    # The points of a quasi-random simulation are not independent, so its error is estimated from the integrals
+    # of the independently scrambled replicates.
+    def aggregate_statistics(self, list_of_statistics_per_chunk, number_of_simulations):
+        self.statistics = RunningStatistics()
+        for statistics_per_chunk in list_of_statistics_per_chunk:
+            self.statistics.merge(statistics_per_chunk)
+        self.number_of_simulations = number_of_simulations
+        self.replicate_estimates = []
+        if self.sampler != "pseudo_random":
+            statistics_per_replicate = {}
+            for replicate, statistics_per_chunk in zip(self.replicate_of_chunk, list_of_statistics_per_chunk):
+                statistics_per_replicate.setdefault(replicate, RunningStatistics()).merge(statistics_per_chunk)
+            self.replicate_estimates = [statistics_per_replicate[replicate].mean
+                                        for replicate in sorted(statistics_per_replicate)]
+        return self.statistics.mean
+
+    # Standard error of the integral of the last simulation.
+    def calculate_standard_error(self):
+        if self.sampler != "pseudo_random" and self.replicate_estimates:
+            return calculate_replicate_standard_error(self.replicate_estimates)
+        return self.statistics.calculate_standard_error()
+
+    # Number of points a sample of the estimator takes, see the estimators.
+    def get_points_per_sample(self):
+        if self.estimator == "antithetic":
+            return 2
+        if self.estimator == "stratified":
+            return self.number_of_strata
+        return 1
+
+    # Variance of the estimator per point: the squared standard error times the number of points drawn. A sample
+    # of the antithetic or the stratified estimator takes several points, so the variance per sample would not
+    # be comparable, the variance per point is. For hit-or-miss and mean value it is the variance of one sample.
+    # An estimator with half the variance per point needs half the points for the same error.
+    # The antithetic estimator rounds the points of a batch up to whole pairs and the stratified estimator down
+    # to whole samples, so the number of points drawn follows from the number of samples, not from the requested
+    # points.
+    def calculate_variance_per_point(self):
+        return self.calculate_standard_error() ** 2 * self.statistics.count * self.get_points_per_sample()
+
+    # Runs every estimator in ESTIMATORS (importance sampling only with an importance density, only the
+    # QUASI_RANDOM_ESTIMATORS with a quasi-random sampler) serially with
+    # number_of_simulations points and returns a list of
+    # (estimator, integral, standard error, variance per point, execution time in seconds).
+    def compare_estimators(self, number_of_simulations):
+        estimator = self.estimator
+        comparison = []
+        for self.estimator in self.ESTIMATORS:
+            if self.estimator == "importance" and self.importance_density is None:
+                continue
+            if self.sampler != "pseudo_random" and self.estimator not in self.QUASI_RANDOM_ESTIMATORS:
+                continue
+            integral, execution_time = self.mcs_integration_serial(number_of_simulations)
+            comparison.append((self.estimator, integral, self.calculate_standard_error(),
+                               self.calculate_variance_per_point(), execution_time))
+        self.estimator = estimator
+        return comparison
 
     @calculate_execution_time
+    @cached_simulation
     def mcs_integration_serial(self, number_of_simulations):
         self.parallel_flag = False
-        integral = self.simulation_integration(number_of_simulations)
+        self.prepare_estimator()
+        self.start_trace()
+        list_of_statistics_per_chunk = self.run_chunks(self.simulation_integration_statistics,
+                                                       self.split_into_chunks(number_of_simulations))
+        self.finish_trace()
+        with self.instrumentation.phase("reduction"):
+            integral = self.aggregate_statistics(list_of_statistics_per_chunk, number_of_simulations)
         return integral
 
     @calculate_execution_time
+    @cached_simulation
     def mcs_integration_parallel(self, number_of_simulations):
-        self.parallel_flag = True
-        pool = Pool(processes=self.number_of_processes)
-        number_of_simulations_per_process = int(number_of_simulations / self.number_of_processes)
-        simulations_per_process = []
-        # Append the same value multiple times to a list
-        # To add v, n times, to l:
-        # l += n * [v]
-        # Mapping a function with multiple arguments to a multiprocessing pool will distribute
-        # the input data across processes to be run with the referenced function.
-        simulations_per_process += self.number_of_processes * [number_of_simulations_per_process]
-        # list of partial result per process
-        list_of_integral_per_process = pool.map(self.simulation_integration, simulations_per_process)
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        self.start_trace()
+        # Every chunk of points is a task with its own random stream, the chunks do not depend on the
+        # number of processes, so the result of a seeded simulation does not depend on it either.
+        chunks = self.split_into_chunks(number_of_simulations)
+        # list of partial result per chunk
+        simulation = worker_context_method("simulation_integration_statistics")
+        list_of_statistics_per_chunk = self.run_chunks(simulation, chunks, worker_pool)
+        self.finish_trace()
         # cumulative result, aggregating partial results
-        integral_per_processes = sum(list_of_integral_per_process)
-        integral = integral_per_processes / self.number_of_processes
+        with self.instrumentation.phase("reduction"):
+            integral = self.aggregate_statistics(list_of_statistics_per_chunk, number_of_simulations)
         return integral
 
+    # Adaptive precision versions of mcs_integration_serial and mcs_integration_parallel. Instead of a number
+    # of simulations they take the tolerance of the estimate: the simulation stops as soon as the confidence
+    # interval of the integral at confidence_level is integral +- tolerance or tighter, or after
+    # maximum_number_of_simulations points. Return (integral, standard error, number of points).
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_integration_adaptive_serial(self, tolerance, confidence_level=0.95,
+                                        maximum_number_of_simulations=100000000):
+        self.parallel_flag = False
+        self.prepare_estimator()
+        return self.run_adaptive(tolerance, confidence_level, maximum_number_of_simulations)
+
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_integration_adaptive_parallel(self, tolerance, confidence_level=0.95,
+                                          maximum_number_of_simulations=100000000):
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        return self.run_adaptive(tolerance, confidence_level, maximum_number_of_simulations, worker_pool)
+
 
 if __name__ == "__main__":
 
@@ -159,6 +727,7 @@ if __name__ == "__main__":
     print("Integral(n = {}, p = {}) = {}".format(number_of_simulations_serial, number_of_processes_serial,
                                                  serial_integration))
     print("Execution time (duration): {} seconds".format(serial_execution_time))
+    monte_carlo_simulation_integration_serial.export_trace_file()
 
     number_of_simulations_parallel = 1000
     number_of_processes_parallel = 4
@@ -170,3 +739,30 @@ if __name__ == "__main__":
     print("Integral(n = {}, p = {}) = {}".format(number_of_simulations_parallel, number_of_processes_parallel,
                                                  parallel_integration))
     print("Execution time (duration): {} seconds".format(parallel_execution_time))
+    monte_carlo_simulation_integration_parallel.export_trace_file()
+
+    number_of_simulations_comparison = 100000
+    monte_carlo_simulation_integration_serial.experiment_flag = True
+    print("Comparison of the estimators of the integral")
+    for estimator, integral, standard_error, variance_per_point, execution_time in \
+            monte_carlo_simulation_integration_serial.compare_estimators(number_of_simulations_comparison):
+        print("{}: Integral(n = {}) = {}, standard error = {}, variance per point = {}, execution time = {} seconds"
+              .format(estimator, number_of_simulations_comparison, integral, standard_error, variance_per_point,
+                      execution_time))
+
+    number_of_simulations_multidimensional = 1000000
+    dimension = 10
+    monte_carlo_simulation_integration_multidimensional = MonteCarloSimulationIntegration(number_of_processes_parallel)
+    monte_carlo_simulation_integration_multidimensional.experiment_flag = True
+    monte_carlo_simulation_integration_multidimensional.integrand = sum_of_squares_function
+    monte_carlo_simulation_integration_multidimensional.LOWER_BOUND = [0] * dimension
+    monte_carlo_simulation_integration_multidimensional.UPPER_BOUND = [1] * dimension
+    monte_carlo_simulation_integration_multidimensional.estimator = "mean_value"
+    print("Integral of x_1^2 + ... + x_{0}^2 over [0, 1]^{0} (exact value {1})".format(dimension, dimension / 3))
+    multidimensional_integration, multidimensional_execution_time = \
+        monte_carlo_simulation_integration_multidimensional.mcs_integration_parallel(
+            number_of_simulations_multidimensional)
+    print("Integral(n = {}, p = {}, d = {}) = {}, standard error = {}".format(
+        number_of_simulations_multidimensional, number_of_processes_parallel, dimension, multidimensional_integration,
+        monte_carlo_simulation_integration_multidimensional.calculate_standard_error()))
+    print("Execution time (duration): {} seconds".format(multidimensional_execution_time))
@@ -1,81 +1,355 @@
-import random
-import time
-from multiprocessing import Pool
+import os
+import sys
 
+import numpy as np
 
-def calculate_execution_time(function):
-    def calculate_duration(*args, **kwargs):
-        start_time = time.time()
-        executing_function = function(*args, **kwargs)
-        end_time = time.time()
-        execution_time = round(end_time - start_time, 7)
-        return executing_function, execution_time
-    return calculate_duration
+# The modules shared by all simulations are in the MonteCarloSimulationCommon directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MonteCarloSimulationCommon"))
+from AdaptivePrecision import AdaptivePrecision
+from ChunkScheduler import ChunkScheduler
+from Instrumentation import Instrumentation, calculate_execution_time
+from QuasiRandom import QuasiRandomPoints, calculate_replicate_standard_error, split_into_replicates
+from RandomStreams import RandomStreams, create_generator, create_python_random
+from ResultCache import cached_simulation, result_cache
+from RunningStatistics import create_constant_statistics
+from TraceWriter import TraceWriter
+from WorkerContext import create_worker_context, worker_context_method
+from WorkerPool import get_worker_pool
 
 
 class MonteCarloSimulationPi:
+    # Attributes the kernels need in the worker processes, see create_worker_context.
+    WORKER_CONTEXT_ATTRIBUTES = ("experiment_flag", "vectorized_flag", "batch_size", "parallel_flag", "trace_directory",
+                                 "sampler", "chunk_size")
+    # Samplers of the points, see QuasiRandom.
+    SAMPLERS = ("pseudo_random", "sobol", "halton")
+    # Attributes the result of a simulation depends on and attributes a cached result restores, see cached_simulation.
+    CACHE_ATTRIBUTES = ("vectorized_flag", "batch_size", "sampler", "chunk_size", "number_of_replicates", "round_size",
+                        "seed")
+    CACHE_STATE_ATTRIBUTES = ("last_seed", "statistics", "replicate_of_chunk", "replicate_estimates",
+                              "adaptive_precision")
+
     def __init__(self, number_of_processes):
         self.number_of_processes = number_of_processes
         self.parallel_flag = False
+        # Time spent starting the worker pool in the last parallel simulation, 0 when the pool was warm.
+        self.pool_startup_time = 0.0
         self.experiment_flag = False
+        self.vectorized_flag = False
+        # Number of points the vectorized kernel draws at once, memory use does not depend on
+        # the number of simulations.
+        self.batch_size = 1000000
+        # Master seed of the random streams, None takes a fresh seed from the operating system.
+        self.seed = None
+        # Seed of the last simulation, setting seed to it repeats the simulation.
+        self.last_seed = None
+        # Number of points per chunk. Every chunk is one task with its own random stream, see ChunkScheduler
+        # and RandomStreams.
+        self.chunk_size = 10000
+        # (chunk index, number of points, execution time in seconds, process id) per chunk of the last simulation
+        self.chunk_times = []
+        # Phase timings, throughput and peak memory of the last simulation, see Instrumentation.
+        self.instrumentation = Instrumentation()
+        # Execution backend of mcs_pi_parallel ("process", "thread" or "serial"), see WorkerPool.
+        self.backend = "process"
+        # Directory of the binary traces of the sampled points, see TraceWriter.
+        self.trace_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                            "Execution Results", "Pi")
+        # Merged trace of the last simulation.
+        self.trace_path = None
+        # Sampler of the points, one of SAMPLERS. The quasi-random samplers (scrambled Sobol and Halton sequences)
+        # split the points into number_of_replicates independently scrambled replicates, see QuasiRandom.
+        self.sampler = "pseudo_random"
+        self.number_of_replicates = 16
+        # Replicate of every chunk and pi of every replicate of the last quasi-random simulation.
+        self.replicate_of_chunk = []
+        self.replicate_estimates = []
+        # RunningStatistics of the samples 4 * [x^2 + y^2 < 1] of the last simulation.
+        self.statistics = None
+        # Number of points per round of the adaptive precision mode, see AdaptivePrecision.
+        self.round_size = 100000
+        # AdaptivePrecision of the last adaptive simulation, it keeps the statistics and the number of rounds.
+        self.adaptive_precision = None
+        # Whether repeated runs with the same configuration and seed are read from the result cache, see
+        # cached_simulation, whether the last run was, and the cache.
+        self.cache_flag = False
+        self.cached_flag = False
+        self.result_cache = result_cache
+
+    # A run which writes a trace is not cached, the trace would not be written again.
+    def is_result_cacheable(self):
+        return self.cache_flag == True and self.seed is not None and self.experiment_flag == True
+
+    def get_trace_writer(self):
+        if self.parallel_flag == False:
+            return TraceWriter(self.trace_directory, "PythonPiSerial")
+        return TraceWriter(self.trace_directory, "PythonPiParallel")
+
+    # Every worker writes its own shard of the trace, shards of an earlier simulation are removed.
+    def start_trace(self):
+        if self.experiment_flag == False:
+            with self.instrumentation.phase("io"):
+                self.get_trace_writer().remove_shards()
+
+    def finish_trace(self):
+        if self.experiment_flag == False:
+            with self.instrumentation.phase("io"):
+                self.trace_path = self.get_trace_writer().merge()
+
+    # Exports the merged trace as the text file the Pharo visualization reads.
+    # Pharo for Data Visualization. Circle of radius 250 centered at the point(250, 250).
+    # To create a Rectangle in Pharo you must provide the top left and the bottom right points.
+    def export_trace_file(self):
+        trace_writer = self.get_trace_writer()
+        return trace_writer.export_text(os.path.join(self.trace_directory, trace_writer.name + ".txt"),
+                                        scale=500, fmt="%d")
 
     # mcs stands for Monte Carlo Simulation
     # pi=3.1415926535
-    def simulation_pi(self, number_of_simulations):
+    def simulation_pi(self, number_of_simulations, seed_sequence=None, chunk_index=0):
+        random_generator = create_python_random(seed_sequence)
         if self.experiment_flag == True:
             inside = 0
             for _ in range(number_of_simulations):
-                x = random.random()
-                y = random.random()
+                x = random_generator.random()
+                y = random_generator.random()
                 # The unit circle is the circle of radius 1 centered at the origin(0, 0)
                 # in the Cartesia coordinate system in the Euclidean plane.
                 if x * x + y * y < 1:
                     inside = inside + 1
             return inside
         else:
-            if self.parallel_flag == False:
-                # r before string converts normal string to raw string
-                path = r"C:\Users\Dule\Desktop\NAPREDNE TEHNIKE PROGRAMIRANJA\PROJEKAT\NTP" \
-                       r"\Execution Results\Pi\PythonPiSerial.txt"
-            else:
-                # r before string converts normal string to raw string
-                path = r"C:\Users\Dule\Desktop\NAPREDNE TEHNIKE PROGRAMIRANJA\PROJEKAT\NTP" \
-                       r"\Execution Results\Pi\PythonPiParallel.txt"
-            out_file = open(path, "w")
+            trace = self.get_trace_writer().open_chunk(chunk_index)
             inside = 0
-            for _ in range(number_of_simulations):
-                x = random.random()
-                y = random.random()
-                # Pharo for Data Visualization. Circle of radius 250 centered at the point(250, 250).
-                # To create a Rectangle in Pharo you must provide the top left and the bottom right points.
-                out_file.write(str(int(x * 500)) + ' ' + str(int(y * 500)) + '\n')
-                # The unit circle is the circle of radius 1 centered at the origin(0, 0)
-                # in the Cartesia coordinate system in the Euclidean plane.
-                if x * x + y * y < 1:
-                    inside = inside + 1
-            out_file.close()
+            remaining = number_of_simulations
+            while remaining > 0:
+                # The points of a batch are collected in lists and written to the trace at once.
+                current_batch_size = min(max(1, self.batch_size), remaining)
+                x_values = []
+                y_values = []
+                for _ in range(current_batch_size):
+                    x = random_generator.random()
+                    y = random_generator.random()
+                    x_values.append(x)
+                    y_values.append(y)
+                    # The unit circle is the circle of radius 1 centered at the origin(0, 0)
+                    # in the Cartesia coordinate system in the Euclidean plane.
+                    if x * x + y * y < 1:
+                        inside = inside + 1
+                # Pharo for Data Visualization, see export_trace_file.
+                trace.write(x_values, y_values)
+                remaining -= current_batch_size
+            trace.close()
             return inside
 
+    # Vectorized version of simulation_pi. The points are drawn and tested in batches of batch_size points,
+    # the same two buffers are reused for every batch.
+    def simulation_pi_vectorized(self, number_of_simulations, seed_sequence=None, chunk_index=0):
+        random_generator = create_generator(seed_sequence)
+        trace = None
+        if self.experiment_flag == False:
+            trace = self.get_trace_writer().open_chunk(chunk_index)
+        batch_size = max(1, min(self.batch_size, number_of_simulations))
+        x_buffer = np.empty(batch_size)
+        y_buffer = np.empty(batch_size)
+        inside = 0
+        remaining = number_of_simulations
+        while remaining > 0:
+            current_batch_size = min(batch_size, remaining)
+            x = x_buffer[:current_batch_size]
+            y = y_buffer[:current_batch_size]
+            random_generator.random(out=x)
+            random_generator.random(out=y)
+            if trace is not None:
+                # Pharo for Data Visualization, see export_trace_file.
+                trace.write(x, y)
+            # The unit circle is the circle of radius 1 centered at the origin(0, 0)
+            # in the Cartesia coordinate system in the Euclidean plane.
+            x *= x
+            y *= y
+            x += y
+            inside += int(np.count_nonzero(x < 1))
+            remaining -= current_batch_size
+        if trace is not None:
+            trace.close()
+        return inside
+
+    # Kernel of the adaptive precision mode. Every point is a sample of the estimator 4 * [x^2 + y^2 < 1],
+    # whose mean is pi. The samples are 4 or 0, so their running statistics follow from the number of
+    # points inside the circle.
+    def simulation_pi_statistics(self, number_of_simulations, seed_sequence=None, chunk_index=0):
+        inside = self.select_simulation_pi()(number_of_simulations, seed_sequence, chunk_index)
+        return create_constant_statistics(inside, 4).merge(
+            create_constant_statistics(number_of_simulations - inside, 0))
+
+    # Quasi-Monte Carlo version of simulation_pi_vectorized. The points of a chunk are the block of the
+    # scrambled sequence of its replicate starting at point start_index, the seed sequence of the chunk is the
+    # seed sequence of its replicate and selects the scramble, see split_into_replicates.
+    def simulation_pi_quasi_random(self, number_of_simulations, seed_sequence=None, chunk_index=0, start_index=0):
+        points = QuasiRandomPoints(self.sampler, 2, seed_sequence, start_index)
+        trace = None
+        if self.experiment_flag == False:
+            trace = self.get_trace_writer().open_chunk(chunk_index)
+        batch_size = max(1, min(self.batch_size, number_of_simulations))
+        inside = 0
+        remaining = number_of_simulations
+        while remaining > 0:
+            current_batch_size = min(batch_size, remaining)
+            x, y = points.random(2, current_batch_size)
+            if trace is not None:
+                # Pharo for Data Visualization, see export_trace_file.
+                trace.write(x, y)
+            # The unit circle is the circle of radius 1 centered at the origin(0, 0)
+            # in the Cartesia coordinate system in the Euclidean plane.
+            inside += int(np.count_nonzero(x * x + y * y < 1))
+            remaining -= current_batch_size
+        if trace is not None:
+            trace.close()
+        return inside
+
+    def select_simulation_pi(self):
+        if self.sampler not in self.SAMPLERS:
+            raise ValueError("unknown sampler {}, expected one of {}".format(self.sampler, self.SAMPLERS))
+        if self.sampler != "pseudo_random":
+            return self.simulation_pi_quasi_random
+        if self.vectorized_flag == True:
+            return self.simulation_pi_vectorized
+        return self.simulation_pi
+
+    def split_into_chunks(self, number_of_simulations):
+        random_streams = RandomStreams(self.seed)
+        self.last_seed = random_streams.seed
+        if self.sampler != "pseudo_random":
+            chunks, self.replicate_of_chunk = split_into_replicates(random_streams, number_of_simulations,
+                                                                    self.number_of_replicates, self.chunk_size,
+                                                                    self.sampler)
+            return chunks
+        return [(number_of_simulations_per_chunk, seed_sequence, chunk_index)
+                for chunk_index, (number_of_simulations_per_chunk, seed_sequence)
+                in enumerate(random_streams.split(number_of_simulations, self.chunk_size))]
+
+    # pi is 4 * (points inside the circle) / (number of points). The points of a quasi-random simulation are not
+    # independent, so its error is estimated from pi of the independently scrambled replicates.
+    def aggregate_inside(self, chunks, inside_sum, number_of_simulations):
+        inside = sum(inside_sum)
+        self.statistics = create_constant_statistics(inside, 4).merge(
+            create_constant_statistics(number_of_simulations - inside, 0))
+        self.replicate_estimates = []
+        if self.sampler != "pseudo_random":
+            number_of_replicates = max(self.replicate_of_chunk) + 1 if self.replicate_of_chunk else 0
+            inside_per_replicate = np.zeros(number_of_replicates)
+            points_per_replicate = np.zeros(number_of_replicates)
+            for chunk, replicate, inside_per_chunk in zip(chunks, self.replicate_of_chunk, inside_sum):
+                inside_per_replicate[replicate] += inside_per_chunk
+                points_per_replicate[replicate] += chunk[0]
+            self.replicate_estimates = list(4 * inside_per_replicate / points_per_replicate)
+        pi = 4 * inside / number_of_simulations
+        return pi
+
+    # Standard error of pi of the last simulation.
+    def calculate_standard_error(self):
+        if self.sampler != "pseudo_random":
+            return calculate_replicate_standard_error(self.replicate_estimates)
+        return self.statistics.calculate_standard_error()
+
+    # The worker processes get only the attributes the kernels need, once per worker when the pool starts,
+    # the tasks carry only the number of simulations and the random streams, see WorkerContext.
+    def create_worker_context(self):
+        return create_worker_context(self, self.WORKER_CONTEXT_ATTRIBUTES)
+
+    # Starts the worker pool of a parallel simulation. Calling it before mcs_pi_parallel keeps
+    # the pool startup out of the measured execution time.
+    def start_worker_pool(self):
+        self.parallel_flag = True
+        with self.instrumentation.phase("pool_startup"):
+            worker_pool = get_worker_pool(self.number_of_processes, self.create_worker_context(),
+                                          self.backend)
+        return worker_pool
+
+    # Runs the chunks in the worker pool, or one after another in this process without a worker pool.
+    def run_chunks(self, simulation, chunks, worker_pool=None):
+        chunk_scheduler = ChunkScheduler(worker_pool)
+        results = chunk_scheduler.run(simulation, chunks)
+        self.chunk_times = chunk_scheduler.chunk_times
+        self.instrumentation.record_chunks(chunk_scheduler)
+        return results
+
+    # Runs rounds of points until the half width of the confidence interval of pi is at most tolerance,
+    # see AdaptivePrecision. Returns (pi, standard error, number of points).
+    def run_adaptive(self, tolerance, confidence_level, maximum_number_of_simulations, worker_pool=None):
+        if self.sampler != "pseudo_random":
+            raise ValueError("the adaptive precision mode needs independent points, use the pseudo_random sampler")
+        if worker_pool is None:
+            simulation = self.simulation_pi_statistics
+        else:
+            simulation = worker_context_method("simulation_pi_statistics")
+        random_streams = RandomStreams(self.seed)
+        self.last_seed = random_streams.seed
+        self.adaptive_precision = AdaptivePrecision(tolerance, confidence_level, self.round_size,
+                                                    maximum_number_of_simulations)
+        chunk_times = []
+
+        def run_round(chunks):
+            results = self.run_chunks(simulation, chunks, worker_pool)
+            # The chunks of a round are numbered after the chunks of the earlier rounds.
+            offset = len(chunk_times)
+            chunk_times.extend((offset + index, number_of_simulations, execution_time, process_id)
+                               for index, number_of_simulations, execution_time, process_id in self.chunk_times)
+            return results
+
+        self.start_trace()
+        statistics = self.adaptive_precision.run(run_round, random_streams, self.chunk_size)
+        self.finish_trace()
+        self.chunk_times = chunk_times
+        self.statistics = statistics
+        self.replicate_estimates = []
+        return statistics.mean, self.calculate_standard_error(), self.adaptive_precision.number_of_simulations
+
     @calculate_execution_time
+    @cached_simulation
     def mcs_pi_serial(self, number_of_simulations):
         self.parallel_flag = False
-        pi = 4 * self.simulation_pi(number_of_simulations) / number_of_simulations
+        self.start_trace()
+        chunks = self.split_into_chunks(number_of_simulations)
+        inside_sum = self.run_chunks(self.select_simulation_pi(), chunks)
+        self.finish_trace()
+        with self.instrumentation.phase("reduction"):
+            pi = self.aggregate_inside(chunks, inside_sum, number_of_simulations)
         return pi
 
     @calculate_execution_time
+    @cached_simulation
     def mcs_pi_parallel(self, number_of_simulations):
-        self.parallel_flag = True
-        pool = Pool(processes=self.number_of_processes)
-        number_of_simulations_per_process = int(number_of_simulations / self.number_of_processes)
-        simulations_per_process = []
-        # Append the same value multiple times to a list
-        # To add v, n times, to l:
-        # l += n * [v]
-        simulations_per_process += self.number_of_processes * [number_of_simulations_per_process]
-        inside_sum = pool.map(self.simulation_pi, simulations_per_process)
-        pi = 4 * sum(inside_sum) / number_of_simulations
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        self.start_trace()
+        # Every chunk of points is a task with its own random stream, the chunks do not depend on the
+        # number of processes, so the result of a seeded simulation does not depend on it either.
+        chunks = self.split_into_chunks(number_of_simulations)
+        simulation = worker_context_method(self.select_simulation_pi().__name__)
+        inside_sum = self.run_chunks(simulation, chunks, worker_pool)
+        self.finish_trace()
+        with self.instrumentation.phase("reduction"):
+            pi = self.aggregate_inside(chunks, inside_sum, number_of_simulations)
         return pi
 
+    # Adaptive precision versions of mcs_pi_serial and mcs_pi_parallel. Instead of a number of simulations
+    # they take the tolerance of the estimate: the simulation stops as soon as the confidence interval of pi at
+    # confidence_level is pi +- tolerance or tighter, or after maximum_number_of_simulations points.
+    # Return (pi, standard error, number of points).
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_pi_adaptive_serial(self, tolerance, confidence_level=0.95, maximum_number_of_simulations=100000000):
+        self.parallel_flag = False
+        return self.run_adaptive(tolerance, confidence_level, maximum_number_of_simulations)
+
+    @calculate_execution_time
+    @cached_simulation
+    def mcs_pi_adaptive_parallel(self, tolerance, confidence_level=0.95, maximum_number_of_simulations=100000000):
+        worker_pool = self.start_worker_pool()
+        self.pool_startup_time = worker_pool.startup_time
+        return self.run_adaptive(tolerance, confidence_level, maximum_number_of_simulations, worker_pool)
+
 
 if __name__ == "__main__":
     number_of_simulations_serial = 1000
@@ -86,6 +360,7 @@ if __name__ == "__main__":
     serial_pi, serial_execution_time = monte_carlo_simulation_pi_serial.mcs_pi_serial(number_of_simulations_serial)
     print("Pi(n = {}, p = {}) = {}".format(number_of_simulations_serial,number_of_processes_serial,serial_pi))
     print("Execution time (duration): {} seconds".format(serial_execution_time))
+    monte_carlo_simulation_pi_serial.export_trace_file()
 
     number_of_simulations_parallel = 1000
     number_of_processes_parallel = 4
@@ -95,4 +370,4 @@ if __name__ == "__main__":
     parallel_pi, parallel_execution_time = monte_carlo_simulation_pi_parallel.mcs_pi_parallel(number_of_simulations_parallel)
     print("Pi(n = {}, p = {}) = {}".format(number_of_simulations_parallel,number_of_processes_parallel,parallel_pi))
     print("Execution time (duration): {} seconds".format(parallel_execution_time))
-
+    monte_carlo_simulation_pi_parallel.export_trace_file()
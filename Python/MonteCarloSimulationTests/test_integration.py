@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# The simulations and the modules shared by all simulations are in the directories next to this one.
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory_name in ("MonteCarloSimulationCommon", "MonteCarloSimulationIntegration"):
+    sys.path.append(os.path.join(PYTHON_DIRECTORY, directory_name))
+from MonteCarloSimulationIntegration import MonteCarloSimulationIntegration, sum_of_squares_function
+
+
+def create_simulation(dimension=1):
+    monte_carlo_simulation_integration = MonteCarloSimulationIntegration(1)
+    monte_carlo_simulation_integration.experiment_flag = True
+    monte_carlo_simulation_integration.vectorized_flag = True
+    monte_carlo_simulation_integration.seed = 1
+    if dimension > 1:
+        monte_carlo_simulation_integration.LOWER_BOUND = [0] * dimension
+        monte_carlo_simulation_integration.UPPER_BOUND = [1] * dimension
+        monte_carlo_simulation_integration.integrand = sum_of_squares_function
+    return monte_carlo_simulation_integration
+
+
+class IntegrationTest(unittest.TestCase):
+    def test_multidimensional_hit_or_miss(self):
+        monte_carlo_simulation_integration = create_simulation(3)
+        integral, _ = monte_carlo_simulation_integration.mcs_integration_serial(200000)
+        self.assertAlmostEqual(integral, 1, delta=5 * monte_carlo_simulation_integration.calculate_standard_error())
+
+    # A probe that missed the maximum of a d-dimensional integrand must not bias the estimate silently.
+    def test_hit_or_miss_raises_outside_the_probed_envelope(self):
+        monte_carlo_simulation_integration = create_simulation(2)
+        # The maximum of x_1^2 + x_2^2 on the unit square is 2, the probe reports 1.
+        monte_carlo_simulation_integration.get_bounds()
+        monte_carlo_simulation_integration.bounds = (monte_carlo_simulation_integration.bounds[0], (0.0, 1.0))
+        with self.assertRaises(ValueError):
+            monte_carlo_simulation_integration.mcs_integration_serial(100000)
+
+    # A stratified sample takes number_of_strata points, a simulation must not draw more points than requested.
+    def test_stratified_draws_at_most_the_requested_points(self):
+        points = []
+
+        def counting_integrand(x):
+            points.append(np.size(x))
+            return 2 * x
+
+        monte_carlo_simulation_integration = create_simulation()
+        monte_carlo_simulation_integration.estimator = "stratified"
+        monte_carlo_simulation_integration.number_of_strata = 100
+        monte_carlo_simulation_integration.integrand = counting_integrand
+        with self.assertRaises(ValueError):
+            monte_carlo_simulation_integration.mcs_integration_serial(50)
+        self.assertEqual(points, [])
+        integral, _ = monte_carlo_simulation_integration.mcs_integration_serial(250)
+        self.assertEqual(sum(points), 200)
+        self.assertEqual(monte_carlo_simulation_integration.statistics.count
+                         * monte_carlo_simulation_integration.get_points_per_sample(), 200)
+        self.assertAlmostEqual(integral, 3, delta=5 * monte_carlo_simulation_integration.calculate_standard_error())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# The simulations and the modules shared by all simulations are in the directories next to this one.
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory_name in ("MonteCarloSimulationCommon", "MonteCarloSimulationPi", "MonteCarloSimulationIntegration"):
+    sys.path.append(os.path.join(PYTHON_DIRECTORY, directory_name))
+from MonteCarloSimulationIntegration import MonteCarloSimulationIntegration
+from MonteCarloSimulationPi import MonteCarloSimulationPi
+from ResultCache import ResultCache
+
+
+def fail_to_run_chunks(*arguments):
+    raise AssertionError("the kernel ran although the result is cached")
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.result_cache = ResultCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_simulation(self, simulation_class, seed=1):
+        simulation = simulation_class(1)
+        simulation.experiment_flag = True
+        simulation.vectorized_flag = True
+        simulation.seed = seed
+        simulation.cache_flag = True
+        simulation.result_cache = self.result_cache
+        return simulation
+
+    def test_repeated_pi_simulation_is_read_from_the_cache(self):
+        monte_carlo_simulation_pi = self.create_simulation(MonteCarloSimulationPi)
+        pi, _ = monte_carlo_simulation_pi.mcs_pi_serial(100000)
+        standard_error = monte_carlo_simulation_pi.calculate_standard_error()
+        self.assertFalse(monte_carlo_simulation_pi.cached_flag)
+
+        monte_carlo_simulation_pi = self.create_simulation(MonteCarloSimulationPi)
+        monte_carlo_simulation_pi.run_chunks = fail_to_run_chunks
+        cached_pi, _ = monte_carlo_simulation_pi.mcs_pi_serial(100000)
+        self.assertTrue(monte_carlo_simulation_pi.cached_flag)
+        self.assertEqual(cached_pi, pi)
+        self.assertEqual(monte_carlo_simulation_pi.calculate_standard_error(), standard_error)
+
+    def test_repeated_integration_is_read_from_the_cache(self):
+        monte_carlo_simulation_integration = self.create_simulation(MonteCarloSimulationIntegration)
+        monte_carlo_simulation_integration.estimator = "mean_value"
+        integral, _ = monte_carlo_simulation_integration.mcs_integration_serial(100000)
+        monte_carlo_simulation_integration.run_chunks = fail_to_run_chunks
+        cached_integral, _ = monte_carlo_simulation_integration.mcs_integration_serial(100000)
+        self.assertTrue(monte_carlo_simulation_integration.cached_flag)
+        self.assertEqual(cached_integral, integral)
+        # A different configuration runs again.
+        del monte_carlo_simulation_integration.run_chunks
+        monte_carlo_simulation_integration.estimator = "antithetic"
+        monte_carlo_simulation_integration.mcs_integration_serial(100000)
+        self.assertFalse(monte_carlo_simulation_integration.cached_flag)
+
+    def test_runs_without_a_seed_are_not_cached(self):
+        monte_carlo_simulation_pi = self.create_simulation(MonteCarloSimulationPi, seed=None)
+        monte_carlo_simulation_pi.mcs_pi_serial(10000)
+        monte_carlo_simulation_pi.mcs_pi_serial(10000)
+        self.assertFalse(monte_carlo_simulation_pi.cached_flag)
+        self.assertEqual(self.result_cache.list_results(), [])
+
+    def test_lambda_integrand_is_not_cached(self):
+        monte_carlo_simulation_integration = self.create_simulation(MonteCarloSimulationIntegration)
+        monte_carlo_simulation_integration.integrand = lambda x: 2 * x
+        integral, _ = monte_carlo_simulation_integration.mcs_integration_serial(10000)
+        self.assertAlmostEqual(integral, 3, delta=0.2)
+        self.assertEqual(self.result_cache.list_results(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import glob
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+# The simulations and the modules shared by all simulations are in the directories next to this one.
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory_name in ("MonteCarloSimulationCommon", "MonteCarloSimulationFinance"):
+    sys.path.append(os.path.join(PYTHON_DIRECTORY, directory_name))
+from MonteCarloSimulationFinance import MonteCarloSimulationFinance
+from SharedArray import SHARED_MEMORY_DIRECTORY
+from WorkerPool import shutdown_worker_pool
+
+
+# A finance simulation whose workers fail, it must be a module level class so the worker processes find it.
+class FailingMonteCarloSimulationFinance(MonteCarloSimulationFinance):
+    def simulation_finance_shared(self, number_of_simulations, prediction_window_size, seed_sequence,
+                                  shared_predictions, offset):
+        raise RuntimeError("worker failed")
+
+
+def create_simulation(simulation_class, backend):
+    monte_carlo_simulation_finance = simulation_class("2000-01-01", "2009-12-31", "TEST", 2)
+    random_generator = np.random.default_rng(0)
+    monte_carlo_simulation_finance.time_series = pd.Series(
+        70 * np.exp(np.cumsum(random_generator.normal(0.0005, 0.02, 1000))),
+        index=pd.date_range("2000-01-01", periods=1000))
+    monte_carlo_simulation_finance.calculate_periodic_daily_return()
+    monte_carlo_simulation_finance.vectorized_flag = True
+    monte_carlo_simulation_finance.backend = backend
+    monte_carlo_simulation_finance.seed = 1
+    return monte_carlo_simulation_finance
+
+
+def list_shared_array_files():
+    directory = SHARED_MEMORY_DIRECTORY if os.path.isdir(SHARED_MEMORY_DIRECTORY) else tempfile.gettempdir()
+    return set(glob.glob(os.path.join(directory, "MonteCarloSimulation*.dat")))
+
+
+class SharedArrayTest(unittest.TestCase):
+    def tearDown(self):
+        shutdown_worker_pool()
+
+    def test_shared_array_is_released_when_a_worker_raises(self):
+        for backend in ("process", "thread"):
+            files = list_shared_array_files()
+            monte_carlo_simulation_finance = create_simulation(FailingMonteCarloSimulationFinance, backend)
+            with self.assertRaises(RuntimeError):
+                monte_carlo_simulation_finance.mcs_finance_parallel(20000, 10)
+            self.assertEqual(list_shared_array_files(), files)
+
+    def test_shared_array_is_released_after_a_simulation(self):
+        files = list_shared_array_files()
+        monte_carlo_simulation_finance = create_simulation(MonteCarloSimulationFinance, "process")
+        predictions, _ = monte_carlo_simulation_finance.mcs_finance_parallel(20000, 10)
+        self.assertEqual(predictions.shape, (20000, 11))
+        self.assertEqual(list_shared_array_files(), files)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+
+# The simulations and the modules shared by all simulations are in the directories next to this one.
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory_name in ("MonteCarloSimulationCommon", "MonteCarloSimulationIntegration"):
+    sys.path.append(os.path.join(PYTHON_DIRECTORY, directory_name))
+from MonteCarloSimulationIntegration import MonteCarloSimulationIntegration
+from WorkerPool import get_worker_pool, shutdown_worker_pool
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def tearDown(self):
+        shutdown_worker_pool()
+
+    def run_lambda_integrand(self, backend):
+        monte_carlo_simulation_integration = MonteCarloSimulationIntegration(2)
+        monte_carlo_simulation_integration.experiment_flag = True
+        monte_carlo_simulation_integration.vectorized_flag = True
+        monte_carlo_simulation_integration.backend = backend
+        monte_carlo_simulation_integration.seed = 1
+        monte_carlo_simulation_integration.integrand = lambda x: 2 * x
+        return monte_carlo_simulation_integration
+
+    # The in-process backends share the context with this process, so an integrand that can not be pickled works.
+    def test_lambda_integrand_on_the_thread_backend(self):
+        monte_carlo_simulation_integration = self.run_lambda_integrand("thread")
+        integral, _ = monte_carlo_simulation_integration.mcs_integration_parallel(100000)
+        self.assertAlmostEqual(integral, 3, delta=0.1)
+        # The second simulation gets a new context with the same attributes, the pool stays warm.
+        monte_carlo_simulation_integration.mcs_integration_parallel(100000)
+        self.assertEqual(monte_carlo_simulation_integration.pool_startup_time, 0.0)
+
+    def test_lambda_integrand_on_the_serial_backend(self):
+        monte_carlo_simulation_integration = self.run_lambda_integrand("serial")
+        integral, _ = monte_carlo_simulation_integration.mcs_integration_parallel(100000)
+        self.assertAlmostEqual(integral, 3, delta=0.1)
+
+    def test_different_context_restarts_the_thread_pool(self):
+        first_context = MonteCarloSimulationIntegration(2).create_worker_context()
+        second_context = MonteCarloSimulationIntegration(2).create_worker_context()
+        second_context.integrand = lambda x: x
+        worker_pool = get_worker_pool(2, first_context, "thread")
+        thread_pool = worker_pool.pool
+        self.assertIs(get_worker_pool(2, first_context, "thread").pool, thread_pool)
+        self.assertIsNot(get_worker_pool(2, second_context, "thread").pool, thread_pool)
+
+
+if __name__ == "__main__":
+    unittest.main()